@@ -1,5 +1,5 @@
 from django.contrib import admin
-from marketplace.models import  Cart, CartItem, Message, Reaction, Review, WishList
+from marketplace.models import  Cart, CartItem, ChatRoom, Message, Reaction, ReactionCount, Review, WishList
 from django.contrib.admin.exceptions import NotRegistered
 from django.utils.html import format_html
 
@@ -34,26 +34,45 @@ admin.site.register(Cart, CartAdmin)
 admin.site.register(CartItem, CartItemAdmin)
 
 
-class ReactionAdmin(admin.ModelAdmin):
+class ReadOnlyReactionMixin:
+    """Reactions change through marketplace.reactions, which keeps the counters"""
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ReactionAdmin(ReadOnlyReactionMixin, admin.ModelAdmin):
     list_display = ['reaction_type', 'user', 'message_sent', 'created_at']
     list_filter = ['reaction_type', 'created_at']
-    search_fields = ['user__username', 'message__content']
+    search_fields = ['user__username', 'message_sent__content']
     ordering = ['-created_at']
 
 
-class ReactionInline(admin.TabularInline):
-    model = Reaction
-    fk_name = 'message_sent'
-    extra = 1
+class ReactionCountInline(ReadOnlyReactionMixin, admin.TabularInline):
+    model = ReactionCount
+    fields = ['reaction_type', 'count']
 
 
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('user', 'content', 'timestamp', 'read')
+    list_display = ('user', 'room', 'content', 'timestamp', 'read')
     search_fields = ['user__username', 'content']
-    list_filter = ['user__username', 'timestamp', 'read']
-    inlines = [ReactionInline]
+    list_filter = ['room', 'user__username', 'timestamp', 'read']
+    list_select_related = ['user', 'room']
+    inlines = [ReactionCountInline]
+
+
+class ChatRoomAdmin(admin.ModelAdmin):
+    list_display = ('name', 'created_at')
+    search_fields = ['name']
 
 admin.site.register(Message, MessageAdmin)
+admin.site.register(ChatRoom, ChatRoomAdmin)
 admin.site.register(Reaction, ReactionAdmin)
 try:
     admin.site.unregister(Review)
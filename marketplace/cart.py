@@ -0,0 +1,99 @@
+"""
+Cart summaries and batch updates.
+
+The summary (item count, distinct products and total price) is summed in
+the database with one query and cached per user. Views that change a
+cart must call ``invalidate_cart_summary``.
+
+``add_items`` puts many products in a cart at once: stock is checked
+with one ``id__in`` query and every line is upserted by a single
+``bulk_create(update_conflicts=True)`` on the cart/product constraint.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from products.models import Product
+from .models import Cart, CartItem, cart_totals
+
+CART_SUMMARY_CACHE_TTL = getattr(settings, 'CART_SUMMARY_CACHE_TTL', 300)
+
+
+def get_cart_summary_cache_key(user_id):
+    return f'marketplace:cart_summary:{user_id}'
+
+
+def get_cart_summary(user):
+    """Totals of ``user``'s cart; an empty summary when there is no cart"""
+    cache_key = get_cart_summary_cache_key(user.pk)
+    summary = cache.get(cache_key)
+    if summary is None:
+        totals = cart_totals(
+            CartItem.objects.filter(cart__user=user),
+            distinct_items=Count('id')
+        )
+        summary = {
+            'total_items': totals['total_items'],
+            'distinct_items': totals['distinct_items'],
+            'total_price': f"{totals['total_price']:.2f}",
+        }
+        cache.set(cache_key, summary, CART_SUMMARY_CACHE_TTL)
+    return summary
+
+
+def invalidate_cart_summary(user):
+    cache.delete(get_cart_summary_cache_key(user.pk))
+
+
+def add_items(user, items, replace=False):
+    """
+    Add ``(product_id, quantity)`` pairs to ``user``'s cart, creating it if
+    needed. Quantities are added to what is already in the cart, or with
+    ``replace`` overwrite it (e.g. merging a guest cart after login).
+
+    Lines that would exceed stock or name unknown products are skipped and
+    reported. Returns ``(cart, lines, errors)``.
+    """
+    quantities = Counter()
+    for product_id, quantity in items:
+        quantities[product_id] += quantity
+
+    with transaction.atomic():
+        # Locking the cart row serialises batches for the same user
+        cart, _ = Cart.objects.select_for_update().get_or_create(user=user)
+        stock = dict(Product.objects.filter(
+            id__in=quantities, is_active=True
+        ).order_by().values_list('id', 'stock'))
+        current = dict(CartItem.objects.filter(
+            cart=cart, product_id__in=quantities
+        ).values_list('product_id', 'quantity'))
+
+        lines, errors = [], []
+        for product_id, quantity in sorted(quantities.items()):
+            if product_id not in stock:
+                errors.append({'product_id': product_id, 'error': 'Product not found'})
+                continue
+            new_quantity = quantity if replace else current.get(product_id, 0) + quantity
+            if new_quantity > stock[product_id]:
+                errors.append({
+                    'product_id': product_id,
+                    'error': f'Not enough stock. Available: {stock[product_id]}, Requested: {new_quantity}',
+                    'available_stock': stock[product_id],
+                    'current_quantity': current.get(product_id, 0),
+                })
+                continue
+            lines.append(CartItem(cart=cart, product_id=product_id, quantity=new_quantity))
+
+        if lines:
+            CartItem.objects.bulk_create(
+                lines,
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity']
+            )
+
+    if lines:
+        invalidate_cart_summary(user)
+    return cart, lines, errors
@@ -0,0 +1,225 @@
+"""
+Chat persistence for ``ChatConsumer``.
+
+Messages are broadcast as soon as they arrive and queued in a per-process
+``MessageWriteBuffer``. The buffer writes its queue with one
+``bulk_create`` once ``CHAT_WRITE_BATCH_SIZE`` messages are waiting or
+``CHAT_WRITE_INTERVAL_MS`` after the first of them, off the event loop, so
+a busy room costs one round trip per batch instead of one per message.
+The buffer is also flushed when a chat socket disconnects and, through
+``ChatWriteBufferMiddleware``, on ASGI lifespan shutdown. Timestamps are
+taken on arrival, so history order does not depend on when a batch lands.
+
+History is read newest first in pages keyed on ``(timestamp, id)``, the
+``message_room_timestamp_idx`` order, so backfilling with a ``before``
+cursor is an index range scan however deep it goes. Read state is one
+``ChatReadMarker`` per user and room. Rooms are created with their members
+through the chat API, which is also where members add others; only members
+can connect to a room or read its history.
+"""
+import asyncio
+import base64
+import json
+from datetime import datetime
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import ChatReadMarker, ChatRoom, Message
+import logging
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 50)
+WRITE_INTERVAL_MS = getattr(settings, 'CHAT_WRITE_INTERVAL_MS', 250)
+WRITE_MAX_PENDING = getattr(settings, 'CHAT_WRITE_MAX_PENDING', 5000)
+HISTORY_PAGE_SIZE = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 50)
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def room_group(room_name):
+    """Channel layer group of the sockets connected to a room"""
+    return f'chat_{room_name}'
+
+
+@database_sync_to_async
+def member_room_id(name, user_id):
+    """Id of the room called ``name`` if ``user_id`` is a member, else ``None``"""
+    return ChatRoom.objects.filter(name=name, members=user_id).values_list('id', flat=True).first()
+
+
+def create_room(name, creator, members=()):
+    """Create the room called ``name`` with ``creator`` and ``members`` in it"""
+    room = ChatRoom.objects.create(name=name)
+    room.members.add(creator, *members)
+    return room
+
+
+class MessageWriteBuffer:
+    """
+    Queue of unsaved ``Message`` instances for one event loop. ``add`` never
+    waits on the database unless it fills a batch. A batch that fails to
+    save goes back on the queue and is retried after the interval; past
+    ``max_pending`` queued messages the oldest are dropped.
+    """
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, interval_ms=WRITE_INTERVAL_MS, max_pending=WRITE_MAX_PENDING):
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.max_pending = max_pending
+        self._pending = []
+        self._timer = None
+        self._retrying = False
+        # Keeps scheduled flushes referenced until they finish
+        self._flushes = set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def add(self, message):
+        self._pending.append(message)
+        # While retrying, wait for the scheduled flush instead of hitting the
+        # database once per message
+        if len(self._pending) >= self.batch_size and not self._retrying:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._flush_later)
+
+    def _flush_later(self):
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        """Write everything queued; returns the number of messages saved"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            await database_sync_to_async(Message.objects.bulk_create)(batch)
+        except Exception as e:
+            logger.error(f"Could not save {len(batch)} chat messages, will retry: {str(e)}")
+            self._requeue(batch)
+            return 0
+        self._retrying = False
+        return len(batch)
+
+    def _requeue(self, batch):
+        self._pending[:0] = batch
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            logger.error(f"Dropped {overflow} unsaved chat messages")
+            del self._pending[:overflow]
+        self._retrying = True
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._flush_later)
+
+
+_buffer = None
+
+
+def get_write_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = MessageWriteBuffer()
+    return _buffer
+
+
+async def flush_write_buffer():
+    """Save whatever this process still has queued"""
+    if _buffer is None:
+        return 0
+    return await _buffer.flush()
+
+
+class ChatWriteBufferMiddleware:
+    """
+    ASGI middleware that answers lifespan events and flushes the write
+    buffer on shutdown, so queued messages survive a graceful restart.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await flush_write_buffer()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def reset_write_buffer():
+    global _buffer
+    _buffer = None
+
+
+def encode_cursor(message):
+    position = [message.timestamp.isoformat(), message.id]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """``(timestamp, id)`` from a cursor; raises ``ValueError`` if malformed"""
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def history(room, before=None, limit=HISTORY_PAGE_SIZE):
+    """
+    The ``limit`` messages of ``room`` just before the ``before`` cursor
+    (the newest ones without it), oldest first, and the cursor for the page
+    before them or ``None`` at the start of the room.
+    """
+    messages = Message.objects.filter(room=room).select_related('user').order_by('-timestamp', '-id')
+    if before:
+        timestamp, message_id = decode_cursor(before)
+        messages = messages.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id)
+        )
+    page = list(messages[:limit + 1])
+    older = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit][::-1], older
+
+
+def last_read_at(room, user):
+    return ChatReadMarker.objects.filter(room=room, user=user).values_list('last_read_at', flat=True).first()
+
+
+def mark_read(room, user, read_at=None):
+    """
+    Move ``user``'s read marker in ``room`` forward to ``read_at`` (now by
+    default). Markers never move back.
+    """
+    read_at = read_at or timezone.now()
+    moved = ChatReadMarker.objects.filter(
+        room=room, user=user, last_read_at__lt=read_at
+    ).update(last_read_at=read_at, updated_at=timezone.now())
+    if not moved:
+        ChatReadMarker.objects.bulk_create(
+            [ChatReadMarker(room=room, user=user, last_read_at=read_at)],
+            ignore_conflicts=True
+        )
+    return read_at
+
+
+def unread_count(room, user):
+    """Messages from others after ``user``'s read marker"""
+    messages = Message.objects.filter(room=room).exclude(user=user)
+    read_at = last_read_at(room, user)
+    if read_at is not None:
+        messages = messages.filter(timestamp__gt=read_at)
+    return messages.count()
@@ -1,7 +1,16 @@
+import asyncio
 import json
+from collections import deque
+
 from channels.generic.websocket import AsyncWebsocketConsumer, WebsocketConsumer
 from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from django.utils import timezone
+from . import presence
+from .chat import flush_write_buffer, get_write_buffer, member_room_id, room_group
+from .models import Message
+from products.feed import category_group, product_group
 
 class BaseConsumer(AsyncWebsocketConsumer):
     """Base consumer with common functionality"""
@@ -32,11 +41,21 @@ class BaseConsumer(AsyncWebsocketConsumer):
 
 
 class MarketplaceConsumer(BaseConsumer):
-    """Consumer for marketplace real-time updates"""
-    
+    """
+    Consumer for marketplace real-time updates.
+
+    Clients follow the product change feed (``products.feed``) by sending
+    ``{"type": "subscribe", "products": [...], "categories": [...]}`` with
+    the ids they render, and ``unsubscribe`` with the same shape.
+    """
+    max_subscriptions = 200
+
     async def connect(self):
         await super().connect()
         self.room_group_name = 'marketplace_updates'
+        self.subscriptions = set()
+        # A product change reaches both its product and category groups
+        self.recent_events = deque(maxlen=100)
         
         # Join room group
         await self.channel_layer.group_add(
@@ -50,6 +69,9 @@ class MarketplaceConsumer(BaseConsumer):
             self.room_group_name,
             self.channel_name
         )
+        for group in self.subscriptions:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.subscriptions.clear()
     
     async def process_message(self, data):
         message_type = data.get('type')
@@ -65,6 +87,44 @@ class MarketplaceConsumer(BaseConsumer):
                     'data': data.get('data')
                 }
             )
+        elif message_type in ('subscribe', 'unsubscribe'):
+            await self.update_subscriptions(data, subscribe=message_type == 'subscribe')
+
+    def requested_groups(self, data):
+        try:
+            return (
+                {product_group(int(product_id)) for product_id in data.get('products') or []} |
+                {category_group(int(category_id)) for category_id in data.get('categories') or []}
+            )
+        except (TypeError, ValueError):
+            return None
+
+    async def update_subscriptions(self, data, subscribe=True):
+        groups = self.requested_groups(data)
+        if groups is None:
+            await self.send_json({'error': 'products and categories must be lists of ids'})
+            return
+
+        if subscribe:
+            groups -= self.subscriptions
+            if len(self.subscriptions) + len(groups) > self.max_subscriptions:
+                await self.send_json({
+                    'error': f'At most {self.max_subscriptions} products and categories can be followed'
+                })
+                return
+            for group in groups:
+                await self.channel_layer.group_add(group, self.channel_name)
+            self.subscriptions |= groups
+        else:
+            groups &= self.subscriptions
+            for group in groups:
+                await self.channel_layer.group_discard(group, self.channel_name)
+            self.subscriptions -= groups
+
+        await self.send_json({
+            'type': 'subscribed' if subscribe else 'unsubscribed',
+            'subscriptions': sorted(self.subscriptions),
+        })
     
     async def product_update(self, event):
         """Send product update to WebSocket"""
@@ -75,34 +135,113 @@ class MarketplaceConsumer(BaseConsumer):
             'data': event['data']
         })
 
+    async def product_changed(self, event):
+        """Send a product change feed event to WebSocket, once"""
+        if event['event_id'] in self.recent_events:
+            return
+        self.recent_events.append(event['event_id'])
+        await self.send_json({
+            'type': 'product_changed',
+            'product_id': event['product_id'],
+            'category_id': event['category_id'],
+            'changes': event['changes']
+        })
+
 
 class ChatConsumer(BaseConsumer):
-    """Consumer for chat functionality"""
+    """
+    Consumer for chat functionality. Only members of an existing room can
+    connect; everyone else is refused during the handshake. Messages are
+    stored through the shared write buffer in ``marketplace.chat``.
+
+    Members are tracked in the room's presence set
+    (``marketplace.presence``) while connected: the socket is sent the
+    users already online, and the room hears when a user comes online or
+    goes offline. ``{"type": "typing"}`` is broadcast to the rest of the
+    room at most once per ``CHAT_TYPING_INTERVAL_MS`` per user, and
+    reaction count deltas from ``marketplace.reactions`` are relayed as
+    they commit.
+    """
+    heartbeat_interval = presence.PRESENCE_HEARTBEAT
     
     async def connect(self):
-        await super().connect()
+        self.user = self.scope.get('user', AnonymousUser())
         self.room_name = self.scope['url_route']['kwargs']['room_name']
-        self.room_group_name = f'chat_{self.room_name}'
+        self.room_group_name = room_group(self.room_name)
+        self.heartbeat_task = None
+        self.room_id = None
+        if self.user.is_authenticated:
+            self.room_id = await member_room_id(self.room_name, self.user.pk)
+        if self.room_id is None:
+            # Only members may join; rooms are created and joined over the chat API
+            await self.close()
+            return
+        await self.accept()
         
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+
+        if await presence.join(self.room_name, self.user.pk, self.channel_name):
+            await self.send_presence(online=True)
+        self.heartbeat_task = asyncio.ensure_future(self.keep_alive())
+        await self.send_json({
+            'type': 'presence_state',
+            'users': await self.online_usernames(await presence.online_user_ids(self.room_name)),
+        })
     
     async def disconnect(self, close_code):
+        if self.room_id is None:
+            return
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+        if await presence.leave(self.room_name, self.user.pk, self.channel_name):
+            await self.send_presence(online=False)
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        # Don't leave this socket's last messages waiting on a timer
+        await flush_write_buffer()
+
+    async def keep_alive(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await presence.heartbeat(self.room_name, self.user.pk, self.channel_name)
+
+    async def send_presence(self, online):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'chat_presence',
+                'username': self.user.username,
+                'online': online
+            }
+        )
+
+    @database_sync_to_async
+    def online_usernames(self, user_ids):
+        if not user_ids:
+            return []
+        return sorted(get_user_model().objects.filter(pk__in=user_ids).values_list('username', flat=True))
     
     async def process_message(self, data):
+        if data.get('type') == 'typing':
+            await self.typing()
+            return
+
         message = data.get('message', '')
+        if not message.strip():
+            return
+        timestamp = timezone.now()
         
         # Store message in database
         if self.user.is_authenticated:
-            await self.save_message(message)
+            await self.save_message(message, timestamp)
         
         # Send message to room group
         await self.channel_layer.group_send(
@@ -110,7 +249,8 @@ class ChatConsumer(BaseConsumer):
             {
                 'type': 'chat_message',
                 'message': message,
-                'username': self.user.username if self.user.is_authenticated else 'Anonymous'
+                'username': self.user.username if self.user.is_authenticated else 'Anonymous',
+                'timestamp': timestamp.isoformat()
             }
         )
     
@@ -119,11 +259,50 @@ class ChatConsumer(BaseConsumer):
         await self.send_json({
             'type': 'chat_message',
             'message': event['message'],
-            'username': event['username']
+            'username': event['username'],
+            'timestamp': event.get('timestamp')
         })
-    
-    @database_sync_to_async
-    def save_message(self, message):
-        # TODO: Implement message saving logic here
-        pass
 
+    async def typing(self):
+        if not self.user.is_authenticated:
+            return
+        if await presence.claim_typing(self.room_name, self.user.pk):
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {
+                    'type': 'chat_typing',
+                    'username': self.user.username,
+                    'sender': self.channel_name
+                }
+            )
+
+    async def chat_typing(self, event):
+        """Send a typing notice to WebSocket, except back to the typist"""
+        if event['sender'] != self.channel_name:
+            await self.send_json({'type': 'typing', 'username': event['username']})
+
+    async def chat_reaction(self, event):
+        """Send reaction count changes to WebSocket"""
+        await self.send_json({
+            'type': 'reaction',
+            'message_id': event['message_id'],
+            'username': event['username'],
+            'deltas': event['deltas']
+        })
+
+    async def chat_presence(self, event):
+        """Send a presence change to WebSocket"""
+        await self.send_json({
+            'type': 'presence',
+            'username': event['username'],
+            'online': event['online']
+        })
+    
+    async def save_message(self, message, timestamp):
+        """Queue the message for the next batched write"""
+        await get_write_buffer().add(Message(
+            user_id=self.user.pk,
+            room_id=self.room_id,
+            content=message,
+            timestamp=timestamp
+        ))
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:29
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    """Fold repeated lines for the same product into the oldest one."""
+    CartItem = apps.get_model('marketplace', 'CartItem')
+
+    duplicates = CartItem.objects.values('cart_id', 'product_id').annotate(
+        lines=Count('id'), keep=Min('id'), total=Sum('quantity')
+    ).filter(lines__gt=1)
+
+    for duplicate in duplicates:
+        lines = CartItem.objects.filter(cart_id=duplicate['cart_id'], product_id=duplicate['product_id'])
+        lines.filter(id=duplicate['keep']).update(quantity=duplicate['total'])
+        lines.exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0004_auto_20250602_0422'),
+        ('products', '0010_stockreservation_cart'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def keep_latest_reactions(apps, schema_editor):
+    """Keep only each user's newest reaction to a message."""
+    Reaction = apps.get_model('marketplace', 'Reaction')
+
+    duplicates = Reaction.objects.filter(message_sent__isnull=False).values(
+        'message_sent_id', 'user_id'
+    ).annotate(reactions=Count('id'), keep=Max('id')).filter(reactions__gt=1)
+
+    for duplicate in duplicates:
+        Reaction.objects.filter(
+            message_sent_id=duplicate['message_sent_id'], user_id=duplicate['user_id']
+        ).exclude(id=duplicate['keep']).delete()
+
+
+def count_reactions(apps, schema_editor):
+    Reaction = apps.get_model('marketplace', 'Reaction')
+    ReactionCount = apps.get_model('marketplace', 'ReactionCount')
+
+    totals = Reaction.objects.filter(message_sent__isnull=False).values(
+        'message_sent_id', 'reaction_type'
+    ).annotate(total=Count('id')).order_by()
+    ReactionCount.objects.bulk_create([
+        ReactionCount(
+            message_id=total['message_sent_id'], reaction_type=total['reaction_type'], count=total['total']
+        )
+        for total in totals
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0007_chatreadmarker'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_latest_reactions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reaction',
+            constraint=models.UniqueConstraint(fields=('message_sent', 'user'), name='unique_message_reaction'),
+        ),
+        migrations.CreateModel(
+            name='ReactionCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reaction_type', models.CharField(choices=[('like', 'Like'), ('love', 'Love'), ('haha', 'Haha'), ('wow', 'Wow'), ('sad', 'Sad'), ('angry', 'Angry')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reaction_counts', to='marketplace.message')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('message', 'reaction_type'), name='unique_reaction_count')],
+            },
+        ),
+        migrations.RunPython(count_reactions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def add_existing_members(apps, schema_editor):
+    """Everyone who has posted in or read a room joined it"""
+    ChatRoom = apps.get_model('marketplace', 'ChatRoom')
+    Message = apps.get_model('marketplace', 'Message')
+    ChatReadMarker = apps.get_model('marketplace', 'ChatReadMarker')
+    Membership = ChatRoom.members.through
+
+    pairs = set(Message.objects.filter(room__isnull=False).values_list('room_id', 'user_id').distinct())
+    pairs.update(ChatReadMarker.objects.values_list('room_id', 'user_id'))
+    Membership.objects.bulk_create([
+        Membership(chatroom_id=room_id, customuser_id=user_id) for room_id, user_id in pairs
+    ], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0008_reactioncount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='chat_rooms', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(add_existing_members, migrations.RunPython.noop),
+    ]
@@ -1,19 +1,49 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 # from django.urls import reverse
 from django.contrib.auth.models import Group
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser, Permission
 from products.models import Product
 from django.conf import settings
+from django.utils import timezone
+
+class ChatRoom(models.Model):
+    name = models.SlugField(max_length=100, unique=True)
+    # Users who have joined the room; only they can read its history
+    members = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chat_rooms', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """
+        Returns a string representation of the chat room, which is its name.
+
+        Returns:
+            str: The string representation of the chat room.
+        """
+        return self.name
+
 
 class Message(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    room = models.ForeignKey(
+        ChatRoom, on_delete=models.CASCADE, related_name='messages', null=True, blank=True
+    )
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the message arrives, not when a buffered batch is written
+    timestamp = models.DateTimeField(default=timezone.now)
     read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'timestamp'], name='message_room_timestamp_idx'),
+        ]
+
     def __str__(self):
         """
         Returns a string representation of the message, which is
@@ -26,6 +56,31 @@ class Message(models.Model):
         return f'{self.user.username} - {self.timestamp}'
 
 
+class ChatReadMarker(models.Model):
+    """
+    How far a user has read in a room: every message up to ``last_read_at``
+    counts as read, so opening a room is one write however much is unread.
+    """
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_markers')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    last_read_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'user'], name='unique_chat_read_marker'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the read marker.
+
+        Returns:
+            str: The string representation of the read marker.
+        """
+        return f'{self.user.username} read {self.room.name} up to {self.last_read_at}'
+
+
 class Reaction(models.Model):
     REACTION_CHOICES = [
         ('like', 'Like'),
@@ -41,6 +96,12 @@ class Reaction(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # One reaction per user and message; reacting again changes its type
+            models.UniqueConstraint(fields=['message_sent', 'user'], name='unique_message_reaction'),
+        ]
+
     def __str__(self):
         """
         Returns a string representation of the reaction, which includes
@@ -52,6 +113,30 @@ class Reaction(models.Model):
         return f'{self.reaction_type} by {self.user.username}'
 
 
+class ReactionCount(models.Model):
+    """
+    Running total of one reaction type on one message, kept by
+    ``marketplace.reactions`` so message lists never count ``Reaction`` rows.
+    """
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='reaction_counts')
+    reaction_type = models.CharField(max_length=10, choices=Reaction.REACTION_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['message', 'reaction_type'], name='unique_reaction_count'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the counter.
+
+        Returns:
+            str: The string representation of the counter.
+        """
+        return f'{self.reaction_type} x{self.count} on message {self.message_id}'
+
+
 class Review(models.Model):
     product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='reviews')
     reviewer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -85,6 +170,9 @@ class Review(models.Model):
 #     return slug
 
 
+MONEY_FIELD = DecimalField(max_digits=10, decimal_places=2)
+
+
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     items = models.ManyToManyField(Product, through='marketplace.CartItem')
@@ -102,21 +190,49 @@ class Cart(models.Model):
         """
         return f"Cart for {self.user.username}"
 
+    def totals(self):
+        """
+        Returns the cart's item count and price, summed in the database
+        with a single query and remembered on this instance.
+
+        Returns:
+            dict: ``total_items`` and ``total_price``.
+        """
+        if not hasattr(self, '_totals'):
+            self._totals = cart_totals(CartItem.objects.filter(cart=self))
+        return self._totals
+
     def total_items(self):
         """
         Returns the total number of items in the cart.
 
         """
-        return sum(item.quantity for item in self.cartitem_set.all())
+        return self.totals()['total_items']
 
     def total_price(self):
         """
         Returns the total price of all items in the cart.
 
         Returns:
-            float: The total price of all items in the cart.
+            Decimal: The total price of all items in the cart.
         """
-        return sum(item.total_price() for item in self.cartitem_set.all())
+        return self.totals()['total_price']
+
+
+def cart_totals(items, **aggregates):
+    """
+    Sum quantities and line prices of the ``CartItem`` queryset ``items``,
+    along with any extra ``aggregates``, in one query.
+    """
+    return items.aggregate(
+        **aggregates,
+        total_items=Coalesce(Sum('quantity'), 0),
+        total_price=Coalesce(
+            Sum(F('quantity') * F('product__price'), output_field=MONEY_FIELD),
+            Value(Decimal('0.00')),
+            output_field=MONEY_FIELD
+        ),
+    )
 
 
 class CartItem(models.Model):
@@ -125,6 +241,12 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # One line per product, so batch adds can upsert on it
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
     def __str__(self):
         """
         Returns a string representation of the cart item, which includes
@@ -167,4 +289,14 @@ def create_user_wishlist(sender, instance, created, **kwargs):
     This ensures every user has a wishlist to avoid RelatedObjectDoesNotExist errors.
     """
     if created:
-        WishList.objects.create(user=instance)
\ No newline at end of file
+        WishList.objects.create(user=instance)
+
+
+@receiver(m2m_changed, sender=WishList.products.through)
+def sync_wishlist_store(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Write wishlist changes through to the membership store used for
+    ``is_wishlisted`` checks.
+    """
+    from .wishlist import sync_wishlist_change
+    sync_wishlist_change(instance, action, reverse, pk_set)
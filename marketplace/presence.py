@@ -0,0 +1,190 @@
+"""
+Chat presence and typing indicators.
+
+Each room keeps a sorted set of its open connections (``<user id>:<channel
+name>``), scored by their last heartbeat, so a user with two tabs open
+stays online until both close. ``ChatConsumer`` refreshes its connection
+every ``CHAT_PRESENCE_HEARTBEAT`` seconds; members not seen for
+``CHAT_PRESENCE_TTL`` seconds are pruned on read, so a worker that dies
+without disconnecting its sockets stops showing them online.
+
+Typing notices are debounced per user and room: the first keystroke in a
+``CHAT_TYPING_INTERVAL_MS`` window claims it (``SET NX PX`` with Redis)
+and is broadcast, the rest are dropped before they reach the channel
+layer. Without the Redis cache both live in process.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_TTL = getattr(settings, 'CHAT_PRESENCE_TTL', 60)
+PRESENCE_HEARTBEAT = getattr(settings, 'CHAT_PRESENCE_HEARTBEAT', 20)
+TYPING_INTERVAL_MS = getattr(settings, 'CHAT_TYPING_INTERVAL_MS', 3000)
+
+
+def get_presence_key(room_name):
+    return f'marketplace:presence:{room_name}'
+
+
+def get_typing_key(room_name, user_id):
+    return f'marketplace:typing:{room_name}:{user_id}'
+
+
+def encode_member(user_id, connection):
+    return f'{user_id}:{connection}'
+
+
+def member_user_ids(members):
+    """User ids behind a collection of connection members"""
+    return {
+        (member.decode() if isinstance(member, bytes) else member).split(':', 1)[0]
+        for member in members
+    }
+
+
+class LocalPresenceStore:
+    """Per-process presence, for development without Redis"""
+
+    def __init__(self, ttl=PRESENCE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rooms = {}
+        self._typing = {}
+
+    def touch(self, room_name, user_id, connection):
+        with self._lock:
+            self._rooms.setdefault(room_name, {})[encode_member(user_id, connection)] = time.time()
+
+    def leave(self, room_name, user_id, connection):
+        with self._lock:
+            self._rooms.get(room_name, {}).pop(encode_member(user_id, connection), None)
+
+    def online(self, room_name):
+        """Ids (as strings) of the users with a live connection to the room"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            members = self._rooms.get(room_name, {})
+            for member in [member for member, seen in members.items() if seen < cutoff]:
+                del members[member]
+            return member_user_ids(members)
+
+    def claim_typing(self, room_name, user_id, interval_ms=TYPING_INTERVAL_MS):
+        key = get_typing_key(room_name, user_id)
+        now = time.monotonic()
+        with self._lock:
+            if self._typing.get(key, 0) > now:
+                return False
+            self._typing[key] = now + interval_ms / 1000
+            return True
+
+
+class RedisPresenceStore:
+    """
+    Sorted set per room scored by heartbeat time. Every write refreshes the
+    key's expiry, so an abandoned room disappears entirely.
+    """
+
+    def __init__(self, connection, ttl=PRESENCE_TTL):
+        self.connection = connection
+        self.ttl = ttl
+
+    def touch(self, room_name, user_id, connection):
+        key = get_presence_key(room_name)
+        pipe = self.connection.pipeline()
+        pipe.zadd(key, {encode_member(user_id, connection): time.time()})
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def leave(self, room_name, user_id, connection):
+        self.connection.zrem(get_presence_key(room_name), encode_member(user_id, connection))
+
+    def online(self, room_name):
+        """Ids (as strings) of the users with a live connection to the room"""
+        key = get_presence_key(room_name)
+        pipe = self.connection.pipeline()
+        pipe.zremrangebyscore(key, '-inf', time.time() - self.ttl)
+        pipe.zrange(key, 0, -1)
+        _, members = pipe.execute()
+        return member_user_ids(members)
+
+    def claim_typing(self, room_name, user_id, interval_ms=TYPING_INTERVAL_MS):
+        return bool(self.connection.set(get_typing_key(room_name, user_id), 1, nx=True, px=interval_ms))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_presence_store():
+    """Redis sorted sets when the default cache is django-redis, else in process"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    from django_redis import get_redis_connection
+                    _store = RedisPresenceStore(get_redis_connection('default'))
+                except (ImportError, NotImplementedError):
+                    _store = LocalPresenceStore()
+    return _store
+
+
+def reset_presence_store():
+    global _store
+    _store = None
+
+
+def _call_store(method, *args):
+    # Store calls are short network round trips; keep them off the event loop
+    # without queueing behind the database thread
+    return sync_to_async(getattr(get_presence_store(), method), thread_sensitive=False)(*args)
+
+
+async def join(room_name, user_id, connection):
+    """Record a new connection; ``True`` if the user was not online before"""
+    try:
+        was_online = str(user_id) in await _call_store('online', room_name)
+        await _call_store('touch', room_name, user_id, connection)
+    except Exception as e:
+        logger.warning(f"Presence store unavailable: {str(e)}")
+        return False
+    return not was_online
+
+
+async def heartbeat(room_name, user_id, connection):
+    try:
+        await _call_store('touch', room_name, user_id, connection)
+    except Exception as e:
+        logger.warning(f"Presence store unavailable: {str(e)}")
+
+
+async def leave(room_name, user_id, connection):
+    """Drop a connection; ``True`` if the user has no other left in the room"""
+    try:
+        await _call_store('leave', room_name, user_id, connection)
+        return str(user_id) not in await _call_store('online', room_name)
+    except Exception as e:
+        logger.warning(f"Presence store unavailable: {str(e)}")
+        return False
+
+
+async def online_user_ids(room_name):
+    try:
+        return await _call_store('online', room_name)
+    except Exception as e:
+        logger.warning(f"Presence store unavailable: {str(e)}")
+        return set()
+
+
+async def claim_typing(room_name, user_id):
+    """``True`` if ``user_id``'s typing notice in the room is due to be sent"""
+    try:
+        return await _call_store('claim_typing', room_name, user_id)
+    except Exception as e:
+        logger.warning(f"Presence store unavailable: {str(e)}")
+        return False
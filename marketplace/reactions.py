@@ -0,0 +1,108 @@
+"""
+Message reactions.
+
+A user has at most one reaction per message (``unique_message_reaction``);
+reacting again changes its type. Every change adjusts the message's
+``ReactionCount`` rows with ``F()`` updates in the same transaction, so
+totals stay exact under concurrent reactions and a page of messages reads
+them with one query instead of counting ``Reaction`` rows. Once committed,
+the change is broadcast to the message's room as deltas such as
+``{"like": 1, "love": -1}`` for clients to apply to what they rendered.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .chat import room_group
+from .models import Reaction, ReactionCount
+import logging
+
+logger = logging.getLogger(__name__)
+
+REACTION_TYPES = {reaction_type for reaction_type, _ in Reaction.REACTION_CHOICES}
+
+
+def adjust_counts(message_id, deltas):
+    for reaction_type, delta in deltas.items():
+        counts = ReactionCount.objects.filter(message_id=message_id, reaction_type=reaction_type)
+        if delta < 0:
+            counts.filter(count__gte=-delta).update(count=F('count') + delta)
+        elif not counts.update(count=F('count') + delta):
+            # First reaction of this type; a concurrent one may create the row too
+            ReactionCount.objects.bulk_create(
+                [ReactionCount(message_id=message_id, reaction_type=reaction_type)],
+                ignore_conflicts=True
+            )
+            counts.update(count=F('count') + delta)
+
+
+def react(message, user, reaction_type):
+    """
+    Set ``user``'s reaction to ``message``, or remove it when
+    ``reaction_type`` is ``None``. Returns the count deltas, empty when
+    nothing changed.
+    """
+    with transaction.atomic():
+        current = Reaction.objects.select_for_update().filter(message_sent=message, user=user).first()
+        previous = current.reaction_type if current else None
+        if previous == reaction_type:
+            return {}
+
+        if reaction_type is None:
+            current.delete()
+        elif current is None:
+            try:
+                with transaction.atomic():
+                    Reaction.objects.create(message_sent=message, user=user, reaction_type=reaction_type)
+            except IntegrityError:
+                # Another request from the same user reacted first
+                return {}
+        else:
+            current.reaction_type = reaction_type
+            current.save(update_fields=['reaction_type'])
+
+        deltas = {}
+        if previous:
+            deltas[previous] = -1
+        if reaction_type:
+            deltas[reaction_type] = 1
+        adjust_counts(message.id, deltas)
+
+    transaction.on_commit(lambda: broadcast(message, user, deltas))
+    return deltas
+
+
+def broadcast(message, user, deltas):
+    channel_layer = get_channel_layer()
+    if channel_layer is None or message.room_id is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            room_group(message.room.name),
+            {
+                'type': 'chat_reaction',
+                'message_id': message.id,
+                'username': user.username,
+                'deltas': deltas
+            }
+        )
+    except Exception as e:
+        # Clients pick up the totals with the next page of history
+        logger.warning(f"Could not broadcast reactions on message {message.id}: {str(e)}")
+
+
+def reaction_counts(message_ids):
+    """``{message_id: {reaction_type: count}}`` for the given messages"""
+    counts = {}
+    for message_id, reaction_type, count in ReactionCount.objects.filter(
+        message_id__in=message_ids, count__gt=0
+    ).values_list('message_id', 'reaction_type', 'count'):
+        counts.setdefault(message_id, {})[reaction_type] = count
+    return counts
+
+
+def user_reactions(user, message_ids):
+    """``{message_id: reaction_type}`` for ``user``'s reactions among the messages"""
+    return dict(Reaction.objects.filter(
+        user=user, message_sent_id__in=message_ids
+    ).values_list('message_sent_id', 'reaction_type'))
@@ -1,6 +1,6 @@
 from rest_framework import serializers
-from django.db.models import Avg
-from .models import Cart, CartItem, WishList, Review
+from django.db.models import Sum
+from .models import Cart, CartItem, Message, WishList, Review
 from products.models import Product, Category
 from users.serializers import StudentProfileSerializer
 from products.serializers import ProductSerializer
@@ -22,6 +22,27 @@ class ReviewSerializer(serializers.ModelSerializer):
         return value
 
 
+class ChatMessageSerializer(serializers.ModelSerializer):
+    """
+    Reaction totals and the reader's own reactions are looked up once per
+    page and passed in the ``reaction_counts`` and ``user_reactions``
+    context entries.
+    """
+    username = serializers.CharField(source='user.username', read_only=True)
+    reactions = serializers.SerializerMethodField()
+    my_reaction = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Message
+        fields = ['id', 'username', 'content', 'timestamp', 'reactions', 'my_reaction']
+
+    def get_reactions(self, obj):
+        return self.context.get('reaction_counts', {}).get(obj.id, {})
+
+    def get_my_reaction(self, obj):
+        return self.context.get('user_reactions', {}).get(obj.id)
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
@@ -48,6 +69,20 @@ class CartItemSerializer(serializers.ModelSerializer):
         return value
 
 
+class CartBatchItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """
+    Many products for one cart. ``mode`` ``add`` adds to the quantities
+    already in the cart, ``set`` replaces them.
+    """
+    items = CartBatchItemSerializer(many=True, allow_empty=False, max_length=100)
+    mode = serializers.ChoiceField(choices=['add', 'set'], default='add')
+
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True, source='cartitem_set')
     total_items = serializers.IntegerField(read_only=True)
@@ -88,6 +123,7 @@ class WishListItemSerializer(serializers.ModelSerializer):
     def get_seller(self, obj):
         """Return detailed seller information"""
         student = obj.student
+        ratings = student.products.aggregate(total=Sum('rating_sum'), count=Sum('rating_count'))
         return {
             'id': student.id,
             'username': student.user.username,
@@ -96,9 +132,7 @@ class WishListItemSerializer(serializers.ModelSerializer):
             'last_name': student.user.last_name,
             'date_joined': student.user.date_joined,
             'products_count': student.products.filter(is_active=True).count(),
-            'average_rating': student.products.aggregate(
-                avg_rating=Avg('reviews__rating')
-            )['avg_rating'] or 0.0
+            'average_rating': ratings['total'] / ratings['count'] if ratings['count'] else 0.0
         }
 
     def get_image_url(self, obj):
@@ -156,10 +190,50 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['slug']
 
 
+class SearchQuerySerializer(serializers.Serializer):
+    """Query parameters accepted by the faceted search endpoint"""
+    q = serializers.CharField(required=False, allow_blank=True, default='')
+    category = serializers.IntegerField(required=False)
+    min_price = serializers.DecimalField(required=False, max_digits=10, decimal_places=2)
+    max_price = serializers.DecimalField(required=False, max_digits=10, decimal_places=2)
+    condition = serializers.ChoiceField(required=False, choices=Product.CONDITION_CHOICES)
+    in_stock = serializers.BooleanField(required=False, default=False)
+    sort_by = serializers.ChoiceField(
+        required=False,
+        default='relevance',
+        choices=['relevance', 'price_asc', 'price_desc', 'newest']
+    )
+    page = serializers.IntegerField(required=False, default=1, min_value=1)
+    page_size = serializers.IntegerField(required=False, default=20, min_value=1, max_value=100)
+
+
+class CategoryFacetSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    slug = serializers.CharField()
+    product_count = serializers.IntegerField()
+
+
+class ConditionFacetSerializer(serializers.Serializer):
+    value = serializers.CharField()
+    label = serializers.CharField()
+    count = serializers.IntegerField()
+
+
+class PriceBucketSerializer(serializers.Serializer):
+    min = serializers.DecimalField(max_digits=10, decimal_places=2)
+    max = serializers.DecimalField(max_digits=10, decimal_places=2)
+    count = serializers.IntegerField()
+
+
 class SearchResultSerializer(serializers.Serializer):
     products = ProductSerializer(many=True)
     total_results = serializers.IntegerField()
-    categories = CategorySerializer(many=True)
+    page = serializers.IntegerField()
+    page_size = serializers.IntegerField()
+    categories = CategoryFacetSerializer(many=True)
+    conditions = ConditionFacetSerializer(many=True)
     price_range = serializers.DictField(
         child=serializers.DecimalField(max_digits=10, decimal_places=2)
     )
+    price_histogram = PriceBucketSerializer(many=True)
@@ -0,0 +1,139 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+from products.models import Product, Category
+from .models import Cart, CartItem
+
+SUMMARY_URL = '/api/marketplace/cart/summary/'
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        books = Category.objects.create(name='Books')
+        self.calculus, self.physics = [
+            Product.objects.create(
+                title=title, description='Lightly used', price=price, stock=5,
+                student=self.user.student_profile, category=books
+            )
+            for title, price in [('Calculus', Decimal('10.50')), ('Physics', Decimal('25.00'))]
+        ]
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.calculus, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.physics, quantity=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_totals_are_summed_in_one_query(self):
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.total_items(), 3)
+            self.assertEqual(cart.total_price(), Decimal('46.00'))
+
+        empty = Cart.objects.create(user=get_user_model().objects.create_user(
+            email='empty@example.com', username='empty', password='testpass123'
+        ))
+        self.assertEqual((empty.total_items(), empty.total_price()), (0, Decimal('0.00')))
+
+    def test_summary_is_cached_until_the_cart_changes(self):
+        response = self.client.get(SUMMARY_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'total_items': 3, 'distinct_items': 2, 'total_price': '46.00'})
+        with self.assertNumQueries(0):
+            self.client.get(SUMMARY_URL)
+
+        # The pre-rename path still works
+        response = self.client.post(
+            '/api/marketplace/cart/update_quantity/', {'product_id': self.physics.id, 'quantity': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(SUMMARY_URL).data['total_price'], '71.00')
+
+        self.client.post('/api/marketplace/cart/update-quantity/', {'product_id': self.physics.id, 'quantity': 3})
+        self.assertEqual(self.client.get(SUMMARY_URL).data['total_price'], '96.00')
+
+        self.client.post('/api/marketplace/cart/add/', {'product_id': self.calculus.id, 'quantity': 1})
+        self.assertEqual(self.client.get(SUMMARY_URL).data['total_items'], 6)
+
+        item = CartItem.objects.get(product=self.physics)
+        self.client.post(f'/api/marketplace/cart/{self.cart.id}/remove/', {'item_id': item.id})
+        self.assertEqual(self.client.get(SUMMARY_URL).data['distinct_items'], 1)
+
+        self.client.post(f'/api/marketplace/cart/{self.cart.id}/clear/')
+        self.assertEqual(
+            self.client.get(SUMMARY_URL).data,
+            {'total_items': 0, 'distinct_items': 0, 'total_price': '0.00'}
+        )
+
+    def test_cart_detail_loads_items_with_products(self):
+        response = self.client.get(f'/api/marketplace/cart/{self.cart.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_items'], 3)
+        self.assertEqual(response.data['total_price'], '46.00')
+
+
+class CartBatchAddTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        books = Category.objects.create(name='Books')
+        self.products = [
+            Product.objects.create(
+                title=f'Book {number}', description='Lightly used', price=10, stock=3,
+                student=self.user.student_profile, category=books
+            )
+            for number in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, items, **data):
+        return self.client.post('/api/marketplace/cart/add-many/', {'items': items, **data}, format='json')
+
+    def test_adds_and_merges_lines_in_one_batch(self):
+        first, second, third = self.products
+        response = self.post([
+            {'product_id': first.id, 'quantity': 1},
+            {'product_id': second.id, 'quantity': 2},
+            {'product_id': first.id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['errors'], [])
+        cart = Cart.objects.get(user=self.user)
+
+        with self.assertNumQueries(6):
+            # Savepoint, cart lock, stock, current lines, upsert, release
+            response = self.post([
+                {'product_id': first.id, 'quantity': 2},
+                {'product_id': third.id, 'quantity': 3},
+                {'product_id': 0, 'quantity': 1},
+            ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [{'product_id': third.id, 'quantity': 3}])
+        self.assertEqual(
+            [(error['product_id'], error.get('available_stock')) for error in response.data['errors']],
+            [(0, None), (first.id, 3)]
+        )
+        self.assertEqual(
+            dict(cart.cartitem_set.values_list('product_id', 'quantity')),
+            {first.id: 2, second.id: 2, third.id: 3}
+        )
+
+    def test_set_mode_replaces_quantities(self):
+        first = self.products[0]
+        self.post([{'product_id': first.id, 'quantity': 2}])
+        response = self.post([{'product_id': first.id, 'quantity': 3}], mode='set')
+        self.assertEqual(response.data['items'], [{'product_id': first.id, 'quantity': 3}])
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+
+        response = self.post([{'product_id': first.id, 'quantity': 4}], mode='set')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post([], mode='add').status_code, 400)
@@ -0,0 +1,402 @@
+import asyncio
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from . import chat, presence, reactions
+from .models import ChatRoom, Message, Reaction, ReactionCount
+from .routing import websocket_urlpatterns
+
+
+class ChatWriteBufferTests(TransactionTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        self.room = chat.create_room('books', self.user)
+        chat.reset_write_buffer()
+        presence.reset_presence_store()
+
+    def tearDown(self):
+        chat.reset_write_buffer()
+        presence.reset_presence_store()
+
+    def message(self, number):
+        return Message(user=self.user, room=self.room, content=f'Message {number}')
+
+    def test_flushes_full_batches_and_after_the_interval(self):
+        async def run():
+            buffer = chat.MessageWriteBuffer(batch_size=3, interval_ms=50)
+            for number in range(4):
+                await buffer.add(self.message(number))
+            # The first three were written together; the fourth waits
+            self.assertEqual(len(buffer), 1)
+            self.assertEqual(await Message.objects.acount(), 3)
+
+            await asyncio.sleep(0.2)
+            self.assertEqual(len(buffer), 0)
+            self.assertEqual(await Message.objects.acount(), 4)
+
+        asyncio.run(run())
+        self.assertEqual(
+            list(self.room.messages.order_by('timestamp', 'id').values_list('content', flat=True)),
+            [f'Message {number}' for number in range(4)]
+        )
+
+    def test_failed_batches_are_retried(self):
+        bulk_create = Message.objects.bulk_create
+        failures = [DatabaseError('gone')]
+
+        def flaky_bulk_create(batch):
+            if failures:
+                raise failures.pop()
+            return bulk_create(batch)
+
+        async def run():
+            buffer = chat.MessageWriteBuffer(batch_size=2, interval_ms=50)
+            with mock.patch.object(Message.objects, 'bulk_create', side_effect=flaky_bulk_create):
+                await buffer.add(self.message(0))
+                await buffer.add(self.message(1))
+                self.assertEqual(len(buffer), 2)
+                # Retrying: more messages wait for the scheduled flush
+                await buffer.add(self.message(2))
+                self.assertEqual(len(buffer), 3)
+                await asyncio.sleep(0.2)
+            self.assertEqual(len(buffer), 0)
+
+        asyncio.run(run())
+        self.assertEqual(Message.objects.count(), 3)
+
+    def test_buffer_flushes_on_lifespan_shutdown(self):
+        async def run():
+            await chat.get_write_buffer().add(self.message(0))
+            events = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+            sent = []
+
+            async def receive():
+                return next(events)
+
+            async def send(message):
+                sent.append(message['type'])
+
+            await chat.ChatWriteBufferMiddleware(None)({'type': 'lifespan'}, receive, send)
+            self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+        asyncio.run(run())
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_consumer_stores_messages_in_its_room(self):
+        async def run():
+            application = URLRouter(websocket_urlpatterns)
+            communicator = WebsocketCommunicator(application, '/ws/chat/books/')
+            communicator.scope['user'] = self.user
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            # Presence state and the room's notice that the buyer is online
+            for _ in range(2):
+                await communicator.receive_json_from()
+
+            await communicator.send_json_to({'message': 'Is the calculus book still available?'})
+            response = await communicator.receive_json_from()
+            self.assertEqual(response['username'], 'buyer')
+            self.assertIsNotNone(response['timestamp'])
+            await communicator.send_json_to({'message': '   '})
+            self.assertTrue(await communicator.receive_nothing())
+
+            # Disconnecting saves the message without waiting for the timer
+            await communicator.disconnect()
+            self.assertEqual(len(chat.get_write_buffer()), 0)
+
+        asyncio.run(run())
+        message = Message.objects.get()
+        self.assertEqual((message.room, message.user), (self.room, self.user))
+
+    def test_non_members_cannot_join_or_create_rooms(self):
+        outsider = get_user_model().objects.create_user(
+            email='outsider@example.com', username='outsider', password='testpass123'
+        )
+
+        async def connect(path, user):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            return connected
+
+        async def run():
+            self.assertFalse(await connect('/ws/chat/books/', outsider))
+            self.assertFalse(await connect('/ws/chat/books/', AnonymousUser()))
+            self.assertFalse(await connect('/ws/chat/maths/', outsider))
+
+        asyncio.run(run())
+        self.assertFalse(ChatRoom.objects.filter(name='maths').exists())
+        self.assertEqual(list(self.room.members.all()), [self.user])
+
+        # Trying the socket first grants nothing over the history API
+        client = APIClient()
+        client.force_authenticate(outsider)
+        self.assertEqual(client.get('/api/marketplace/chat/rooms/books/messages/').status_code, 404)
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        self.buyer = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        self.seller = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.room = ChatRoom.objects.create(name='books')
+        self.room.members.add(self.buyer, self.seller)
+        self.start = timezone.now() - timedelta(hours=1)
+        # Two messages share each timestamp, so pages must break ties on id
+        Message.objects.bulk_create([
+            Message(
+                user=self.seller, room=self.room, content=f'Message {number}',
+                timestamp=self.start + timedelta(minutes=number // 2)
+            )
+            for number in range(7)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        self.url = f'/api/marketplace/chat/rooms/{self.room.name}/messages/'
+
+    def test_before_cursor_walks_back_to_the_first_message(self):
+        pages = []
+        params = {'limit': 3}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([message['content'] for message in response.data['results']])
+            if response.data['before'] is None:
+                break
+            params['before'] = response.data['before']
+        self.assertEqual(pages, [
+            ['Message 4', 'Message 5', 'Message 6'],
+            ['Message 1', 'Message 2', 'Message 3'],
+            ['Message 0'],
+        ])
+
+        self.assertEqual(self.client.get(self.url, {'before': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/marketplace/chat/rooms/missing/messages/').status_code, 404)
+
+    def test_only_members_can_read_a_room(self):
+        outsider = get_user_model().objects.create_user(
+            email='outsider@example.com', username='outsider', password='testpass123'
+        )
+        self.client.force_authenticate(outsider)
+        read_url = f'/api/marketplace/chat/rooms/{self.room.name}/read/'
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get(read_url).status_code, 404)
+        self.assertEqual(self.client.post(read_url).status_code, 404)
+        self.assertFalse(self.room.read_markers.exists())
+
+    def test_rooms_are_created_and_joined_through_the_api(self):
+        outsider = get_user_model().objects.create_user(
+            email='outsider@example.com', username='outsider', password='testpass123'
+        )
+        response = self.client.post('/api/marketplace/chat/rooms/', {'name': 'maths', 'members': [self.seller.id]},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['members'], sorted([self.buyer.id, self.seller.id]))
+        self.assertEqual(self.client.post('/api/marketplace/chat/rooms/', {'name': 'maths'}).status_code, 400)
+        self.assertEqual(self.client.post('/api/marketplace/chat/rooms/', {'name': 'no spaces'}).status_code, 400)
+
+        members_url = '/api/marketplace/chat/rooms/maths/members/'
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.client.post(members_url, {'members': [outsider.id]}, format='json').status_code, 404)
+        self.client.force_authenticate(self.seller)
+        response = self.client.post(members_url, {'members': [outsider.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(outsider.id, response.data['members'])
+        self.assertEqual(self.client.post(members_url, {'members': [0]}, format='json').status_code, 400)
+
+    def test_opening_a_room_takes_constant_queries(self):
+        self.client.get(self.url)
+        for message in Message.objects.all()[:3]:
+            for user in (self.buyer, self.seller):
+                reactions.react(message, user, 'like')
+
+        # Room, page with authors, read marker (already current), reaction
+        # totals and the reader's own reactions, however many there are
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url, {'limit': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['last_read_at'], self.start + timedelta(minutes=3))
+
+    def test_read_markers_only_move_forward(self):
+        read_url = f'/api/marketplace/chat/rooms/{self.room.name}/read/'
+        self.assertEqual(self.client.get(read_url).data['unread'], 7)
+
+        chat.mark_read(self.room, self.buyer, self.start + timedelta(minutes=1))
+        self.assertEqual(chat.unread_count(self.room, self.buyer), 3)
+        chat.mark_read(self.room, self.buyer, self.start)
+        self.assertEqual(chat.last_read_at(self.room, self.buyer), self.start + timedelta(minutes=1))
+
+        # Older pages do not move the marker
+        first_page = self.client.get(self.url, {'limit': 2})
+        self.assertEqual(chat.unread_count(self.room, self.buyer), 0)
+        self.client.get(self.url, {'limit': 2, 'before': first_page.data['before']})
+        self.assertEqual(chat.last_read_at(self.room, self.buyer), self.start + timedelta(minutes=3))
+
+        Message.objects.create(user=self.seller, room=self.room, content='Still there?')
+        Message.objects.create(user=self.buyer, room=self.room, content='Yes')
+        self.assertEqual(self.client.get(read_url).data['unread'], 1)
+        self.assertEqual(self.client.post(read_url).data['unread'], 0)
+
+
+class PresenceStoreTests(SimpleTestCase):
+    def test_users_stay_online_until_their_last_connection_leaves(self):
+        store = presence.LocalPresenceStore(ttl=60)
+        store.touch('books', 1, 'tab-a')
+        store.touch('books', 1, 'tab-b')
+        store.touch('books', 2, 'tab-c')
+        self.assertEqual(store.online('books'), {'1', '2'})
+
+        store.leave('books', 1, 'tab-a')
+        self.assertEqual(store.online('books'), {'1', '2'})
+        store.leave('books', 1, 'tab-b')
+        self.assertEqual(store.online('books'), {'2'})
+
+        # Connections whose heartbeats stopped are pruned
+        store.ttl = -1
+        self.assertEqual(store.online('books'), set())
+
+    def test_typing_is_claimed_once_per_interval(self):
+        store = presence.LocalPresenceStore()
+        self.assertTrue(store.claim_typing('books', 1, interval_ms=60000))
+        self.assertFalse(store.claim_typing('books', 1, interval_ms=60000))
+        self.assertTrue(store.claim_typing('books', 2, interval_ms=60000))
+        self.assertTrue(store.claim_typing('maths', 1, interval_ms=60000))
+        self.assertTrue(store.claim_typing('books', 3, interval_ms=0))
+        self.assertTrue(store.claim_typing('books', 3, interval_ms=0))
+
+
+class ChatPresenceTests(TransactionTestCase):
+    def setUp(self):
+        self.buyer = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        self.seller = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        chat.create_room('books', self.buyer, [self.seller])
+        chat.reset_write_buffer()
+        presence.reset_presence_store()
+
+    def tearDown(self):
+        chat.reset_write_buffer()
+        presence.reset_presence_store()
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chat/books/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        frames = [await communicator.receive_json_from() for _ in range(2)]
+        return communicator, {frame['type']: frame for frame in frames}
+
+    def test_presence_changes_and_debounced_typing_reach_the_room(self):
+        async def run():
+            buyer, frames = await self.connect(self.buyer)
+            self.assertEqual(frames['presence_state']['users'], ['buyer'])
+
+            seller, frames = await self.connect(self.seller)
+            self.assertEqual(frames['presence_state']['users'], ['buyer', 'seller'])
+            self.assertEqual(
+                await buyer.receive_json_from(),
+                {'type': 'presence', 'username': 'seller', 'online': True}
+            )
+
+            for _ in range(3):
+                await seller.send_json_to({'type': 'typing'})
+            self.assertEqual(await buyer.receive_json_from(), {'type': 'typing', 'username': 'seller'})
+            self.assertTrue(await buyer.receive_nothing())
+            self.assertTrue(await seller.receive_nothing())
+
+            await seller.disconnect()
+            self.assertEqual(
+                await buyer.receive_json_from(),
+                {'type': 'presence', 'username': 'seller', 'online': False}
+            )
+            await buyer.disconnect()
+            self.assertEqual(await presence.online_user_ids('books'), set())
+
+        asyncio.run(run())
+
+
+class ReactionTests(TestCase):
+    def setUp(self):
+        self.buyer = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        self.seller = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.room = chat.create_room('books', self.buyer, [self.seller])
+        self.message = Message.objects.create(user=self.seller, room=self.room, content='Still available')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        self.url = f'/api/marketplace/chat/rooms/books/messages/{self.message.id}/reaction/'
+
+    def counts(self):
+        return reactions.reaction_counts([self.message.id]).get(self.message.id, {})
+
+    def test_counters_follow_each_users_single_reaction(self):
+        self.assertEqual(reactions.react(self.message, self.buyer, 'like'), {'like': 1})
+        self.assertEqual(reactions.react(self.message, self.buyer, 'like'), {})
+        self.assertEqual(reactions.react(self.message, self.seller, 'like'), {'like': 1})
+        self.assertEqual(self.counts(), {'like': 2})
+
+        self.assertEqual(reactions.react(self.message, self.buyer, 'love'), {'like': -1, 'love': 1})
+        self.assertEqual(self.counts(), {'like': 1, 'love': 1})
+        self.assertEqual(Reaction.objects.filter(user=self.buyer).count(), 1)
+
+        self.assertEqual(reactions.react(self.message, self.seller, None), {'like': -1})
+        self.assertEqual(reactions.react(self.message, self.seller, None), {})
+        self.assertEqual(self.counts(), {'love': 1})
+        self.assertEqual(ReactionCount.objects.get(reaction_type='like').count, 0)
+
+    def test_endpoint_broadcasts_deltas_to_the_room(self):
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(chat.room_group('books'), channel)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'reaction_type': 'wow'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reactions'], {'wow': 1})
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(
+            (event['type'], event['message_id'], event['username'], event['deltas']),
+            ('chat_reaction', self.message.id, 'buyer', {'wow': 1})
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(self.url)
+        self.assertEqual((response.data['changes'], response.data['reactions']), ({'wow': -1}, {}))
+        self.assertEqual(async_to_sync(channel_layer.receive)(channel)['deltas'], {'wow': -1})
+
+        self.assertEqual(self.client.post(self.url, {'reaction_type': 'meh'}).status_code, 400)
+        other_room = f'/api/marketplace/chat/rooms/maths/messages/{self.message.id}/reaction/'
+        self.assertEqual(self.client.post(other_room, {'reaction_type': 'wow'}).status_code, 404)
+        async_to_sync(channel_layer.flush)()
+
+    def test_only_members_can_react(self):
+        outsider = get_user_model().objects.create_user(
+            email='outsider@example.com', username='outsider', password='testpass123'
+        )
+        self.client.force_authenticate(outsider)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(self.client.post(self.url, {'reaction_type': 'wow'}).status_code, 404)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.counts(), {})
@@ -0,0 +1,177 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.test import TestCase
+from rest_framework.test import APIClient
+from products.models import Product, Category
+from redis.exceptions import WatchError
+from .wishlist import LOADED_SENTINEL, RedisWishlistStore, get_wishlist_cache_key, wishlisted_among
+
+CHECK_URL = '/api/marketplace/wishlist/check/'
+
+
+class WishlistMembershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        books = Category.objects.create(name='Books')
+        self.products = [
+            Product.objects.create(
+                title=f'Book {number}', description='Lightly used', price=10,
+                student=self.user.student_profile, category=books
+            )
+            for number in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_m2m_changes_are_written_through(self):
+        first, second, third = self.products
+        ids = [product.id for product in self.products]
+        self.assertEqual(wishlisted_among(self.user, ids), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.wishlist.products.add(first, second)
+        self.assertEqual(wishlisted_among(self.user, ids), {first.id, second.id})
+
+        # Changes made from the product side count too
+        with self.captureOnCommitCallbacks(execute=True):
+            third.wishlists.add(self.user.wishlist)
+            first.wishlists.remove(self.user.wishlist)
+        self.assertEqual(wishlisted_among(self.user, ids), {second.id, third.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.wishlists.clear()
+        self.assertEqual(wishlisted_among(self.user, ids), {third.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.wishlist.products.clear()
+        self.assertEqual(wishlisted_among(self.user, ids), set())
+
+    def test_rolled_back_changes_never_reach_the_store(self):
+        first = self.products[0]
+        self.assertEqual(wishlisted_among(self.user, [first.id]), set())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    self.user.wishlist.products.add(first)
+                    raise DatabaseError('rolled back')
+            except DatabaseError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(wishlisted_among(self.user, [first.id]), set())
+
+    def test_checks_skip_the_wishlist_tables_once_loaded(self):
+        first, second, _ = self.products
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.wishlist.products.add(second)
+        self.client.get(CHECK_URL, {'ids': first.id})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(CHECK_URL, {'ids': ','.join(str(product.id) for product in self.products)})
+        self.assertEqual(response.data, {'wishlisted': [second.id]})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/marketplace/wishlist/{second.slug}/check/')
+        self.assertTrue(response.data['in_wishlist'])
+
+        self.assertEqual(self.client.get(CHECK_URL, {'ids': 'one,two'}).status_code, 400)
+
+    def test_slug_endpoints_keep_membership_current(self):
+        product = self.products[0]
+        check_url = f'/api/marketplace/wishlist/{product.slug}/check/'
+        self.assertFalse(self.client.get(check_url).data['in_wishlist'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/marketplace/wishlist/{product.slug}/add/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.client.get(check_url).data['in_wishlist'])
+        response = self.client.post(f'/api/marketplace/wishlist/{product.slug}/add/')
+        self.assertEqual(response.data['message'], 'Product already in wishlist')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/marketplace/wishlist/{product.slug}/remove/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(self.client.get(check_url).data['in_wishlist'])
+        self.assertFalse(self.user.wishlist.products.exists())
+
+    def test_redis_load_gives_way_to_a_concurrent_write(self):
+        self.user.wishlist.products.add(self.products[0])
+        connection = mock.MagicMock()
+        pipe = connection.pipeline.return_value.__enter__.return_value
+        pipe.sismember.return_value = False
+        # An add committed between the database read and the fill touched the key
+        pipe.execute.side_effect = WatchError
+        store = RedisWishlistStore(connection)
+
+        self.assertEqual(store.members(self.user.pk), {self.products[0].id})
+        key = get_wishlist_cache_key(self.user.pk)
+        pipe.watch.assert_called_once_with(key)
+        pipe.multi.assert_called_once_with()
+
+        # Loaded by another request after the watch: its set is used as is
+        pipe.reset_mock()
+        pipe.sismember.return_value = True
+        pipe.smembers.return_value = {str(LOADED_SENTINEL).encode(), str(self.products[1].id).encode()}
+        self.assertEqual(store.members(self.user.pk), {self.products[1].id})
+        pipe.multi.assert_not_called()
+
+
+class WishlistBySellerTests(TestCase):
+    url = '/api/marketplace/wishlist/by-seller/'
+
+    def setUp(self):
+        self.buyer = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        books = Category.objects.create(name='Books')
+        self.sellers = [
+            get_user_model().objects.create_user(
+                email=f'seller{number}@example.com', username=f'seller{number}', password='testpass123'
+            )
+            for number in range(3)
+        ]
+        # seller0 has four wishlisted products, seller1 two and seller2 one
+        for seller, count in zip(self.sellers, [4, 2, 1]):
+            for number in range(count):
+                product = Product.objects.create(
+                    title=f'{seller.username} book {number}', description='Lightly used', price=10 + number,
+                    student=seller.student_profile, category=books
+                )
+                self.buyer.wishlist.products.add(product)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_groups_sellers_with_aggregates_in_constant_queries(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, {'page_size': 2, 'per_seller': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_sellers'], 3)
+        self.assertEqual(response.data['total_products'], 7)
+        self.assertIsNotNone(response.data['next'])
+
+        first, second = response.data['sellers']
+        self.assertEqual(first['seller']['username'], 'seller0')
+        self.assertEqual((first['product_count'], first['total_value']), (4, 46))
+        self.assertEqual(
+            [product['title'] for product in first['products']],
+            ['seller0 book 3', 'seller0 book 2', 'seller0 book 1']
+        )
+        self.assertTrue(first['has_more_products'])
+        self.assertEqual((second['product_count'], len(second['products'])), (2, 2))
+        self.assertFalse(second['has_more_products'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([group['seller']['username'] for group in response.data['sellers']], ['seller2'])
+
+    def test_pages_through_one_sellers_products(self):
+        seller = self.sellers[0].student_profile
+        response = self.client.get(self.url, {'seller': seller.id, 'page_size': 3})
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([product['title'] for product in response.data['results']], ['seller0 book 0'])
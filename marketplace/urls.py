@@ -4,6 +4,7 @@ from rest_framework.routers import SimpleRouter
 from marketplace.consumers import MarketplaceConsumer
 from . import views_marketplace
 from . import views_textbooks
+from . import views_chat
 
 
 # Create a router and register our viewset with it.
@@ -18,6 +19,12 @@ websocket_urlpatterns = [
 ]
 
 urlpatterns = [
+     # Old spelling of cart/update-quantity/, kept for existing clients. It
+     # precedes the router so the cart/<pk>/ detail route cannot match it.
+     path('cart/update_quantity/',
+          views_marketplace.CartViewSet.as_view({'post': 'update_quantity'}),
+          name='cart-update-quantity-legacy'),
+
      # Router URLs
      path('', include(router.urls)),
 
@@ -25,19 +32,28 @@ urlpatterns = [
      path('cart/add/',
           views_marketplace.CartViewSet.as_view({'post': 'add'}),
           name='cart-add'),
+     path('cart/add-many/',
+          views_marketplace.CartViewSet.as_view({'post': 'add_many'}),
+          name='cart-add-many'),
      path('cart/update-quantity/',
           views_marketplace.CartViewSet.as_view({'post': 'update_quantity'}),
           name='cart-update-quantity'),
+     path('cart/summary/',
+          views_marketplace.CartViewSet.as_view({'get': 'summary'}),
+          name='cart-summary'),
+     path('cart/hold/',
+          views_marketplace.CartViewSet.as_view({'post': 'hold'}),
+          name='cart-hold'),
 
 
      # Cart operations
-     path('cart/<int:cart_id>/add/',
+     path('cart/<int:pk>/add/',
           views_marketplace.CartViewSet.as_view({'post': 'add_item'}),
           name='cart-add-item'),
-     path('cart/<int:cart_id>/remove/',
+     path('cart/<int:pk>/remove/',
           views_marketplace.CartViewSet.as_view({'post': 'remove_item'}),
           name='cart-remove-item'),
-     path('cart/<int:cart_id>/clear/',
+     path('cart/<int:pk>/clear/',
           views_marketplace.CartViewSet.as_view({'post': 'clear'}),
           name='cart-clear'),
 
@@ -65,6 +81,9 @@ urlpatterns = [
      path('wishlist/remove/',
           views_marketplace.WishListViewSet.as_view({'post': 'remove_product'}),
           name='wishlist-remove'),
+     path('wishlist/check/',
+          views_marketplace.WishListViewSet.as_view({'get': 'check_products'}),
+          name='wishlist-check-products'),
      path('wishlist/by-seller/',
           views_marketplace.WishListViewSet.as_view({'get': 'by_seller'}),
           name='wishlist-by-seller'),
@@ -89,6 +108,23 @@ urlpatterns = [
           views_marketplace.WishListViewSet.as_view({'get': 'check_product'}),
           name='wishlist-check-product'),
 
+     # Chat rooms, history and read state
+     path('chat/rooms/',
+          views_chat.rooms,
+          name='chat-rooms'),
+     path('chat/rooms/<slug:room_name>/members/',
+          views_chat.room_members,
+          name='chat-room-members'),
+     path('chat/rooms/<slug:room_name>/messages/',
+          views_chat.room_messages,
+          name='chat-room-messages'),
+     path('chat/rooms/<slug:room_name>/messages/<int:message_id>/reaction/',
+          views_chat.message_reaction,
+          name='chat-message-reaction'),
+     path('chat/rooms/<slug:room_name>/read/',
+          views_chat.room_read,
+          name='chat-room-read'),
+
      # Search and recommendations
      path('search/',
           views_marketplace.SearchView.as_view(),
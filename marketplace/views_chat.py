@@ -0,0 +1,144 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.shortcuts import get_object_or_404
+from .chat import (
+    HISTORY_MAX_PAGE_SIZE,
+    HISTORY_PAGE_SIZE,
+    create_room,
+    history,
+    last_read_at,
+    mark_read,
+    unread_count,
+)
+from .models import ChatRoom, Message
+from .reactions import REACTION_TYPES, react, reaction_counts, user_reactions
+from .serializers_marketplace import ChatMessageSerializer
+
+
+def member_users(user_ids):
+    """Users behind ``user_ids``; raises ``ValueError`` unless all of them exist"""
+    if not isinstance(user_ids, list):
+        raise ValueError
+    users = list(get_user_model().objects.filter(pk__in=user_ids))
+    if len(users) != len(set(user_ids)):
+        raise ValueError
+    return users
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def rooms(request):
+    """Create a room (``name``) with the caller and the ``members`` user ids in it"""
+    name = request.data.get('name', '')
+    try:
+        validate_slug(name)
+        members = member_users(request.data.get('members', []))
+    except (ValidationError, TypeError, ValueError):
+        return Response(
+            {'error': 'name must be a slug and members a list of user ids'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if ChatRoom.objects.filter(name=name).exists():
+        return Response({'error': 'Room already exists'}, status=status.HTTP_400_BAD_REQUEST)
+
+    room = create_room(name, request.user, members)
+    return Response({
+        'name': room.name,
+        'members': sorted(room.members.values_list('id', flat=True)),
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def room_members(request, room_name):
+    """Add the ``members`` user ids to a room the caller belongs to"""
+    room = get_object_or_404(ChatRoom, name=room_name, members=request.user)
+    try:
+        members = member_users(request.data.get('members', []))
+    except (TypeError, ValueError):
+        return Response({'error': 'members must be a list of user ids'}, status=status.HTTP_400_BAD_REQUEST)
+    room.members.add(*members)
+    return Response({'name': room.name, 'members': sorted(room.members.values_list('id', flat=True))})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def room_messages(request, room_name):
+    """
+    Newest messages of a room, oldest first. Pass the returned ``before``
+    cursor back to load the page before them. Loading the newest page marks
+    the room read; ``last_read_at`` is where the user had read up to.
+    Rooms the user is not a member of are not found.
+    """
+    room = get_object_or_404(ChatRoom, name=room_name, members=request.user)
+    before = request.query_params.get('before')
+    try:
+        limit = min(int(request.query_params.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+        messages, older = history(room, before=before, limit=limit)
+    except ValueError:
+        return Response(
+            {'error': 'Invalid before cursor or limit'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    previous_read_at = last_read_at(room, request.user)
+    if not before and messages and (
+        previous_read_at is None or previous_read_at < messages[-1].timestamp
+    ):
+        mark_read(room, request.user, messages[-1].timestamp)
+
+    message_ids = [message.id for message in messages]
+    context = {
+        'reaction_counts': reaction_counts(message_ids),
+        'user_reactions': user_reactions(request.user, message_ids),
+    }
+    return Response({
+        'results': ChatMessageSerializer(messages, many=True, context=context).data,
+        'before': older,
+        'last_read_at': previous_read_at,
+    })
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def room_read(request, room_name):
+    """Unread count of a room (GET), or mark everything up to now read (POST)"""
+    room = get_object_or_404(ChatRoom, name=room_name, members=request.user)
+    if request.method == 'POST':
+        mark_read(room, request.user)
+    return Response({
+        'last_read_at': last_read_at(room, request.user),
+        'unread': unread_count(room, request.user),
+    })
+
+
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def message_reaction(request, room_name, message_id):
+    """Set (POST ``reaction_type``) or remove (DELETE) the user's reaction to a message"""
+    message = get_object_or_404(
+        Message.objects.select_related('room'), id=message_id, room__name=room_name, room__members=request.user
+    )
+    reaction_type = None
+    if request.method == 'POST':
+        reaction_type = request.data.get('reaction_type')
+        if reaction_type not in REACTION_TYPES:
+            return Response(
+                {'error': f'reaction_type must be one of: {", ".join(sorted(REACTION_TYPES))}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    deltas = react(message, request.user, reaction_type)
+    return Response({
+        'message_id': message.id,
+        'my_reaction': reaction_type,
+        'changes': deltas,
+        'reactions': reaction_counts([message.id]).get(message.id, {}),
+    })
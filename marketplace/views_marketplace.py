@@ -4,19 +4,38 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework import permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Count, Avg, Q
+from django.db.models import Prefetch, Q
 from django.shortcuts import get_object_or_404
 from .models import Cart, CartItem, WishList, Review
-from products.models import Product, Category
+from products import reservations
+from products.models import Product
 from .serializers_marketplace import (
     CartSerializer,
     CartItemSerializer,
+    CartBatchSerializer,
     WishListSerializer,
     ReviewSerializer,
     CategorySerializer,
-    SearchResultSerializer
+    SearchResultSerializer,
+    SearchQuerySerializer
 )
 from products.serializers import ProductSerializer
+from products.search import search_products, search_facets
+from products.cache import SEARCH_TAG, get_cache_key
+from .cart import add_items, get_cart_summary, invalidate_cart_summary
+from .wishlist import (
+    SELLER_PRODUCT_FIELDS,
+    is_wishlisted,
+    seller_groups,
+    seller_products,
+    wishlisted_among,
+    wishlisted_products,
+)
+from students.pagination import WishlistSellerPagination
+from django.core.cache import cache
+from django.conf import settings
+import hashlib
+import json
 import logging
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.dispatch import receiver
@@ -24,13 +43,33 @@ from users.models import CustomUser
 
 logger = logging.getLogger(__name__)
 
+SEARCH_CACHE_TTL = getattr(settings, 'SEARCH_CACHE_TTL', 300)
+WISHLIST_CHECK_MAX_IDS = 200
+WISHLIST_PRODUCTS_PER_SELLER = 5
+
+
+def get_search_cache_key(params):
+    """
+    Cache key for a validated search query. Parameters are normalized
+    (defaults filled in, query lowercased and whitespace collapsed) so
+    equivalent requests share one entry.
+    """
+    normalized = dict(params)
+    normalized['q'] = ' '.join(normalized.get('q', '').lower().split())
+    digest = hashlib.md5(
+        json.dumps(normalized, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return get_cache_key('search_facets', digest, tags=[SEARCH_TAG])
+
 
 class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return Cart.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch('cartitem_set', queryset=CartItem.objects.select_related('product'))
+        )
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -85,6 +124,7 @@ class CartViewSet(viewsets.ModelViewSet):
                     )
 
                 existing_item.save()
+                invalidate_cart_summary(request.user)
                 serializer = CartItemSerializer(existing_item)
 
                 return Response({
@@ -109,6 +149,7 @@ class CartViewSet(viewsets.ModelViewSet):
                     product=product,
                     quantity=quantity
                 )
+                invalidate_cart_summary(request.user)
                 serializer = CartItemSerializer(cart_item)
 
                 return Response({
@@ -136,6 +177,7 @@ class CartViewSet(viewsets.ModelViewSet):
         try:
             item = cart.cartitem_set.get(id=item_id)
             item.delete()
+            invalidate_cart_summary(request.user)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except CartItem.DoesNotExist:
             return Response(
@@ -147,8 +189,37 @@ class CartViewSet(viewsets.ModelViewSet):
     def clear(self, request, pk=None):
         cart = self.get_object()
         cart.cartitem_set.all().delete()
+        reservations.release(cart.stock_reservations.filter(order__isnull=True))
+        invalidate_cart_summary(request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Item count and total price of the user's cart, for header badges"""
+        return Response(get_cart_summary(request.user))
+
+    @action(detail=False, methods=['post'])
+    def hold(self, request):
+        """
+        Hold stock for the whole cart while the user checks out. The hold
+        expires on its own if no order follows.
+        """
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        try:
+            held, _ = reservations.hold_cart(cart)
+        except reservations.InsufficientStock as e:
+            return Response(
+                {'error': 'Not enough stock', 'available': e.shortages},
+                status=status.HTTP_409_CONFLICT
+            )
+        except Product.DoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'items': {reservation.product_id: reservation.quantity for reservation in held},
+            'expires_at': held[0].expires_at if held else None,
+        })
+
     @action(detail=False, methods=['post'])
     def add(self, request):
         """Add item to user's cart - updates quantity if item already exists"""
@@ -209,6 +280,7 @@ class CartViewSet(viewsets.ModelViewSet):
 
                 existing_item.quantity = new_quantity
                 existing_item.save()
+                invalidate_cart_summary(request.user)
                 serializer = CartItemSerializer(existing_item)
 
                 logger.info(f"Updated cart item quantity for user {request.user.username}: Product {product.id}, New quantity: {new_quantity}")
@@ -237,6 +309,7 @@ class CartViewSet(viewsets.ModelViewSet):
                     product=product,
                     quantity=quantity
                 )
+                invalidate_cart_summary(request.user)
                 serializer = CartItemSerializer(cart_item)
 
                 logger.info(f"Added new item to cart for user {request.user.username}: Product {product.id}, Quantity: {quantity}")
@@ -255,7 +328,31 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], url_path='add-many')
+    def add_many(self, request):
+        """
+        Add many products to the user's cart in one call, e.g. "buy all from
+        this seller" or merging a guest cart after login. Lines that cannot
+        be added are reported in ``errors`` without blocking the rest.
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        cart, lines, errors = add_items(
+            request.user,
+            [(item['product_id'], item['quantity']) for item in serializer.validated_data['items']],
+            replace=serializer.validated_data['mode'] == 'set'
+        )
+        logger.info(f"Batch added {len(lines)} products to cart for user {request.user.username}, {len(errors)} rejected")
+
+        return Response({
+            'cart': cart.id,
+            'items': [{'product_id': line.product_id, 'quantity': line.quantity} for line in lines],
+            'errors': errors,
+        }, status=status.HTTP_200_OK if lines or not errors else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='update-quantity')
     def update_quantity(self, request):
         """Update the quantity of an item in the cart"""
         try:
@@ -318,6 +415,7 @@ class CartViewSet(viewsets.ModelViewSet):
             # If quantity is 0, remove the item
             if new_quantity == 0:
                 cart_item.delete()
+                invalidate_cart_summary(request.user)
                 return Response({
                     'message': 'Item removed from cart',
                     'action': 'removed',
@@ -339,6 +437,7 @@ class CartViewSet(viewsets.ModelViewSet):
             old_quantity = cart_item.quantity
             cart_item.quantity = new_quantity
             cart_item.save()
+            invalidate_cart_summary(request.user)
 
             serializer = CartItemSerializer(cart_item)
 
@@ -384,34 +483,6 @@ class WishListViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-    @action(detail=True, methods=['post'])
-    def add_product(self, request, pk=None):
-        wishlist = self.get_object()
-        product_id = request.data.get('product_id')
-        try:
-            product = Product.objects.get(id=product_id)
-            wishlist.products.add(product)
-            return Response(status=status.HTTP_200_OK)
-        except Product.DoesNotExist:
-            return Response(
-                {'error': 'Product not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-    @action(detail=True, methods=['post'])
-    def remove_product(self, request, pk=None):
-        wishlist = self.get_object()
-        product_id = request.data.get('product_id')
-        try:
-            product = Product.objects.get(id=product_id)
-            wishlist.products.remove(product)
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except Product.DoesNotExist:
-            return Response(
-                {'error': 'Product not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
     @action(detail=False, methods=['post'])
     def add_product(self, request):
         """Add product to user's wishlist by product ID"""
@@ -437,7 +508,7 @@ class WishListViewSet(viewsets.ModelViewSet):
                 )
 
             # Check if product is already in wishlist
-            if wishlist.products.filter(id=product.id).exists():
+            if is_wishlisted(request.user, product.id):
                 return Response(
                     {'message': 'Product already in wishlist'},
                     status=status.HTTP_200_OK
@@ -471,7 +542,7 @@ class WishListViewSet(viewsets.ModelViewSet):
             product = get_object_or_404(Product, slug=product_slug, is_active=True)
 
             # Check if product is already in wishlist
-            if wishlist.products.filter(id=product.id).exists():
+            if is_wishlisted(request.user, product.id):
                 return Response(
                     {'message': 'Product already in wishlist'},
                     status=status.HTTP_200_OK
@@ -550,14 +621,12 @@ class WishListViewSet(viewsets.ModelViewSet):
     def remove_product_by_slug(self, request, product_slug=None):
         """Remove product from user's wishlist by product slug"""
         try:
-            # Get user's wishlist
-            wishlist = WishList.objects.get(user=request.user)
-
             # Get product by slug
             product = get_object_or_404(Product, slug=product_slug, is_active=True)
 
-            # Remove product from wishlist
-            wishlist.products.remove(product)
+            # Only touch the wishlist when the product is actually in it
+            if is_wishlisted(request.user, product.id):
+                WishList.objects.get(user=request.user).products.remove(product)
 
             logger.info(f"Product {product.slug} removed from wishlist for user {request.user.username}")
 
@@ -587,25 +656,17 @@ class WishListViewSet(viewsets.ModelViewSet):
     def check_product(self, request, product_slug=None):
         """Check if a product is in user's wishlist"""
         try:
-            # Get user's wishlist
-            wishlist = WishList.objects.get(user=request.user)
-
-            # Get product by slug
-            product = get_object_or_404(Product, slug=product_slug, is_active=True)
-
-            # Check if product is in wishlist
-            is_in_wishlist = wishlist.products.filter(id=product.id).exists()
+            product_id = Product.objects.filter(
+                slug=product_slug, is_active=True
+            ).values_list('id', flat=True).first()
+            if product_id is None:
+                raise Product.DoesNotExist
 
             return Response({
-                'in_wishlist': is_in_wishlist,
+                'in_wishlist': is_wishlisted(request.user, product_id),
                 'product_slug': product_slug
             })
 
-        except WishList.DoesNotExist:
-            return Response({
-                'in_wishlist': False,
-                'product_slug': product_slug
-            })
         except Product.DoesNotExist:
             return Response(
                 {'error': 'Product not found'},
@@ -618,54 +679,79 @@ class WishListViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def check_products(self, request):
+        """Which of the comma separated product ``ids`` are in the user's wishlist"""
+        try:
+            product_ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            return Response(
+                {'error': 'ids must be a comma separated list of product ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(product_ids) > WISHLIST_CHECK_MAX_IDS:
+            return Response(
+                {'error': f'At most {WISHLIST_CHECK_MAX_IDS} ids can be checked at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({'wishlisted': sorted(wishlisted_among(request.user, product_ids))})
+
     @action(detail=False, methods=['get'])
     def by_seller(self, request):
-        """Get wishlist items grouped by seller"""
+        """
+        Get wishlist items grouped by seller, a page of sellers at a time.
+
+        Each seller comes with ``product_count`` and ``total_value`` and its
+        newest ``per_seller`` products; ``?seller=<id>`` pages through one
+        seller's products instead.
+        """
         try:
-            wishlist, created = WishList.objects.get_or_create(user=request.user)
+            if request.query_params.get('seller'):
+                return self.seller_page(request)
 
-            # Group products by seller
-            sellers_data = {}
-            for product in wishlist.products.select_related('student__user').all():
-                seller_id = product.student.id
-                seller_username = product.student.user.username
-
-                if seller_id not in sellers_data:
-                    sellers_data[seller_id] = {
-                        'seller': {
-                            'id': seller_id,
-                            'username': seller_username,
-                            'first_name': product.student.user.first_name,
-                            'last_name': product.student.user.last_name,
-                            'email': product.student.user.email,
-                            'date_joined': product.student.user.date_joined,
-                        },
-                        'products': []
-                    }
-
-                # Add product data
-                product_data = {
-                    'id': product.id,
-                    'title': product.title,
-                    'slug': product.slug,
-                    'price': product.price,
-                    'condition': product.condition,
-                    'image_url': request.build_absolute_uri(product.image.url) if product.image else None,
-                    'category_name': product.category.name,
-                    'created_at': product.created_at,
-                    'available_stock': product.stock - product.reserved_stock,
-                }
+            try:
+                per_seller = min(int(request.query_params.get('per_seller', WISHLIST_PRODUCTS_PER_SELLER)), 50)
+            except ValueError:
+                return Response(
+                    {'error': 'per_seller must be a number'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-                sellers_data[seller_id]['products'].append(product_data)
+            paginator = WishlistSellerPagination()
+            groups = paginator.paginate_queryset(seller_groups(request.user), request, view=self)
 
-            # Convert to list format
-            result = {
-                'sellers': list(sellers_data.values()),
-                'total_sellers': len(sellers_data),
-                'total_products': wishlist.products.count()
-            }
+            products = {}
+            for product in seller_products(request.user, [group['student_id'] for group in groups], per_seller):
+                products.setdefault(product['student_id'], []).append(
+                    self.seller_product_data(request, product)
+                )
 
-            return Response(result)
+            sellers = [
+                {
+                    'seller': {
+                        'id': group['student_id'],
+                        'username': group['student__user__username'],
+                        'first_name': group['student__user__first_name'],
+                        'last_name': group['student__user__last_name'],
+                        'email': group['student__user__email'],
+                        'date_joined': group['student__user__date_joined'],
+                    },
+                    'product_count': group['product_count'],
+                    'total_value': group['total_value'],
+                    'products': products.get(group['student_id'], []),
+                    'has_more_products': group['product_count'] > per_seller,
+                }
+                for group in groups
+            ]
+
+            return Response({
+                'sellers': sellers,
+                'total_sellers': paginator.page.paginator.count,
+                'total_products': wishlisted_products(request.user).count(),
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+            })
 
         except Exception as e:
             logger.error(f"Error fetching wishlist by seller: {str(e)}")
@@ -674,6 +760,42 @@ class WishListViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def seller_page(self, request):
+        """One page of a single seller's wishlisted products"""
+        try:
+            seller_id = int(request.query_params['seller'])
+        except ValueError:
+            return Response(
+                {'error': 'seller must be a seller id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        products = wishlisted_products(request.user).filter(
+            student_id=seller_id
+        ).order_by('-created_at', '-id').values(*SELLER_PRODUCT_FIELDS)
+
+        paginator = WishlistSellerPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        return paginator.get_paginated_response(
+            [self.seller_product_data(request, product) for product in page]
+        )
+
+    @staticmethod
+    def seller_product_data(request, product):
+        image = product['image']
+        storage = Product._meta.get_field('image').storage
+        return {
+            'id': product['id'],
+            'title': product['title'],
+            'slug': product['slug'],
+            'price': product['price'],
+            'condition': product['condition'],
+            'image_url': request.build_absolute_uri(storage.url(image)) if image else None,
+            'category_name': product['category__name'],
+            'created_at': product['created_at'],
+            'available_stock': product['stock'] - product['reserved_stock'],
+        }
+
 
 class ReviewViewSet(viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
@@ -690,61 +812,58 @@ class ReviewViewSet(viewsets.ModelViewSet):
 
 
 class SearchView(APIView):
+    """
+    Faceted product search.
+
+    Returns a page of products together with the total, category and
+    condition counts, the price range and a price histogram. Facets come
+    from two grouped queries and the whole response is cached per
+    normalized query.
+    """
     def get(self, request):
-        query = request.query_params.get('q', '')
-        category = request.query_params.get('category')
-        min_price = request.query_params.get('min_price')
-        max_price = request.query_params.get('max_price')
-        sort_by = request.query_params.get('sort_by', 'relevance')
-
-        # Base query
-        products = Product.objects.all()
-
-        # Apply filters
-        if query:
-            products = products.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query)
-            )
-
-        if category:
-            products = products.filter(category=category)
-
-        if min_price:
-            products = products.filter(price__gte=min_price)
-
-        if max_price:
-            products = products.filter(price__lte=max_price)
+        params = SearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        cache_key = get_search_cache_key(data)
+        cached_results = cache.get(cache_key)
+        if cached_results is not None:
+            return Response(cached_results)
+
+        # Relevance ranking comes from the configured search backend;
+        # filters are applied on top of the matching products
+        products = search_products(
+            query=data.get('q') or None,
+            filters={
+                'category': data.get('category'),
+                'min_price': data.get('min_price'),
+                'max_price': data.get('max_price'),
+                'condition': data.get('condition'),
+                'in_stock': data.get('in_stock'),
+            }
+        )
 
         # Apply sorting
+        sort_by = data['sort_by']
         if sort_by == 'price_asc':
-            products = products.order_by('price')
+            products = products.order_by('price', 'id')
         elif sort_by == 'price_desc':
-            products = products.order_by('-price')
+            products = products.order_by('-price', '-id')
         elif sort_by == 'newest':
-            products = products.order_by('-created_at')
-
-        # Get category aggregations
-        category_ids = products.values_list('category', flat=True).distinct()
-        categories = Category.objects.filter(
-            id__in=category_ids
-        ).annotate(
-            product_count=Count('products', filter=Q(products__id__in=products.values_list('id', flat=True)))
-        )
+            products = products.order_by('-created_at', '-id')
 
-        # Get price range
-        price_range = {
-            'min': products.order_by('price').first().price if products else 0,
-            'max': products.order_by('-price').first().price if products else 0
-        }
+        facets = search_facets(products)
 
+        page, page_size = data['page'], data['page_size']
+        offset = (page - 1) * page_size
         serializer = SearchResultSerializer({
-            'products': products,
-            'total_results': products.count(),
-            'categories': categories,
-            'price_range': price_range
+            'products': products[offset:offset + page_size],
+            'page': page,
+            'page_size': page_size,
+            **facets
         })
 
+        cache.set(cache_key, serializer.data, SEARCH_CACHE_TTL)
         return Response(serializer.data)
 
 
@@ -769,8 +888,6 @@ def get_recommendations(request):
         category__in=user_categories
     ).exclude(
         cartitem__cart__user=request.user
-    ).annotate(
-        avg_rating=Avg('reviews__rating')
     ).order_by('-avg_rating')[:10]
 
     serializer = ProductSerializer(recommended, many=True)
@@ -6,6 +6,7 @@ from django.db.models import Q
 from products.models import Product
 from products.serializers import ProductListSerializer
 from users.permissions import IsStudentOrAdmin
+from students.pagination import KeysetCursorPagination
 
 
 class TextbookViewSet(viewsets.ModelViewSet):
@@ -16,13 +17,14 @@ class TextbookViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'author', 'isbn', 'course_code', 'subject']
     ordering_fields = ['created_at', 'price', 'title']
     ordering = ['-created_at']
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         """Get textbooks (products with ISBN)"""
-        queryset = Product.objects.filter(
+        queryset = ProductListSerializer.setup_eager_loading(Product.objects.filter(
             is_active=True,
             isbn__isnull=False
-        ).exclude(isbn='')
+        ).exclude(isbn=''))
         
         # Filter by parameters
         title = self.request.query_params.get('title')
@@ -0,0 +1,301 @@
+"""
+Wishlist membership lookups.
+
+Each user's wishlisted product ids are mirrored in a store so membership
+checks never touch the wishlist tables. With the Redis cache the store is
+a Redis set per user, answered with ``SISMEMBER`` (pipelined for batch
+lookups); otherwise the ids are cached as one frozenset per user.
+
+The store is written through from ``WishList.products`` by the
+``m2m_changed`` receiver in ``marketplace.models`` once the change
+commits, so views only change the M2M. A set is loaded from the database
+the first time it is read; a sentinel member tells a loaded empty set
+from one that was never loaded, and every set expires after
+``WISHLIST_CACHE_TTL`` so a missed write heals on its own.
+
+``seller_groups`` and ``seller_products`` serve the wishlist grouped by
+seller: aggregates come from one ``GROUP BY`` and each seller's first
+products from one ``ROW_NUMBER()`` window query, however long the list.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum, Window
+from django.db.models.functions import RowNumber
+from products.models import Product
+from .models import WishList
+import logging
+
+logger = logging.getLogger(__name__)
+
+WISHLIST_CACHE_TTL = getattr(settings, 'WISHLIST_CACHE_TTL', 300)
+
+# Never a product id, so it can mark a set as loaded
+LOADED_SENTINEL = 0
+
+
+# Fields of each product listed under its seller
+SELLER_PRODUCT_FIELDS = (
+    'id', 'title', 'slug', 'price', 'condition', 'image',
+    'category__name', 'created_at', 'stock', 'reserved_stock', 'student_id',
+)
+
+
+def get_wishlist_cache_key(user_id):
+    return f'marketplace:wishlist_ids:{user_id}'
+
+
+def load_wishlisted_ids(user_id):
+    return frozenset(WishList.products.through.objects.filter(
+        wishlist__user_id=user_id
+    ).values_list('product_id', flat=True))
+
+
+class CacheWishlistStore:
+    """Frozenset per user in the Django cache; changes drop the entry"""
+
+    def members(self, user_id):
+        cache_key = get_wishlist_cache_key(user_id)
+        ids = cache.get(cache_key)
+        if ids is None:
+            ids = load_wishlisted_ids(user_id)
+            cache.set(cache_key, ids, WISHLIST_CACHE_TTL)
+        return ids
+
+    def contains_many(self, user_id, product_ids):
+        return self.members(user_id) & set(product_ids)
+
+    def add(self, user_id, product_ids):
+        self.invalidate(user_id)
+
+    def remove(self, user_id, product_ids):
+        self.invalidate(user_id)
+
+    def invalidate(self, user_id):
+        cache.delete(get_wishlist_cache_key(user_id))
+
+
+class RedisWishlistStore:
+    """
+    Redis set per user. Writes go straight to the set; a set that expired
+    or was never loaded lacks the sentinel and is reloaded on the next read.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def _load(self, user_id):
+        """
+        Fill the set from the database. The key is watched from before the
+        read, so a write that lands in between aborts the fill instead of
+        being overwritten by the older rows; the next read loads again.
+        """
+        from redis.exceptions import WatchError
+
+        key = get_wishlist_cache_key(user_id)
+        with self.connection.pipeline() as pipe:
+            pipe.watch(key)
+            if pipe.sismember(key, LOADED_SENTINEL):
+                # Another request loaded it first
+                pipe.unwatch()
+                return frozenset(int(member) for member in pipe.smembers(key)) - {LOADED_SENTINEL}
+            ids = load_wishlisted_ids(user_id)
+            pipe.multi()
+            pipe.delete(key)
+            pipe.sadd(key, LOADED_SENTINEL, *ids)
+            pipe.expire(key, WISHLIST_CACHE_TTL)
+            try:
+                pipe.execute()
+            except WatchError:
+                pass
+        return ids
+
+    def members(self, user_id):
+        members = {int(member) for member in self.connection.smembers(get_wishlist_cache_key(user_id))}
+        if LOADED_SENTINEL not in members:
+            return self._load(user_id)
+        return frozenset(members - {LOADED_SENTINEL})
+
+    def contains_many(self, user_id, product_ids):
+        product_ids = list(product_ids)
+        key = get_wishlist_cache_key(user_id)
+        pipe = self.connection.pipeline(transaction=False)
+        pipe.sismember(key, LOADED_SENTINEL)
+        for product_id in product_ids:
+            pipe.sismember(key, product_id)
+        loaded, *flags = pipe.execute()
+        if not loaded:
+            return self._load(user_id) & set(product_ids)
+        return {product_id for product_id, flag in zip(product_ids, flags) if flag}
+
+    def add(self, user_id, product_ids):
+        key = get_wishlist_cache_key(user_id)
+        pipe = self.connection.pipeline()
+        pipe.sadd(key, *product_ids)
+        pipe.expire(key, WISHLIST_CACHE_TTL)
+        pipe.execute()
+
+    def remove(self, user_id, product_ids):
+        self.connection.srem(get_wishlist_cache_key(user_id), *product_ids)
+
+    def invalidate(self, user_id):
+        self.connection.delete(get_wishlist_cache_key(user_id))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_wishlist_store():
+    """Redis sets when the default cache is django-redis, else the Django cache"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    from django_redis import get_redis_connection
+                    _store = RedisWishlistStore(get_redis_connection('default'))
+                except (ImportError, NotImplementedError):
+                    _store = CacheWishlistStore()
+    return _store
+
+
+def reset_wishlist_store():
+    global _store
+    _store = None
+
+
+def wishlisted_among(user, product_ids):
+    """The subset of ``product_ids`` in ``user``'s wishlist"""
+    if user is None or not user.is_authenticated:
+        return set()
+    try:
+        return get_wishlist_store().contains_many(user.pk, product_ids)
+    except Exception as e:
+        logger.warning(f"Wishlist store unavailable, reading the database: {str(e)}")
+        return load_wishlisted_ids(user.pk) & set(product_ids)
+
+
+def is_wishlisted(user, product_id):
+    return product_id in wishlisted_among(user, [product_id])
+
+
+def get_wishlisted_ids(request):
+    """
+    Ids of the products in the requesting user's wishlist, loaded once per
+    request so list serializers can check every product against them.
+    """
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+
+    ids = getattr(request, '_wishlisted_ids', None)
+    if ids is None:
+        try:
+            ids = get_wishlist_store().members(request.user.pk)
+        except Exception as e:
+            logger.warning(f"Wishlist store unavailable, reading the database: {str(e)}")
+            ids = load_wishlisted_ids(request.user.pk)
+        request._wishlisted_ids = ids
+    return ids
+
+
+def overlay_wishlisted(data, request):
+    """
+    Fill in ``is_wishlisted`` for the requesting user on serialized
+    products: one product, a list, or a paginated page. Cached product
+    payloads are shared by every user, so the flag is set after the cache
+    read rather than trusted from whoever filled the entry.
+    """
+    products = data.get('results', [data]) if isinstance(data, dict) else data
+    ids = get_wishlisted_ids(request)
+    for product in products:
+        if 'is_wishlisted' in product:
+            product['is_wishlisted'] = product['id'] in ids
+    return data
+
+
+def invalidate_wishlisted_ids(user):
+    get_wishlist_store().invalidate(user.pk)
+
+
+def sync_wishlist_change(instance, action, reverse, pk_set):
+    """
+    Mirror a ``WishList.products`` change into the store once the
+    transaction commits, so a rolled back change never reaches it.
+    ``instance`` is the wishlist, or the product when the change came from
+    ``product.wishlists``.
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove') and pk_set:
+            writes = [(action, instance.user_id, list(pk_set))]
+        elif action == 'post_clear':
+            writes = [(action, instance.user_id, [])]
+        else:
+            return
+    else:
+        if action == 'pre_clear':
+            # The affected wishlists are gone from the M2M after the clear
+            instance._wishlist_user_ids = list(instance.wishlists.values_list('user_id', flat=True))
+            return
+        if action == 'post_clear':
+            user_ids = getattr(instance, '_wishlist_user_ids', [])
+        elif action in ('post_add', 'post_remove') and pk_set:
+            user_ids = WishList.objects.filter(id__in=pk_set).values_list('user_id', flat=True)
+        else:
+            return
+        writes = [(action, user_id, [instance.pk]) for user_id in user_ids]
+    transaction.on_commit(lambda: write_store(writes))
+
+
+def write_store(writes):
+    """Apply ``(action, user id, product ids)`` changes to the store"""
+    store = get_wishlist_store()
+    try:
+        for action, user_id, product_ids in writes:
+            if action == 'post_add':
+                store.add(user_id, product_ids)
+            elif action == 'post_remove':
+                store.remove(user_id, product_ids)
+            else:
+                store.invalidate(user_id)
+    except Exception as e:
+        # Sets expire, so a missed write only lingers for one TTL
+        logger.warning(f"Could not update wishlist store: {str(e)}")
+
+
+def wishlisted_products(user):
+    return Product.objects.filter(wishlists__user_id=user.pk)
+
+
+def seller_groups(user):
+    """
+    One row per seller in ``user``'s wishlist with the seller's details,
+    ``product_count`` and ``total_value``, biggest groups first.
+    """
+    return wishlisted_products(user).values(
+        'student_id',
+        'student__user__username',
+        'student__user__first_name',
+        'student__user__last_name',
+        'student__user__email',
+        'student__user__date_joined',
+    ).annotate(
+        product_count=Count('id'),
+        total_value=Sum('price'),
+    ).order_by('-product_count', 'student_id')
+
+
+def seller_products(user, seller_ids, limit):
+    """
+    The newest ``limit`` wishlisted products of each seller in
+    ``seller_ids``, ranked per seller in the database.
+    """
+    return wishlisted_products(user).filter(student_id__in=seller_ids).annotate(
+        seller_rank=Window(
+            RowNumber(),
+            partition_by=F('student_id'),
+            order_by=[F('created_at').desc(), F('id').desc()],
+        )
+    ).filter(seller_rank__lte=limit).order_by('student_id', 'seller_rank').values(*SELLER_PRODUCT_FIELDS)
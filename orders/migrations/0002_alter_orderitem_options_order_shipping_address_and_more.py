@@ -0,0 +1,55 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+        ('products', '0003_product_is_draft'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='orderitem',
+            options={'verbose_name_plural': 'Shipping addresses'},
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='shipping_address',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='orders.shippingaddress'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, to='orders.order'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.PROTECT, to='products.product'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='refund',
+            name='order',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, to='orders.order'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shippingaddress',
+            name='user',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+            preserve_default=False,
+        ),
+    ]
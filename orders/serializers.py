@@ -1,7 +1,10 @@
+import uuid
 from decimal import Decimal
+from django.db import transaction
 from rest_framework import serializers
-from .models import Order
-from products.models import Product
+from .models import Order, OrderItem
+from products import reservations
+from products.models import Product, StockReservation
 from marketplace.serializers_marketplace import ProductSerializer
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -23,34 +26,59 @@ class OrderItemSerializer(serializers.Serializer):
     )
     product = ProductSerializer(read_only=True)
 
-    def validate_product_id(self, value):
-        try:
-            product = Product.objects.get(id=value)
-            return product
-        except Product.DoesNotExist:
-            raise serializers.ValidationError("Product not found")
-
 
 class OrderCreateSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True)
+    # Products are resolved and reserved in one pass in create()
+    items = OrderItemSerializer(many=True, write_only=True)
 
     class Meta:
         model = Order
         fields = ['items', 'shipping_address', 'payment_method', 'notes']
 
+    def validate_items(self, value):
+        if not value:
+            raise serializers.ValidationError("An order needs at least one item")
+        return value
+
     def create(self, validated_data):
+        """
+        Create the order and reserve stock for every item in one
+        transaction; nothing is written if any item is out of stock.
+        """
         items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
-        total_amount = 0
-        for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            price = product.price
-            quantity = item_data['quantity']
-            total = price * quantity
-            total_amount += total
-            order.items.create(product=product, quantity=quantity, price=price)
-        order.total_amount = total_amount
-        order.save()
+        validated_data.setdefault('reference', f'ORD-{uuid.uuid4().hex[:12].upper()}')
+
+        with transaction.atomic():
+            order = Order.objects.create(total_amount=0, **validated_data)
+            try:
+                _, products = reservations.reserve(
+                    [(item['product_id'], item['quantity']) for item in items_data],
+                    order=order,
+                    # The buyer's own checkout hold must not block their order
+                    replace=StockReservation.objects.filter(
+                        cart__user=order.user, order__isnull=True
+                    ) if order.user_id else None
+                )
+            except Product.DoesNotExist as e:
+                raise serializers.ValidationError({'items': [str(e)]})
+            except reservations.InsufficientStock as e:
+                raise serializers.ValidationError({'items': [
+                    f"Only {available} left of product {product_id}"
+                    for product_id, available in sorted(e.shortages.items())
+                ]})
+
+            order_items = [
+                OrderItem(
+                    order=order,
+                    product=products[item['product_id']],
+                    quantity=item['quantity'],
+                    price=products[item['product_id']].price
+                )
+                for item in items_data
+            ]
+            OrderItem.objects.bulk_create(order_items)
+            order.total_amount = sum(item.price * item.quantity for item in order_items)
+            order.save(update_fields=['total_amount'])
         return order
 
 
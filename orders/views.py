@@ -3,6 +3,8 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 # from django.shortcuts import get_object_or_404
+from students.pagination import KeysetCursorPagination
+from products import reservations
 from .models import Order
 from .serializers import (
     OrderCreateSerializer,
@@ -16,6 +18,7 @@ from .serializers import (
 
 class OrderViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user)
@@ -43,6 +46,8 @@ class OrderViewSet(viewsets.ModelViewSet):
             order.status = 'cancelled'
             order.cancellation_reason = serializer.validated_data['reason']
             order.save()
+            # Give the held stock back straight away rather than at expiry
+            reservations.release(order.stock_reservations.all())
             # Send cancellation notification
             order.send_cancellation_notification()
             return Response({'status': 'Order cancelled'})
@@ -131,4 +136,5 @@ class OrderViewSet(viewsets.ModelViewSet):
                 {'error': 'Only pending or cancelled orders can be deleted'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        reservations.release(order.stock_reservations.all())
         return super().destroy(request, *args, **kwargs)
@@ -3,7 +3,9 @@ from rest_framework.decorators import api_view, action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import permission_classes
 from rest_framework.response import Response
+from django.db import transaction as db_transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from .models import Transaction
 from .serializers import (
     MpesaPaymentSerializer,
@@ -16,11 +18,40 @@ from .serializers import (
 )
 from .mpesa import MpesaClient
 from orders.models import Order
+from products import reservations
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def mark_paid(order):
+    """
+    Record payment for ``order`` and sell its stock. If the stock hold
+    lapsed before payment and some lines can no longer be covered, the
+    order is still marked paid, since the money has been taken, but the
+    shortfall is written to its notes for staff to refund or restock.
+    Returns the shortfalls, or ``None`` if the order was already paid:
+    the status poll and the M-Pesa callback both report the same payment.
+    """
+    with db_transaction.atomic():
+        # Serialise concurrent confirmations of the same order on its row
+        order.refresh_from_db(from_queryset=Order.objects.select_for_update())
+        if order.payment_status:
+            return None
+        shortfalls = reservations.confirm_order(order)
+        order.payment_status = True
+        order.payment_date = timezone.now()
+        if shortfalls:
+            order.notes = '\n'.join(filter(None, [
+                order.notes,
+                'Paid after the stock hold expired; short of ' + ', '.join(
+                    f'{quantity} x product {product_id}' for product_id, quantity in shortfalls.items()
+                ),
+            ]))
+        order.save()
+    return shortfalls
+
+
 class PaymentViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = TransactionSerializer
@@ -100,9 +131,12 @@ class PaymentViewSet(viewsets.ModelViewSet):
                     if payment_status == 'completed':
                         transaction.status = 'completed'
                         transaction.save()
-                        # Update order status
-                        transaction.order.payment_status = 'paid'
-                        transaction.order.save()
+                        # Update order status and sell the reserved units
+                        if mark_paid(transaction.order):
+                            return Response({
+                                'status': 'Payment completed',
+                                'warning': 'Some items are no longer in stock'
+                            })
                         return Response({'status': 'Payment completed'})
                     return Response({
                         'status': status,
@@ -183,12 +217,11 @@ def mpesa_callback(request):
             transaction.status = 'completed'
             transaction.payment_details = callback_data
             transaction.save()
-            # Update order status
+            # Update order status and sell the reserved units
             order = transaction.order
-            order.payment_status = 'paid'
-            order.save()
-            # Send payment confirmation
-            order.send_payment_confirmation()
+            if mark_paid(order) == {}:
+                # Newly paid and fully sold: send payment confirmation
+                order.send_payment_confirmation()
         else:  # Failed
             transaction.status = 'failed'
             transaction.payment_details = callback_data
@@ -0,0 +1,21 @@
+"""
+Walking a table in primary key ranges.
+
+Backfills and repairs run one ``UPDATE`` per range rather than one over
+the whole table, so no statement holds its row locks for long.
+"""
+
+
+def id_range_batches(queryset, batch_size=1000):
+    """
+    Yield ``queryset`` narrowed to consecutive ranges of at most
+    ``batch_size`` ids, in id order.
+    """
+    ids = queryset.order_by('id').values_list('id', flat=True)
+    last_id = 0
+    while True:
+        batch = list(ids.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        yield queryset.filter(id__gte=batch[0], id__lte=batch[-1])
+        last_id = batch[-1]
@@ -0,0 +1,98 @@
+"""
+Set-based bulk product actions.
+
+Each action is one ``UPDATE`` over the seller's selected products. The
+rows are locked with ``select_for_update`` first and read back once the
+update has run, which gives the ids and slugs needed for cache
+invalidation, plus the new values published to the product change feed,
+on every database backend.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Greatest, Least, Round
+from django.utils import timezone
+from .feed import publish_change
+from .models import Product
+from .search import get_search_backend
+
+MIN_PRICE = Decimal('0.01')
+MAX_PRICE = Decimal('999999.99')
+# Fields that decide whether a product appears in search results
+SEARCH_FIELDS = {'is_active'}
+
+
+def update_returning(queryset, values, returning=('id', 'slug')):
+    """
+    Apply ``values`` to every row of ``queryset`` in a single UPDATE and
+    return the ``returning`` columns of the rows it changed, read back
+    after the update. ``returning`` must start with the primary key.
+    """
+    with transaction.atomic(using=queryset.db, savepoint=False):
+        ids = list(queryset.select_for_update().values_list('pk', flat=True))
+        if not ids:
+            return []
+        changed = queryset.model._base_manager.using(queryset.db).filter(pk__in=ids)
+        changed.update(**values)
+        return list(changed.values_list(*returning))
+
+
+def adjusted_price(amount=None, percent=None):
+    """Price expression shifted by ``amount`` or scaled by ``percent``, kept in range"""
+    output_field = DecimalField(max_digits=8, decimal_places=2)
+    if percent is not None:
+        price = F('price') * Value(1 + percent / 100, output_field=DecimalField())
+    else:
+        price = F('price') + Value(amount, output_field=output_field)
+    return Greatest(
+        Least(Round(price, 2, output_field=output_field), Value(MAX_PRICE, output_field=output_field)),
+        Value(MIN_PRICE, output_field=output_field),
+        output_field=output_field,
+    )
+
+
+def action_values(operation):
+    """Column values written by a validated bulk operation"""
+    action = operation['action']
+    now = timezone.now()
+    if action == 'activate':
+        values = {'is_active': True}
+    elif action == 'deactivate':
+        values = {'is_active': False}
+    elif action == 'feature':
+        values = {'featured': True}
+    elif action == 'unfeature':
+        values = {'featured': False}
+    elif action == 'delete':
+        # Soft delete: orders and reviews keep pointing at the product
+        values = {'is_active': False, 'featured': False}
+    elif action == 'price_adjust':
+        values = {'price': adjusted_price(operation.get('amount'), operation.get('percent'))}
+    elif action == 'set_stock':
+        # Never below what is already reserved
+        values = {
+            'stock': Greatest(Value(operation['stock']), F('reserved_stock')),
+            'last_stock_update': now,
+        }
+    else:
+        raise ValueError(f"Unknown bulk action '{action}'")
+    values['updated_at'] = now
+    return values
+
+
+def run_bulk_action(queryset, operation):
+    """Run one operation over ``queryset``; returns ``[(id, slug), ...]`` it changed"""
+    values = action_values(operation)
+    fields = [field for field in Product.FEED_FIELDS if field in values]
+    rows = update_returning(
+        queryset, values, returning=('id', 'slug', 'category_id', 'reserved_stock', *fields)
+    )
+    for product_id, _, category_id, reserved_stock, *new_values in rows:
+        changes = dict(zip(fields, new_values))
+        if 'stock' in changes:
+            changes['available_stock'] = max(0, changes['stock'] - reserved_stock)
+        publish_change(product_id, category_id, changes)
+    if rows and SEARCH_FIELDS.intersection(values):
+        get_search_backend().update_products([Product(pk=product_id) for product_id, *_ in rows])
+    return [(product_id, slug) for product_id, slug, *_ in rows]
@@ -0,0 +1,309 @@
+"""
+Bulk product import and export.
+
+Imports read a CSV or JSONL upload one row at a time, validate rows in
+chunks of ``PRODUCT_IMPORT_CHUNK_SIZE`` and write every valid row of a
+chunk with a handful of ``bulk_create`` calls: categories are resolved
+from one up-front query, SKUs are checked with one query per chunk and
+slugs are allocated for the whole chunk at once. Invalid rows are
+reported by row number and never block the rest of the file.
+
+Exports stream rows from ``QuerySet.iterator()`` straight into a
+``StreamingHttpResponse`` so the catalogue is never held in memory.
+"""
+import csv
+import io
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from .models import Category, Product, ProductVariant
+from .search import get_search_backend
+from .slugs import assign_unique_slugs
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = getattr(settings, 'PRODUCT_IMPORT_CHUNK_SIZE', 500)
+# Rows beyond this still count as failed but are left out of the report
+IMPORT_MAX_ERRORS = getattr(settings, 'PRODUCT_IMPORT_MAX_ERRORS', 1000)
+EXPORT_CHUNK_SIZE = getattr(settings, 'PRODUCT_EXPORT_CHUNK_SIZE', 2000)
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# CSV columns; variants are a JSON list in a single cell
+EXPORT_FIELDS = ['title', 'description', 'price', 'category', 'condition', 'stock', 'variants']
+
+
+class ProductImportVariantSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    sku = serializers.CharField(max_length=50)
+    price_adjustment = serializers.DecimalField(
+        max_digits=8, decimal_places=2, default=Decimal('0.00')
+    )
+    stock = serializers.IntegerField(min_value=0, default=0)
+
+
+class ProductImportSerializer(serializers.Serializer):
+    """
+    One imported row. ``category`` is an id or a name; categories and SKU
+    uniqueness are checked per chunk rather than per row.
+    """
+    title = serializers.CharField(max_length=100)
+    description = serializers.CharField()
+    price = serializers.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        min_value=Decimal('0.01'),
+        max_value=Decimal('999999.99')
+    )
+    category = serializers.CharField()
+    condition = serializers.ChoiceField(choices=Product.CONDITION_CHOICES, default='new')
+    stock = serializers.IntegerField(min_value=0, max_value=10000, default=1)
+    variants = ProductImportVariantSerializer(many=True, required=False)
+
+
+def detect_format(upload, requested=None):
+    fmt = (requested or '').lower()
+    if not fmt:
+        name = getattr(upload, 'name', '') or ''
+        fmt = 'jsonl' if name.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}', expected one of {', '.join(FORMATS)}")
+    return fmt
+
+
+NOT_UTF8_ERROR = {'non_field_errors': ['Row is not valid UTF-8']}
+
+
+def iter_csv(text):
+    """``(row_number, row, parse_error)`` for every CSV row, header excluded"""
+    reader = csv.DictReader(text)
+    # Row 1 is the header
+    number = 1
+    while True:
+        number += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield number, None, {'non_field_errors': [f'Unreadable CSV row: {str(e)}']}
+            continue
+        yield number, row, None
+
+
+def iter_rows(upload, fmt):
+    """
+    Yield ``(row_number, data, error)`` for every row of ``upload`` without
+    reading it into memory. ``error`` is set when a row cannot be parsed.
+    Bytes that are not UTF-8 fail their own row rather than the upload,
+    since earlier chunks may already be committed.
+    """
+    text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        if fmt == 'csv':
+            for number, row, error in iter_csv(text):
+                if error:
+                    yield number, None, error
+                    continue
+                if any('\ufffd' in value for value in row.values() if isinstance(value, str)):
+                    yield number, None, NOT_UTF8_ERROR
+                    continue
+                # Blank cells fall back to the serializer defaults
+                data = {key: value for key, value in row.items() if key and value not in ('', None)}
+                if 'variants' in data:
+                    try:
+                        data['variants'] = json.loads(data['variants'])
+                    except ValueError:
+                        yield number, None, {'variants': ['Must be a JSON list']}
+                        continue
+                yield number, data, None
+        else:
+            for number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                if '\ufffd' in line:
+                    yield number, None, NOT_UTF8_ERROR
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    yield number, None, {'non_field_errors': ['Invalid JSON']}
+                    continue
+                if not isinstance(data, dict):
+                    yield number, None, {'non_field_errors': ['Expected a JSON object']}
+                    continue
+                yield number, data, None
+    finally:
+        # Leave the upload open for Django to clean up
+        text.detach()
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ProductImporter:
+    """Import rows for ``student``; call ``run`` once per upload"""
+
+    def __init__(self, student, chunk_size=IMPORT_CHUNK_SIZE, max_errors=IMPORT_MAX_ERRORS):
+        self.student = student
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.seen_skus = set()
+        self.categories = {}
+        for category_id, name in Category.objects.values_list('id', 'name'):
+            self.categories[str(category_id)] = category_id
+            self.categories[name.lower()] = category_id
+
+    def run(self, rows):
+        for chunk in chunked(rows, self.chunk_size):
+            self.import_chunk(chunk)
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+    def add_error(self, number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'errors': errors})
+
+    def validate_chunk(self, chunk):
+        valid = []
+        for number, data, error in chunk:
+            if error:
+                self.add_error(number, error)
+                continue
+            serializer = ProductImportSerializer(data=data)
+            if not serializer.is_valid():
+                self.add_error(number, serializer.errors)
+                continue
+            row = serializer.validated_data
+            category_id = self.categories.get(str(row['category']).strip().lower())
+            if category_id is None:
+                self.add_error(number, {'category': [f"Unknown category '{row['category']}'"]})
+                continue
+            valid.append((number, row, category_id))
+
+        # One query for every SKU in the chunk
+        skus = {variant['sku'] for _, row, _ in valid for variant in row.get('variants', [])}
+        taken = set(ProductVariant.objects.filter(sku__in=skus).values_list('sku', flat=True))
+
+        accepted = []
+        for number, row, category_id in valid:
+            row_skus = [variant['sku'] for variant in row.get('variants', [])]
+            duplicates = sorted(
+                sku for sku in set(row_skus)
+                if sku in taken or sku in self.seen_skus or row_skus.count(sku) > 1
+            )
+            if duplicates:
+                self.add_error(number, {'variants': [f"SKU already exists: {', '.join(duplicates)}"]})
+                continue
+            self.seen_skus.update(row_skus)
+            accepted.append((number, row, category_id))
+        return accepted
+
+    def import_chunk(self, chunk):
+        accepted = self.validate_chunk(chunk)
+        if not accepted:
+            return
+
+        products, variants = [], []
+        for _, row, category_id in accepted:
+            products.append(Product(
+                title=row['title'],
+                description=row['description'],
+                price=row['price'],
+                category_id=category_id,
+                condition=row['condition'],
+                stock=row['stock'],
+                student=self.student,
+            ))
+            variants.append([ProductVariant(**variant) for variant in row.get('variants', [])])
+
+        Through = Product.variants.through
+        try:
+            with transaction.atomic():
+                assign_unique_slugs(products)
+                Product.objects.bulk_create(products)
+                ProductVariant.objects.bulk_create([v for group in variants for v in group])
+                Through.objects.bulk_create([
+                    Through(product_id=product.id, productvariant_id=variant.id)
+                    for product, group in zip(products, variants)
+                    for variant in group
+                ])
+                # bulk_create skips the save signals that keep search in step
+                get_search_backend().update_products(products)
+        except IntegrityError as e:
+            # A slug or SKU was claimed by a concurrent write; the chunk rolled back
+            logger.warning(f"Product import chunk rolled back: {str(e)}")
+            for number, _, _ in accepted:
+                self.add_error(number, {'non_field_errors': ['Conflicted with a concurrent change, please retry']})
+            return
+
+        self.created += len(products)
+
+
+def import_products(upload, student, fmt=None):
+    """Import a CSV or JSONL upload for ``student`` and return a summary"""
+    return ProductImporter(student).run(iter_rows(upload, detect_format(upload, fmt)))
+
+
+class Echo:
+    """File-like object whose ``write`` hands back what it was given"""
+
+    def write(self, value):
+        return value
+
+
+def export_row(product):
+    return {
+        'title': product.title,
+        'description': product.description,
+        'price': str(product.price),
+        'category': product.category.name,
+        'condition': product.condition,
+        'stock': product.stock,
+        'variants': [
+            {
+                'name': variant.name,
+                'sku': variant.sku,
+                'price_adjustment': str(variant.price_adjustment),
+                'stock': variant.stock,
+            }
+            for variant in product.variants.all()
+        ],
+    }
+
+
+def export_products(queryset, fmt='csv'):
+    """Yield ``queryset`` as CSV or JSONL text, fetched in chunks"""
+    products = queryset.select_related('category').prefetch_related('variants').order_by('id')
+    rows = (export_row(product) for product in products.iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+    if fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(row) + '\n'
+        return
+
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        row['variants'] = json.dumps(row['variants']) if row['variants'] else ''
+        yield writer.writerow(row)
@@ -0,0 +1,172 @@
+"""
+Tagged cache keys for product data.
+
+Every tag (``products``, ``categories``, ``search`` or a single
+``product:<id>``) has a version token stored in the cache, and keys embed
+the tokens of the tags they depend on. Invalidating a tag just writes a
+new token, so stale entries become unreachable without scanning the
+keyspace and expire on their own TTL. Invalidating many tags at once is a
+single ``set_many`` call.
+
+``read_through`` wraps expensive cache fills with single-flight locking,
+probabilistic early refresh and optional stale-while-revalidate.
+"""
+import math
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Cache configuration
+CACHE_TTL = getattr(settings, 'PRODUCT_CACHE_TTL', 3600)  # 1 hour default
+CACHE_PREFIX = 'products:'
+# Extra time an expired entry may be served while one worker rebuilds it
+CACHE_STALE_TTL = getattr(settings, 'PRODUCT_CACHE_STALE_TTL', 60)
+CACHE_LOCK_TIMEOUT = getattr(settings, 'PRODUCT_CACHE_LOCK_TIMEOUT', 10)
+# Version tokens outlive every entry keyed on them; an expired token is
+# replaced by a fresh one, which only costs a cold cache for that tag
+CACHE_VERSION_TTL = getattr(settings, 'PRODUCT_CACHE_VERSION_TTL', 7 * 24 * 3600)
+
+# Tags shared by every product listing, the category list and search results
+PRODUCTS_TAG = 'products'
+CATEGORIES_TAG = 'categories'
+SEARCH_TAG = 'search'
+
+
+def product_tag(identifier):
+    """Tag for a single product, keyed by id or slug"""
+    return f'product:{identifier}'
+
+
+def get_version_key(tag):
+    return f'{CACHE_PREFIX}version:{tag}'
+
+
+def new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(tags):
+    """Current version token of each tag, fetched in one round trip"""
+    keys = {get_version_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    versions = {keys[key]: value for key, value in found.items()}
+
+    for key, tag in keys.items():
+        if tag not in versions:
+            # First use (or evicted): start a fresh version. A random token
+            # keeps entries written under an evicted version unreachable.
+            cache.add(key, new_version(), CACHE_VERSION_TTL)
+            versions[tag] = cache.get(key)
+    return versions
+
+
+def get_cache_key(prefix, identifier, tags=()):
+    """
+    Generate cache key with prefix. Keys given ``tags`` are versioned and
+    stop matching as soon as any of those tags is invalidated.
+    """
+    key = f'{CACHE_PREFIX}{prefix}:{identifier}'
+    if not tags:
+        return key
+    versions = get_versions(tags)
+    return key + ':' + '.'.join(str(versions[tag]) for tag in tags)
+
+
+def invalidate_tags(*tags):
+    """Invalidate every key tagged with any of ``tags`` in one cache call"""
+    if tags:
+        version = new_version()
+        cache.set_many({get_version_key(tag): version for tag in set(tags)}, CACHE_VERSION_TTL)
+
+
+def invalidate_products(*products):
+    """
+    Invalidate listings, category counts and search results, plus the
+    detail entries of ``products`` (instances or ``(id, slug)`` pairs).
+    """
+    tags = [PRODUCTS_TAG, CATEGORIES_TAG, SEARCH_TAG]
+    for product in products:
+        product_id, slug = (product.pk, product.slug) if hasattr(product, 'pk') else product
+        tags.append(product_tag(product_id))
+        if slug:
+            tags.append(product_tag(slug))
+    invalidate_tags(*tags)
+
+
+def invalidate_categories():
+    """Category changes alter the category list and every product listing"""
+    invalidate_tags(PRODUCTS_TAG, CATEGORIES_TAG, SEARCH_TAG)
+
+
+def _acquire_lock(key, timeout):
+    token = new_version()
+    if cache.add(f'{key}:lock', token, timeout):
+        return token
+    return None
+
+
+def _release_lock(key, token):
+    lock_key = f'{key}:lock'
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def _refresh(key, compute, ttl, stale_ttl):
+    started = time.monotonic()
+    value = compute()
+    envelope = {
+        'value': value,
+        'delta': time.monotonic() - started,
+        'expires': time.time() + ttl,
+    }
+    cache.set(key, envelope, ttl + stale_ttl)
+    return value
+
+
+def read_through(key, compute, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, beta=1.0,
+                 lock_timeout=CACHE_LOCK_TIMEOUT, wait_interval=0.05):
+    """
+    Return the cached value for ``key``, calling ``compute()`` to fill it.
+
+    Only one worker recomputes a key at a time (a ``cache.add`` lock).
+    Fresh entries are refreshed early with probability rising towards
+    expiry, scaled by how long ``compute`` took (XFetch). For ``stale_ttl``
+    seconds after expiry the old value is served to everyone except the
+    worker holding the lock. A cold key makes other workers wait up to
+    ``lock_timeout`` for the winner before computing it themselves.
+    """
+    envelope = cache.get(key)
+    if envelope is not None:
+        now = time.time()
+        expires, delta = envelope['expires'], envelope['delta']
+        early = now - delta * beta * math.log(1.0 - random.random()) >= expires
+        if now < expires and not early:
+            return envelope['value']
+
+        token = _acquire_lock(key, lock_timeout)
+        if token is None:
+            # Someone else is rebuilding; the current value is good enough
+            return envelope['value']
+        try:
+            return _refresh(key, compute, ttl, stale_ttl)
+        finally:
+            _release_lock(key, token)
+
+    deadline = time.monotonic() + lock_timeout
+    while True:
+        token = _acquire_lock(key, lock_timeout)
+        if token is not None:
+            try:
+                return _refresh(key, compute, ttl, stale_ttl)
+            finally:
+                _release_lock(key, token)
+
+        time.sleep(wait_interval)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope['value']
+        if time.monotonic() >= deadline:
+            return compute()
@@ -0,0 +1,169 @@
+"""
+Product change feed.
+
+Products remember the price, stock and active flag they were loaded with
+(``Product.from_db``). Saving one publishes just the fields that changed;
+bulk actions publish the values their ``UPDATE ... RETURNING`` hands back.
+Changes wait ``PRODUCT_FEED_WINDOW`` seconds so bursts to one product are
+merged into a single event, then go to the channel layer groups of the
+product and of its category. ``MarketplaceConsumer`` clients join only the
+groups of what they render.
+"""
+import threading
+import uuid
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField
+import logging
+
+logger = logging.getLogger(__name__)
+
+FEED_WINDOW = getattr(settings, 'PRODUCT_FEED_WINDOW', 0.5)
+
+
+def product_group(product_id):
+    return f'products.product.{product_id}'
+
+
+def category_group(category_id):
+    return f'products.category.{category_id}'
+
+
+def field_value(product, field):
+    """Current value of ``field``, decimals at their declared places"""
+    value = getattr(product, field)
+    model_field = product._meta.get_field(field)
+    if isinstance(model_field, DecimalField) and value is not None:
+        value = Decimal(value).quantize(Decimal(1).scaleb(-model_field.decimal_places))
+    return value
+
+
+def take_snapshot(product, fields=None):
+    """
+    Remember the feed fields of ``product`` (those in ``fields``, if given)
+    as the base for the next diff.
+    """
+    from .models import Product
+
+    snapshot = getattr(product, '_feed_snapshot', {})
+    snapshot.update({
+        field: field_value(product, field)
+        for field in Product.FEED_FIELDS
+        if fields is None or field in fields
+    })
+    product._feed_snapshot = snapshot
+
+
+def changed_fields(product, fields=None):
+    """
+    Feed fields (of those in ``fields``, if given) whose value differs from
+    the snapshot, with their new values.
+    """
+    before = getattr(product, '_feed_snapshot', None)
+    if not before:
+        return {}
+    changes = {}
+    for field, value in before.items():
+        if fields is None or field in fields:
+            current = field_value(product, field)
+            if current != value:
+                changes[field] = current
+    if 'stock' in changes:
+        changes['available_stock'] = product.available_stock
+    return changes
+
+
+def encode(changes):
+    # Channel layers serialise with msgpack, which has no Decimal
+    return {
+        field: str(value) if isinstance(value, Decimal) else value
+        for field, value in changes.items()
+    }
+
+
+class ProductChangePublisher:
+    """
+    Collect changes per product and send them after ``window`` seconds,
+    later values winning. With no window every change is sent at once.
+    """
+
+    def __init__(self, window=FEED_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+
+    def publish(self, product_id, category_id, changes):
+        if not changes:
+            return
+        with self._lock:
+            entry = self._pending.setdefault(product_id, {'changes': {}})
+            entry['category_id'] = category_id
+            entry['changes'].update(encode(changes))
+            if self.window > 0 and self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if self.window <= 0:
+            self.flush()
+
+    def flush(self):
+        """Send everything pending; returns the number of products sent"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        if not pending:
+            return 0
+
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return 0
+        try:
+            async_to_sync(self._send)(channel_layer, pending)
+        except Exception as e:
+            # The feed is best effort; clients resync on reconnect
+            logger.warning(f"Could not publish changes for {len(pending)} products: {str(e)}")
+            return 0
+        return len(pending)
+
+    async def _send(self, channel_layer, pending):
+        for product_id, entry in pending.items():
+            event = {
+                'type': 'product.changed',
+                # Lets clients in both groups drop the second copy
+                'event_id': uuid.uuid4().hex,
+                'product_id': product_id,
+                'category_id': entry['category_id'],
+                'changes': entry['changes'],
+            }
+            await channel_layer.group_send(product_group(product_id), event)
+            if entry['category_id']:
+                await channel_layer.group_send(category_group(entry['category_id']), event)
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = ProductChangePublisher()
+    return _publisher
+
+
+def reset_publisher():
+    global _publisher
+    _publisher = None
+
+
+def publish_change(product_id, category_id, changes):
+    """Publish ``changes`` to a product once the current transaction commits"""
+    if changes:
+        transaction.on_commit(lambda: get_publisher().publish(product_id, category_id, changes))
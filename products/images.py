@@ -0,0 +1,245 @@
+"""
+Product image pipeline.
+
+Uploads are re-encoded once with Pillow: orientation from EXIF is applied
+and every metadata block (EXIF, GPS, comments) is dropped. The encoded
+file is spooled to disk past ``SPOOL_SIZE`` and handed to the storage
+backend in chunks, so a request never holds a whole image in memory.
+
+Resized WebP and JPEG variants are rendered off the request path on a
+thread pool and recorded on ``Product.image_variants`` as
+``{format: {width: name}}``. List serializers pick the smallest variant
+that covers the requested width.
+"""
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WIDTHS = tuple(getattr(settings, 'PRODUCT_IMAGE_WIDTHS', (320, 640, 1280)))
+IMAGE_QUALITY = getattr(settings, 'PRODUCT_IMAGE_QUALITY', 82)
+IMAGE_WORKERS = getattr(settings, 'PRODUCT_IMAGE_WORKERS', 4)
+CARD_WIDTH = getattr(settings, 'PRODUCT_IMAGE_CARD_WIDTH', 320)
+SPOOL_SIZE = 1024 * 1024
+
+# Variant format -> Pillow encoder
+VARIANT_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+# Source formats kept as-is when sanitizing; anything else becomes JPEG
+KEPT_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def get_executor(name='variants'):
+    """
+    Shared thread pools. Jobs (one per uploaded image) and the variant
+    renders they fan out to use separate pools so a busy job pool can
+    never starve its own renders.
+    """
+    if name not in _executors:
+        with _executors_lock:
+            if name not in _executors:
+                _executors[name] = ThreadPoolExecutor(
+                    max_workers=IMAGE_WORKERS if name == 'variants' else 1,
+                    thread_name_prefix=f'product-images-{name}',
+                )
+    return _executors[name]
+
+
+def open_image(file):
+    """Decode ``file`` with orientation applied, or raise ``InvalidImage``"""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        file.seek(0)
+        image = Image.open(file)
+        image.load()
+        source_format = image.format
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        raise InvalidImage(str(e))
+    image.format = source_format
+    return image
+
+
+def encode(image, pil_format):
+    """Encode ``image`` without metadata into a spooled temporary file"""
+    from PIL import Image
+
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # Flatten transparency onto white rather than black
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+
+    options = {}
+    if pil_format in ('JPEG', 'WEBP'):
+        options['quality'] = IMAGE_QUALITY
+    if pil_format == 'JPEG':
+        options['optimize'] = True
+        options['progressive'] = True
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    # No exif/icc/comment arguments: Pillow writes none of the source metadata
+    image.save(output, format=pil_format, **options)
+    output.seek(0)
+    return output
+
+
+def store_image(file, directory='product_images', storage=None):
+    """
+    Sanitize an uploaded image and stream it to storage.
+
+    Returns ``(name, width, height)``.
+    """
+    storage = storage or default_storage
+    image = open_image(file)
+    pil_format = image.format if image.format in KEPT_FORMATS else 'JPEG'
+    extension = KEPT_FORMATS[pil_format]
+
+    output = encode(image, pil_format)
+    try:
+        name = storage.save(
+            f"{directory.rstrip('/')}/{uuid.uuid4()}.{extension}", File(output)
+        )
+    finally:
+        output.close()
+    return name, image.width, image.height
+
+
+def variant_name(name, width, fmt):
+    root, _ = os.path.splitext(name)
+    return f'{root}_{width}w.{fmt}'
+
+
+def variant_names(name):
+    """Every variant name ``generate_variants`` can produce for ``name``"""
+    return [variant_name(name, width, fmt) for fmt in VARIANT_FORMATS for width in IMAGE_WIDTHS]
+
+
+def _render_variant(image, name, width, fmt, storage):
+    from PIL import Image
+
+    target = min(width, image.width)
+    height = max(1, round(image.height * target / image.width))
+    resized = image.resize((target, height), Image.Resampling.LANCZOS) if target != image.width else image
+    output = encode(resized, VARIANT_FORMATS[fmt])
+    try:
+        path = variant_name(name, width, fmt)
+        if storage.exists(path):
+            storage.delete(path)
+        return storage.save(path, File(output))
+    finally:
+        output.close()
+
+
+def generate_variants(name, storage=None):
+    """
+    Render every configured width in every variant format for the stored
+    image ``name``. Widths above the original are capped at its width.
+
+    Returns ``(variants, (width, height))``.
+    """
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as file:
+        image = open_image(file)
+
+    executor = get_executor()
+    futures = {
+        (fmt, width): executor.submit(_render_variant, image, name, width, fmt, storage)
+        for fmt in VARIANT_FORMATS
+        for width in IMAGE_WIDTHS
+    }
+    variants = {fmt: {} for fmt in VARIANT_FORMATS}
+    for (fmt, width), future in futures.items():
+        variants[fmt][str(width)] = future.result()
+    return variants, image.size
+
+
+def delete_variants(name, storage=None):
+    storage = storage or default_storage
+    for path in variant_names(name):
+        if storage.exists(path):
+            storage.delete(path)
+
+
+def process_product_image(product_id):
+    """Render variants for a product's current image and record them"""
+    from .models import Product
+
+    name = Product.objects.filter(pk=product_id).values_list('image', flat=True).first()
+    if not name:
+        return None
+    try:
+        variants, (width, height) = generate_variants(name)
+    except (InvalidImage, OSError) as e:
+        logger.error(f"Could not render variants for product {product_id}: {str(e)}")
+        return None
+
+    # The image may have been replaced while rendering; keep the newer job's result
+    Product.objects.filter(pk=product_id, image=name).update(
+        image_variants=variants, image_width=width, image_height=height
+    )
+    return variants
+
+
+def _run_job(func, *args):
+    try:
+        func(*args)
+    except Exception as e:
+        logger.error(f"Image job {func.__name__} failed: {str(e)}")
+    finally:
+        connection.close()
+
+
+def run_in_background(func, *args):
+    """Run ``func`` on the image pool, or inline when PRODUCT_IMAGE_ASYNC is off"""
+    if not getattr(settings, 'PRODUCT_IMAGE_ASYNC', True):
+        return func(*args)
+    get_executor('jobs').submit(_run_job, func, *args)
+
+
+def schedule_product_image(product_id):
+    """Render variants once the transaction that saved the image commits"""
+    transaction.on_commit(lambda: run_in_background(process_product_image, product_id))
+
+
+def pick_variant(variants, width=CARD_WIDTH, fmt='webp'):
+    """Smallest stored variant at least ``width`` wide, else the largest one"""
+    sizes = (variants or {}).get(fmt)
+    if not sizes:
+        return None
+    widths = sorted(int(size) for size in sizes)
+    chosen = next((size for size in widths if size >= width), widths[-1])
+    return sizes[str(chosen)]
+
+
+def requested_variant(request):
+    """``(width, format)`` asked for with ``?image_width=`` and ``?image_format=``"""
+    params = getattr(request, 'query_params', request.GET)
+    try:
+        width = int(params.get('image_width', CARD_WIDTH))
+    except (TypeError, ValueError):
+        width = CARD_WIDTH
+    fmt = params.get('image_format', 'webp')
+    if fmt not in VARIANT_FORMATS:
+        fmt = 'webp'
+    return width, fmt
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from products.view_counts import flush_views, prune_view_tracks
+
+
+class Command(BaseCommand):
+    help = "Apply buffered product views to Product.views_count now rather than at the next inline flush"
+
+    def handle(self, *args, **options):
+        counted = flush_views()
+        pruned = prune_view_tracks()
+        self.stdout.write(self.style.SUCCESS(f'Counted {counted} product views, pruned {pruned} old view tracks'))
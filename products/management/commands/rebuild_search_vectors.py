@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from products.batching import id_range_batches
+from products.models import Product
+from products.search import refresh_search_vectors, search_vector_supported
+
+
+class Command(BaseCommand):
+    help = "Backfill Product.search_vector for existing products"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of products updated per UPDATE statement',
+        )
+
+    def handle(self, *args, **options):
+        if not search_vector_supported():
+            self.stdout.write(self.style.WARNING(
+                'Stored search vectors are only used on PostgreSQL, nothing to do'
+            ))
+            return
+
+        batch_size = options['batch_size']
+        # One UPDATE per id range keeps each statement short
+        updated = sum(
+            refresh_search_vectors(batch) for batch in id_range_batches(Product.objects.all(), batch_size)
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search vectors for {updated} products'))
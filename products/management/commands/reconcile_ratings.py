@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from products.batching import id_range_batches
+from products.models import Product
+from products.ratings import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute Product rating aggregates from marketplace reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of products updated per UPDATE statement',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # One UPDATE per id range keeps each statement short
+        updated = sum(
+            reconcile_ratings(batch) for batch in id_range_batches(Product.objects.all(), batch_size)
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'Reconciled ratings for {updated} products'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from products.reservations import RELEASE_BATCH_SIZE, release_expired
+from products.sweeper import SWEEP_INTERVAL
+
+
+class Command(BaseCommand):
+    help = "Release stock held by expired cart and order reservations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=RELEASE_BATCH_SIZE,
+            help='Number of reservations released per transaction',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep sweeping every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=SWEEP_INTERVAL,
+            help='Seconds between sweeps with --loop',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Released {released} reserved units'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
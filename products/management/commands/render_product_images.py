@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from products.images import process_product_image
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Render resized image variants for products that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-render variants for every product with an image',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='')
+        if not options['all']:
+            products = products.filter(image_variants={})
+
+        rendered = 0
+        for product_id in products.order_by('id').values_list('id', flat=True).iterator():
+            if process_product_image(product_id):
+                rendered += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered image variants for {rendered} products'))
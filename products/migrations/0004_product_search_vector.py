@@ -0,0 +1,56 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:02
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    """GIN indexes only exist on PostgreSQL; other backends skip them."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_search_vector_gin '
+        'ON products_product USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_title_trgm '
+        'ON products_product USING gin (title gin_trgm_ops)'
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS product_title_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS product_search_vector_gin')
+
+
+def backfill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "UPDATE products_product AS p SET search_vector = "
+        "setweight(to_tsvector(coalesce(p.title, '')), 'A') || "
+        "setweight(to_tsvector(coalesce(p.description, '')), 'B') || "
+        "setweight(to_tsvector(coalesce(c.name, '')), 'C') "
+        "FROM products_category AS c WHERE c.id = p.category_id"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_is_draft'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:15
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('marketplace', 'Review')
+
+    def aggregate(expression):
+        return Coalesce(Subquery(
+            Review.objects.filter(product=OuterRef('pk'))
+            .values('product').annotate(value=expression).values('value'),
+            output_field=IntegerField()
+        ), 0)
+
+    rating_sum, rating_count = aggregate(Sum('rating')), aggregate(Count('id'))
+    Product.objects.update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        avg_rating=Coalesce(
+            Cast(rating_sum, FloatField()) / NullIf(rating_count, 0),
+            0.0,
+            output_field=FloatField()
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_productviewtrack'),
+        ('marketplace', '0004_auto_20250602_0422'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-avg_rating', '-id'], name='product_rating_id_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
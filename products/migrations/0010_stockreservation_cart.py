@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0004_auto_20250602_0422'),
+        ('products', '0009_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockreservation',
+            name='cart',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_reservations', to='marketplace.cart'),
+        ),
+        migrations.AlterField(
+            model_name='stockreservation',
+            name='order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_reservations', to='orders.order'),
+        ),
+    ]
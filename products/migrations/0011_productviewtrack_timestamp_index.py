@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_stockreservation_cart'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productviewtrack',
+            index=models.Index(fields=['timestamp'], name='product_view_track_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_anonymous_tracks(apps, schema_editor):
+    """Keep only the latest anonymous track per product and address."""
+    ProductViewTrack = apps.get_model('products', 'ProductViewTrack')
+
+    duplicates = ProductViewTrack.objects.filter(user__isnull=True).values('product_id', 'ip_address').annotate(
+        tracks=Count('id'), keep=Max('id')
+    ).filter(tracks__gt=1)
+
+    for duplicate in duplicates:
+        ProductViewTrack.objects.filter(
+            user__isnull=True, product_id=duplicate['product_id'], ip_address=duplicate['ip_address']
+        ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_productviewtrack_timestamp_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_anonymous_tracks, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productviewtrack',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('product', 'ip_address'), name='unique_anonymous_product_view'),
+        ),
+    ]
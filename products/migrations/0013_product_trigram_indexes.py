@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:40
+
+from django.db import migrations
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Trigram indexes for the remaining similarity fields; PostgreSQL only."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_description_trgm '
+        'ON products_product USING gin (description gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS category_name_trgm '
+        'ON products_category USING gin (name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS category_name_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS product_description_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_productviewtrack_unique_anonymous'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
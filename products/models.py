@@ -1,14 +1,21 @@
 from decimal import Decimal
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.conf import settings
 from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.db.models import F
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.contrib.postgres.search import SearchVectorField
+from .slugs import unique_slug
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Attempts at saving a product whose generated slug is taken concurrently
+SLUG_RETRIES = 3
+
 
 def validate_image_size(value):
     """Validate image size (max 5MB)"""
@@ -166,6 +173,11 @@ class Product(models.Model):
         blank=True,
         validators=[validate_image_size]
     )
+    # Filled in by products.images: dimensions of the sanitized upload and
+    # the names of its resized variants, {format: {width: name}}
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     slug = models.SlugField(max_length=200, unique=True, blank=True)
     stock = models.PositiveIntegerField(default=1)
     reserved_stock = models.PositiveIntegerField(default=0)
@@ -182,11 +194,24 @@ class Product(models.Model):
     # Draft functionality
     is_draft = models.BooleanField(default=False)
     last_sale_date = models.DateTimeField(null=True, blank=True)
-    # average_rating = models.DecimalField(
-    #     max_digits=3,
-    #     decimal_places=2,
-    #     default=0.00
-    # )
+    # Weighted full-text document (title A, description B, category C).
+    # Maintained by products.signals and the rebuild_search_vectors command.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Review aggregates. Maintained with F() updates by products.signals
+    # and repaired by the reconcile_ratings command.
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    avg_rating = models.FloatField(default=0, editable=False)
+
+    RATING_FIELDS = ('rating_sum', 'rating_count', 'avg_rating')
+    # Only ever written in place (ratings, products.reservations), so saving
+    # a stale instance must not touch them
+    IN_PLACE_FIELDS = RATING_FIELDS + ('reserved_stock',)
+    # Left out of a plain save(): the in-place counters, and the search
+    # vector, which only products.search writes
+    UNSAVED_FIELDS = IN_PLACE_FIELDS + ('search_vector',)
+    # Reported to websocket clients by products.feed when they change
+    FEED_FIELDS = ('price', 'stock', 'is_active')
 
     class Meta:
         ordering = ['-created_at']
@@ -196,32 +221,72 @@ class Product(models.Model):
             models.Index(fields=['created_at']),
             models.Index(fields=['price']),
             models.Index(fields=['stock']),
+            # Keyset pagination on (created_at, id) and (price, id)
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['-avg_rating', '-id'], name='product_rating_id_idx'),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Loaded feed fields, diffed by products.feed after the next save
+        instance._feed_snapshot = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.FEED_FIELDS
+        }
+        return instance
+
     def save(self, *args, **kwargs):
         # Generate slug if not provided
         """
         Save the product instance. If the slug is not set, it
-        is automatically generated from the title. Also validates
-        that reserved stock does not exceed total stock.
+        is automatically generated from the title (see
+        ``products.slugs``). Also validates that reserved stock
+        does not exceed total stock.
+
+        A plain ``save()`` of an existing product writes every concrete
+        field except ``UNSAVED_FIELDS``: the rating and reservation
+        counters are only changed in place by their writers, and the
+        search vector only by ``products.search``. Pass ``update_fields``
+        explicitly to write those.
 
         Raises:
             ValidationError: If reserved stock exceeds total stock.
         """
-        if not self.slug:
-            base_slug = slugify(self.title)
-            unique_slug = base_slug
-            counter = 1
-            while Product.objects.filter(slug=unique_slug).exists():
-                unique_slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = unique_slug
+        generated_slug = not self.slug
+        if generated_slug:
+            self.slug = unique_slug(self.title, Product.objects.all())
 
         # Validate stock levels
         if self.reserved_stock > self.stock:
             raise ValidationError("Reserved stock cannot exceed total stock")
 
-        super().save(*args, **kwargs)
+        # A stale instance must not write back counters changed in place
+        # since it was loaded, nor an outdated search vector
+        if not self._state.adding and not args and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.UNSAVED_FIELDS
+            ]
+
+        if not generated_slug:
+            super().save(*args, **kwargs)
+            return
+
+        # Another save may claim the same slug between the lookup and the
+        # insert; pick the next free one and try again
+        for attempt in range(SLUG_RETRIES):
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if attempt == SLUG_RETRIES - 1 or \
+                        not Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
+                    raise
+                self.slug = unique_slug(self.title, Product.objects.all())
 
     def __str__(self):
         """
@@ -243,38 +308,35 @@ class Product(models.Model):
         return self.available_stock > 0
 
     def reserve_stock(self, quantity=1):
-        """Reserve product stock"""
+        """
+        Reserve product stock without an expiry. Checkouts should use
+        ``products.reservations.reserve`` so abandoned holds are released.
+        """
         if quantity > self.available_stock:
             raise ValidationError("Not enough stock available")
-        success = Product.objects.filter(
-            id=self.id,
-            stock__gte=F('reserved_stock') + quantity
-        ).update(
-            reserved_stock=F('reserved_stock') + quantity,
-            last_stock_update=timezone.now()
-        )
-        if success:
-            self.refresh_from_db()
-            logger.info(f"Reserved {quantity} units of product {self.id}")
-            return True
-        return False
+        return self._shift_reserved_stock(quantity, stock__gte=F('reserved_stock') + quantity)
 
     def release_stock(self, quantity=1):
         """Release reserved stock"""
         if quantity > self.reserved_stock:
             raise ValidationError("Cannot release more stock than reserved")
-        success = Product.objects.filter(
-            id=self.id,
-            reserved_stock__gte=quantity
-        ).update(
-            reserved_stock=F('reserved_stock') - quantity,
-            last_stock_update=timezone.now()
+        return self._shift_reserved_stock(-quantity, reserved_stock__gte=quantity)
+
+    def _shift_reserved_stock(self, delta, **condition):
+        # Locked conditional UPDATE that reads the new values back
+        from .bulk_actions import update_returning
+
+        rows = update_returning(
+            Product.objects.filter(id=self.id, **condition),
+            {'reserved_stock': F('reserved_stock') + delta, 'last_stock_update': timezone.now()},
+            returning=('id', 'stock', 'reserved_stock')
         )
-        if success:
-            self.refresh_from_db()
-            logger.info(f"Released {quantity} units of product {self.id}")
-            return True
-        return False
+        if not rows:
+            return False
+        _, self.stock, self.reserved_stock = rows[0]
+        action = 'Reserved' if delta > 0 else 'Released'
+        logger.info(f"{action} {abs(delta)} units of product {self.id}")
+        return True
 
     def update_stock(self, quantity):
         """Update total stock with validation"""
@@ -286,20 +348,41 @@ class Product(models.Model):
         logger.info(f"Updated stock to {quantity} for product {self.id}")
 
     def increment_views(self):
-        """Increment product view count"""
+        """
+        Increment product view count immediately. Request handlers should
+        use ``products.view_counts.record_view`` so views are buffered.
+        """
         Product.objects.filter(id=self.id).update(
             views_count=F('views_count') + 1
         )
 
+    @classmethod
+    def adjust_rating(cls, product_id, rating_delta, count_delta):
+        """
+        Apply a review change to the stored rating aggregates in a single
+        UPDATE, so concurrent reviews never overwrite each other.
+        """
+        rating_sum = F('rating_sum') + rating_delta
+        rating_count = F('rating_count') + count_delta
+        cls.objects.filter(id=product_id).update(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            avg_rating=Coalesce(
+                Cast(rating_sum, models.FloatField()) / NullIf(rating_count, 0),
+                0.0,
+                output_field=models.FloatField()
+            )
+        )
+
     @property
     def average_rating(self):
         """Get average product rating"""
-        return self.reviews.aggregate(models.Avg('rating'))['rating__avg'] or 0
+        return self.avg_rating
 
     @property
     def review_count(self):
         """Get total number of reviews"""
-        return self.reviews.count()
+        return self.rating_count
 
     def clean(self):
         """Additional model validation"""
@@ -309,3 +392,63 @@ class Product(models.Model):
             raise ValidationError({'stock': 'Stock cannot be negative'})
         if self.reserved_stock > self.stock:
             raise ValidationError({'reserved_stock': 'Reserved stock cannot exceed total stock'})
+
+
+class StockReservation(models.Model):
+    """
+    Units of a product held for a cart in checkout or an unpaid order until
+    ``expires_at``. Held units are counted in ``Product.reserved_stock``;
+    ``products.reservations`` creates, confirms and releases reservations
+    and the sweeper releases them once expired.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    # SET_NULL: deleting the cart or order must not drop the hold before
+    # its units are given back
+    cart = models.ForeignKey(
+        'marketplace.Cart',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_reservations'
+    )
+    order = models.ForeignKey(
+        'orders.Order',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_reservations'
+    )
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['expires_at']
+        indexes = [
+            models.Index(fields=['product', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} until {self.expires_at}"
+
+
+class ProductViewTrack(models.Model):
+    """Last counted view of a product per viewer, used to deduplicate views"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='view_tracks')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    ip_address = models.GenericIPAddressField()
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('product', 'user', 'ip_address')
+        constraints = [
+            # NULLs never collide in unique_together, so anonymous viewers are keyed on address alone
+            models.UniqueConstraint(
+                fields=['product', 'ip_address'], condition=models.Q(user__isnull=True),
+                name='unique_anonymous_product_view'
+            ),
+        ]
+        indexes = [
+            # Pruning deletes by age
+            models.Index(fields=['timestamp'], name='product_view_track_ts_idx'),
+        ]
@@ -0,0 +1,44 @@
+"""
+Stored review aggregates on ``Product``.
+
+``rating_sum``, ``rating_count`` and ``avg_rating`` are kept up to date
+incrementally by ``products.signals`` (see ``Product.adjust_rating``).
+Writes that bypass signals, such as ``QuerySet.update()`` or
+``bulk_create()`` on reviews, are repaired with ``reconcile_ratings``.
+"""
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+from marketplace.models import Review
+from .models import Product
+
+
+def review_aggregate(expression, output_field):
+    """Correlated subquery aggregating the reviews of the outer product"""
+    return Coalesce(
+        Subquery(
+            Review.objects.filter(product=OuterRef('pk'))
+            .values('product')
+            .annotate(value=expression)
+            .values('value'),
+            output_field=output_field
+        ),
+        0,
+        output_field=output_field
+    )
+
+
+def reconcile_ratings(queryset=None):
+    """Recompute the rating aggregates of ``queryset`` from its reviews"""
+    if queryset is None:
+        queryset = Product.objects.all()
+    rating_sum = review_aggregate(Sum('rating'), IntegerField())
+    rating_count = review_aggregate(Count('id'), IntegerField())
+    return queryset.update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        avg_rating=Coalesce(
+            Cast(rating_sum, FloatField()) / NullIf(rating_count, 0),
+            0.0,
+            output_field=FloatField()
+        )
+    )
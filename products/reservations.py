@@ -0,0 +1,243 @@
+"""
+Multi-item stock reservations.
+
+``reserve`` holds stock for a whole cart in one transaction: the product
+rows are locked with ``SELECT ... FOR UPDATE`` in id order, so two
+checkouts touching the same products always queue instead of
+deadlocking, and every quantity is added to ``reserved_stock`` with a
+single ``UPDATE``. Either every line is reserved or none is.
+
+Reservations belong to a cart in checkout (``hold_cart``) or to an order
+and expire after ``STOCK_RESERVATION_TTL`` seconds. Expired reservations
+on the products being reserved are released first, so abandoned
+checkouts never block a sale; ``release_expired`` releases the rest in
+batches and is run by ``products.sweeper``. An order paid after its hold
+lapsed is sold from whatever stock is still free (``confirm_order``).
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from marketplace.models import CartItem
+from .models import Product, StockReservation
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60)
+RELEASE_BATCH_SIZE = getattr(settings, 'STOCK_RESERVATION_RELEASE_BATCH_SIZE', 500)
+
+
+class InsufficientStock(Exception):
+    """Raised with ``shortages``: ``{product_id: available}`` for every short line"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(
+            'Not enough stock for products: ' + ', '.join(map(str, sorted(shortages)))
+        )
+
+
+def _quantity_case(quantities):
+    return Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def _lock_products(product_ids):
+    """Lock product rows in id order and return them by id"""
+    return {
+        product.id: product
+        for product in Product.objects.select_for_update().filter(
+            id__in=product_ids
+        ).order_by('id').only('id', 'title', 'price', 'stock', 'reserved_stock', 'is_active')
+    }
+
+
+def _settle(reservations, sell=False, lock_products=True):
+    """
+    Release the reservations in the queryset ``reservations`` or, with
+    ``sell``, take their units out of stock too. Products are locked before
+    reservations, the same order ``reserve`` uses. Returns the settled
+    ``{product_id: quantity}``.
+    """
+    if lock_products:
+        _lock_products(set(reservations.values_list('product_id', flat=True)))
+    locked = list(reservations.select_for_update())
+    quantities = Counter()
+    for reservation in locked:
+        quantities[reservation.product_id] += reservation.quantity
+    if not quantities:
+        return quantities
+
+    case = _quantity_case(quantities)
+    values = {
+        'reserved_stock': Greatest(F('reserved_stock') - case, Value(0)),
+        'last_stock_update': timezone.now(),
+    }
+    if sell:
+        values['stock'] = Greatest(F('stock') - case, Value(0))
+    Product.objects.filter(id__in=quantities).update(**values)
+    StockReservation.objects.filter(id__in=[reservation.id for reservation in locked]).delete()
+    return quantities
+
+
+def reserve(items, order=None, cart=None, ttl=None, replace=None):
+    """
+    Reserve ``items`` (``{product_id: quantity}`` or ``(product_id,
+    quantity)`` pairs) for ``order`` or ``cart`` until ``ttl`` seconds from
+    now. Reservations in the queryset ``replace`` are released first, under
+    the same locks.
+
+    Returns ``(reservations, products)`` with the locked products by id.
+    Raises ``InsufficientStock`` when any line cannot be covered, and
+    ``Product.DoesNotExist`` for unknown or inactive products.
+    """
+    quantities = Counter()
+    for product_id, quantity in (items.items() if isinstance(items, dict) else items):
+        quantities[product_id] += quantity
+    ttl = RESERVATION_TTL if ttl is None else ttl
+    now = timezone.now()
+
+    with transaction.atomic():
+        if replace is not None:
+            # Lock every product involved in one ordered pass
+            replaced_ids = set(replace.values_list('product_id', flat=True))
+            products = _lock_products(set(quantities) | replaced_ids)
+            for product_id, quantity in _settle(replace, lock_products=False).items():
+                products[product_id].reserved_stock -= quantity
+            products = {product_id: products[product_id] for product_id in quantities if product_id in products}
+        else:
+            products = _lock_products(quantities)
+        missing = [product_id for product_id in quantities
+                   if product_id not in products or not products[product_id].is_active]
+        if missing:
+            raise Product.DoesNotExist(
+                'Products not found: ' + ', '.join(map(str, sorted(missing)))
+            )
+
+        # Reclaim lapsed holds on these products before checking availability
+        released = _settle(
+            StockReservation.objects.filter(product_id__in=quantities, expires_at__lte=now),
+            lock_products=False
+        )
+        for product_id, quantity in released.items():
+            products[product_id].reserved_stock = max(0, products[product_id].reserved_stock - quantity)
+
+        shortages = {
+            product_id: products[product_id].available_stock
+            for product_id, quantity in quantities.items()
+            if products[product_id].available_stock < quantity
+        }
+        if shortages:
+            raise InsufficientStock(shortages)
+
+        Product.objects.filter(id__in=quantities).update(
+            reserved_stock=F('reserved_stock') + _quantity_case(quantities),
+            last_stock_update=now
+        )
+        reservations = StockReservation.objects.bulk_create([
+            StockReservation(
+                product_id=product_id,
+                order=order,
+                cart=cart,
+                quantity=quantity,
+                expires_at=now + timedelta(seconds=ttl)
+            )
+            for product_id, quantity in sorted(quantities.items())
+        ])
+        for product_id, quantity in quantities.items():
+            products[product_id].reserved_stock += quantity
+
+    logger.info(f"Reserved {sum(quantities.values())} units across {len(quantities)} products")
+    return reservations, products
+
+
+def hold_cart(cart, ttl=None):
+    """
+    Hold stock for everything in ``cart`` while its owner checks out,
+    replacing the cart's previous hold.
+    """
+    items = CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity')
+    return reserve(
+        list(items),
+        cart=cart,
+        ttl=ttl,
+        replace=StockReservation.objects.filter(cart=cart, order__isnull=True)
+    )
+
+
+def release(reservations):
+    """Release a queryset of reservations early, e.g. when an order is cancelled"""
+    with transaction.atomic():
+        return sum(_settle(reservations).values())
+
+
+def confirm(reservations):
+    """
+    Turn a queryset of reservations into sales: the held units leave both
+    ``stock`` and ``reserved_stock`` and the reservations are deleted.
+    """
+    with transaction.atomic():
+        return sum(_settle(reservations, sell=True).values())
+
+
+def confirm_order(order):
+    """
+    Sell everything on a paid ``order``. Units still held by its
+    reservations are confirmed; lines whose hold already expired (a slow
+    payment callback) are taken from available stock with a conditional
+    ``UPDATE`` instead. Returns ``{product_id: quantity}`` for the lines
+    that could not be covered, empty when the whole order was sold.
+    """
+    from orders.models import OrderItem
+
+    quantities = Counter()
+    for product_id, quantity in OrderItem.objects.filter(order=order).values_list('product_id', 'quantity'):
+        quantities[product_id] += quantity
+    reservations = StockReservation.objects.filter(order=order)
+
+    with transaction.atomic():
+        _lock_products(set(quantities) | set(reservations.values_list('product_id', flat=True)))
+        sold = _settle(reservations, sell=True, lock_products=False)
+        # Lapsed holds by other buyers must not block a paid order
+        _settle(
+            StockReservation.objects.filter(product_id__in=quantities, expires_at__lte=timezone.now()),
+            lock_products=False
+        )
+        shortfalls = {}
+        for product_id, quantity in sorted((quantities - sold).items()):
+            taken = Product.objects.filter(
+                id=product_id, stock__gte=F('reserved_stock') + quantity
+            ).update(stock=F('stock') - quantity, last_stock_update=timezone.now())
+            if not taken:
+                shortfalls[product_id] = quantity
+
+    if shortfalls:
+        logger.error(f"Order {order.id} was paid after its hold expired and is short of {shortfalls}")
+    return shortfalls
+
+
+def release_expired(batch_size=RELEASE_BATCH_SIZE, now=None):
+    """
+    Release every reservation that has expired, ``batch_size`` at a time,
+    each batch in its own short transaction. Returns the units released.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        ids = list(StockReservation.objects.filter(
+            expires_at__lte=now
+        ).order_by('expires_at').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return released
+        with transaction.atomic():
+            released += sum(_settle(
+                StockReservation.objects.filter(id__in=ids, expires_at__lte=now)
+            ).values())
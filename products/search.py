@@ -1,11 +1,212 @@
+from django.conf import settings
 from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank, TrigramSimilarity
-from django.db.models import Q, F, Avg, FloatField
-from django.db.models.functions import Greatest
-from .models import Product
+from django.db import connection, transaction
+from django.db.models import (
+    Q, F, FloatField, IntegerField, OuterRef, Subquery, Case, When, Value, Count, Min, Max
+)
+from django.db.models.functions import Greatest, Least, Floor, Cast
+from django.utils.module_loading import import_string
+from .models import Product, Category
+from .search_engine import ProductIndex
+
+# Upper bound on ranked ids the in-process engine hands back to the ORM
+MAX_INDEX_RESULTS = getattr(settings, 'PRODUCT_SEARCH_MAX_RESULTS', 1000)
+# Number of buckets in the price histogram facet
+PRICE_BUCKETS = getattr(settings, 'PRODUCT_SEARCH_PRICE_BUCKETS', 5)
+# Fields compared by trigram similarity, for queries with typos
+TRIGRAM_FIELDS = ('title', 'description', 'category__name')
+
+
+def search_vector_supported():
+    """The stored search vector is only populated on PostgreSQL"""
+    return connection.vendor == 'postgresql'
+
+
+def product_search_vector():
+    """
+    Build the weighted document stored in ``Product.search_vector``.
+
+    The category name is pulled in through a correlated subquery so the
+    expression can be used in a plain ``UPDATE`` without a join.
+    """
+    category_name = Subquery(
+        Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1]
+    )
+    return (
+        SearchVector('title', weight='A')
+        + SearchVector('description', weight='B')
+        + SearchVector(category_name, weight='C')
+    )
+
+
+def refresh_search_vectors(queryset=None):
+    """
+    Recompute the stored search vector for every product in ``queryset``
+    with a single UPDATE. Returns the number of rows updated.
+    """
+    if not search_vector_supported():
+        return 0
+    if queryset is None:
+        queryset = Product.objects.all()
+    return queryset.update(search_vector=product_search_vector())
+
+
+class BaseSearchBackend:
+    """
+    Search backends narrow a product queryset down to the rows matching
+    ``query`` and order it by relevance, exposing the score as
+    ``search_score``.
+    """
+
+    def apply(self, queryset, query):
+        raise NotImplementedError
+
+    def update_product(self, product):
+        """Called after a product is saved"""
+
+    def update_products(self, products):
+        """Called after products are created in bulk, bypassing save signals"""
+        for product in products:
+            self.update_product(product)
+
+    def remove_product(self, product_id):
+        """Called after a product is deleted"""
+
+    def refresh_category(self, category):
+        """Called after a category is renamed"""
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Full-text search against the stored ``Product.search_vector``"""
+
+    def apply(self, queryset, query):
+        # Rank against the stored, GIN-indexed vector instead of rebuilding
+        # the document (and joining to category) for every row.
+        search_query = SearchQuery(query)
+        rank = SearchRank(F('search_vector'), search_query)
+        # Typos are matched against the same fields the vector covers
+        similarity = Greatest(
+            *[TrigramSimilarity(field, query) for field in TRIGRAM_FIELDS],
+            output_field=FloatField()
+        )
+        matches = Q(search_vector=search_query)
+        for field in TRIGRAM_FIELDS:
+            matches |= Q(**{f'{field}__trigram_similar': query})
+
+        # Every branch of the filter is index-backed: ``@@`` uses the search
+        # vector GIN index and each ``%`` a trigram index on its column.
+        return queryset.filter(matches).annotate(
+            search_rank=rank,
+            similarity=similarity,
+            search_score=Greatest(F('search_rank'), F('similarity'), output_field=FloatField())
+        ).order_by('-search_score')
+
+    def update_product(self, product):
+        refresh_search_vectors(Product.objects.filter(pk=product.pk))
+
+    def update_products(self, products):
+        refresh_search_vectors(Product.objects.filter(pk__in=[product.pk for product in products]))
+
+    def refresh_category(self, category):
+        refresh_search_vectors(Product.objects.filter(category=category))
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """
+    BM25 search over an in-process inverted index, for databases without
+    PostgreSQL full-text search.
+    """
+
+    def __init__(self):
+        self.index = ProductIndex(
+            max_age=getattr(settings, 'PRODUCT_SEARCH_INDEX_MAX_AGE', 300)
+        )
+
+    def apply(self, queryset, query):
+        ranked = self.index.search(query)
+        if not ranked:
+            return queryset.none()
+        if len(ranked) > MAX_INDEX_RESULTS:
+            ranked = self.top_matches(queryset, ranked, MAX_INDEX_RESULTS)
+
+        score = Case(
+            *[When(id=product_id, then=Value(value)) for product_id, value in ranked],
+            default=Value(0.0),
+            output_field=FloatField()
+        )
+        return queryset.filter(
+            id__in=[product_id for product_id, _ in ranked]
+        ).annotate(search_score=score).order_by('-search_score', '-id')
+
+    def top_matches(self, queryset, ranked, limit):
+        """
+        The best ``limit`` of ``ranked`` that ``queryset`` (already
+        filtered by category, price and so on) admits. Matches are checked
+        a chunk at a time in rank order, so a narrow filter still finds
+        results ranked past the cutoff.
+        """
+        scores = dict(ranked)
+        admitted = []
+        for start in range(0, len(ranked), limit):
+            chunk = [product_id for product_id, _ in ranked[start:start + limit]]
+            found = set(queryset.filter(id__in=chunk).values_list('id', flat=True))
+            admitted.extend(product_id for product_id in chunk if product_id in found)
+            if len(admitted) >= limit:
+                break
+        return [(product_id, scores[product_id]) for product_id in admitted[:limit]]
+
+    # Index changes wait for the commit so rolled back writes never show up
+    def update_product(self, product):
+        transaction.on_commit(lambda: self.index.update_product(product))
+
+    def update_products(self, products):
+        # Rows are read back in one query at commit, not a category lookup each
+        product_ids = [product.pk for product in products]
+        transaction.on_commit(lambda: self.index.reindex(product_ids))
+
+    def remove_product(self, product_id):
+        transaction.on_commit(lambda: self.index.remove_product(product_id))
+
+    def refresh_category(self, category):
+        def reindex():
+            for product in Product.objects.filter(category=category).select_related('category'):
+                self.index.update_product(product)
+        transaction.on_commit(reindex)
+
+
+SEARCH_BACKENDS = {
+    'postgres': 'products.search.PostgresSearchBackend',
+    'inmemory': 'products.search.InMemorySearchBackend',
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Return the configured search backend.
+
+    ``PRODUCT_SEARCH_BACKEND`` may be ``'postgres'``, ``'inmemory'`` or a
+    dotted path to a ``BaseSearchBackend`` subclass. When unset, the
+    backend follows the database vendor.
+    """
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+        if name is None:
+            name = 'postgres' if search_vector_supported() else 'inmemory'
+        _backend = import_string(SEARCH_BACKENDS.get(name, name))()
+    return _backend
+
+
+def reset_search_backend():
+    """Forget the configured backend so the next search re-reads settings"""
+    global _backend
+    _backend = None
 
 
 class ProductSearch:
-    """Product search with PostgreSQL full-text search"""
+    """Product search delegating relevance ranking to the search backend"""
     def __init__(self, query=None, filters=None):
         self.query = query
         self.filters = filters or {}
@@ -13,34 +214,12 @@ class ProductSearch:
     def get_base_queryset(self):
         return Product.objects.select_related(
             'category', 'student', 'student__user'
-        ).prefetch_related('reviews').filter(is_active=True)
+        ).prefetch_related('reviews').filter(is_active=True).defer('search_vector')
 
     def apply_search(self, queryset):
         if not self.query:
             return queryset
-
-        vector = SearchVector('title', weight='A') + \
-                 SearchVector('description', weight='B') + \
-                 SearchVector('category__name', weight='C')
-        
-        search_query = SearchQuery(self.query)
-        rank = SearchRank(vector, search_query)
-        
-        similarities = [
-            TrigramSimilarity('title', self.query),
-            TrigramSimilarity('description', self.query),
-            TrigramSimilarity('category__name', self.query)
-        ]
-        
-        combined_similarity = Greatest(*similarities)
-        
-        return queryset.annotate(
-            search_rank=rank,
-            similarity=combined_similarity,
-            search_score=Greatest(F('search_rank'), F('similarity'), output_field=FloatField())
-        ).filter(
-            Q(search_rank__gte=0.3) | Q(similarity__gte=0.3)
-        ).order_by('-search_score')
+        return get_search_backend().apply(queryset, self.query)
 
     def apply_filters(self, queryset):
         if category_id := self.filters.get('category'):
@@ -70,20 +249,20 @@ class ProductSearch:
         elif sort_by == 'price_desc':
             return queryset.order_by('-price')
         elif sort_by == 'rating':
-            return queryset.annotate(avg_rating=Avg('reviews__rating')).order_by('-avg_rating')
+            return queryset.order_by('-avg_rating', '-id')
         elif sort_by == 'popularity':
             return queryset.order_by('-views_count')
         
         return queryset.order_by('-created_at')
 
     def search(self):
-        queryset = self.get_base_queryset()
+        # Filters first: backends may cut the matches down to the best few,
+        # which must be chosen among the rows the filters admit
+        queryset = self.apply_filters(self.get_base_queryset())
         
         if self.query:
             queryset = self.apply_search(queryset)
         
-        queryset = self.apply_filters(queryset)
-        
         if not self.query:
             queryset = self.apply_sorting(queryset)
         
@@ -93,3 +272,79 @@ class ProductSearch:
 def search_products(query=None, filters=None):
     searcher = ProductSearch(query, filters)
     return searcher.search()
+
+
+def search_facets(queryset, bucket_count=PRICE_BUCKETS):
+    """
+    Compute search facets for ``queryset`` with two grouped queries.
+
+    The first groups by (category, condition) and yields the total, the
+    category and condition counts and the price range; the second groups
+    by price bucket once the range is known.
+    """
+    groups = list(
+        queryset.order_by().values(
+            'category_id', 'category__name', 'category__slug', 'condition'
+        ).annotate(
+            count=Count('id'),
+            min_price=Min('price'),
+            max_price=Max('price')
+        )
+    )
+
+    categories = {}
+    conditions = {}
+    for group in groups:
+        category = categories.setdefault(group['category_id'], {
+            'id': group['category_id'],
+            'name': group['category__name'],
+            'slug': group['category__slug'],
+            'product_count': 0,
+        })
+        category['product_count'] += group['count']
+        conditions[group['condition']] = conditions.get(group['condition'], 0) + group['count']
+
+    total = sum(group['count'] for group in groups)
+    min_price = min((group['min_price'] for group in groups), default=0)
+    max_price = max((group['max_price'] for group in groups), default=0)
+    condition_labels = dict(Product.CONDITION_CHOICES)
+
+    return {
+        'total_results': total,
+        'categories': sorted(categories.values(), key=lambda c: (-c['product_count'], c['name'])),
+        'conditions': [
+            {'value': value, 'label': condition_labels.get(value, value), 'count': count}
+            for value, count in sorted(conditions.items(), key=lambda item: -item[1])
+        ],
+        'price_range': {'min': min_price, 'max': max_price},
+        'price_histogram': price_histogram(queryset, min_price, max_price, bucket_count) if total else [],
+    }
+
+
+def price_histogram(queryset, min_price, max_price, bucket_count=PRICE_BUCKETS):
+    """Count products per equal-width price bucket between the bounds"""
+    if min_price == max_price:
+        return [{'min': min_price, 'max': max_price, 'count': queryset.count()}]
+
+    width = (max_price - min_price) / bucket_count
+    # The top price would land in bucket ``bucket_count``; fold it into the last one
+    bucket = Least(
+        Cast(
+            Floor(Cast(F('price') - Value(min_price), FloatField()) / float(width)),
+            IntegerField()
+        ),
+        Value(bucket_count - 1)
+    )
+    counts = dict(
+        queryset.order_by().annotate(bucket=bucket).values('bucket').annotate(
+            count=Count('id')
+        ).values_list('bucket', 'count')
+    )
+    return [
+        {
+            'min': round(min_price + width * index, 2),
+            'max': round(min_price + width * (index + 1), 2),
+            'count': counts.get(index, 0),
+        }
+        for index in range(bucket_count)
+    ]
@@ -0,0 +1,332 @@
+"""
+In-process full-text search engine for products.
+
+Used by the ``inmemory`` search backend on databases without PostgreSQL
+full-text search (e.g. the default SQLite setup). Products are kept in an
+inverted index ranked with BM25; query terms that are not in the
+vocabulary are expanded to similar terms using trigram similarity, the
+same measure ``pg_trgm`` uses, so typos still find results.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+STOP_WORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+})
+
+# Per-field boosts, mirroring the A/B/C weights of the PostgreSQL vector
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'category': 2.0,
+    'description': 1.0,
+}
+
+
+def tokenize(text):
+    """Lowercase ``text`` and split it into indexable terms"""
+    if not text:
+        return []
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+def trigrams(term):
+    """Trigrams of ``term`` padded the way pg_trgm pads words"""
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """
+    Thread-safe inverted index with BM25 ranking and trigram fuzzy matching.
+
+    Documents are dicts of field name to text; only fields listed in
+    ``FIELD_WEIGHTS`` are indexed.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, similarity_threshold=0.3, max_expansions=5):
+        self.k1 = k1
+        self.b = b
+        self.similarity_threshold = similarity_threshold
+        self.max_expansions = max_expansions
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.postings = defaultdict(dict)    # term -> {doc_id: weighted tf}
+            self.doc_terms = {}                  # doc_id -> Counter of weighted tf
+            self.doc_lengths = {}                # doc_id -> weighted length
+            self.gram_index = defaultdict(set)   # trigram -> terms
+            self.total_length = 0.0
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_terms
+
+    def add(self, doc_id, fields):
+        """Index (or re-index) a document"""
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields.get(field)):
+                terms[token] += weight
+
+        with self._lock:
+            self._remove(doc_id)
+            if not terms:
+                return
+            self.doc_terms[doc_id] = terms
+            length = sum(terms.values())
+            self.doc_lengths[doc_id] = length
+            self.total_length += length
+            for term, tf in terms.items():
+                if term not in self.postings:
+                    for gram in trigrams(term):
+                        self.gram_index[gram].add(term)
+                self.postings[term][doc_id] = tf
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+                for gram in trigrams(term):
+                    self.gram_index[gram].discard(term)
+                    if not self.gram_index[gram]:
+                        del self.gram_index[gram]
+
+    def expand(self, token):
+        """
+        Map a query token to ``[(term, weight)]``.
+
+        Exact vocabulary hits get full weight; otherwise the closest terms by
+        trigram similarity above the threshold are used, weighted by it.
+        """
+        if token in self.postings:
+            return [(token, 1.0)]
+
+        grams = trigrams(token)
+        overlap = Counter()
+        for gram in grams:
+            for term in self.gram_index.get(gram, ()):
+                overlap[term] += 1
+
+        candidates = []
+        for term, shared in overlap.items():
+            union = len(grams) + len(trigrams(term)) - shared
+            similarity = shared / union
+            if similarity >= self.similarity_threshold:
+                candidates.append((term, similarity))
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return candidates[:self.max_expansions]
+
+    def search(self, query, limit=None):
+        """Return ``[(doc_id, score)]`` best first"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            doc_count = len(self.doc_terms)
+            if not doc_count:
+                return []
+            avg_length = self.total_length / doc_count
+            scores = defaultdict(float)
+
+            for token in tokens:
+                for term, weight in self.expand(token):
+                    docs = self.postings[term]
+                    df = len(docs)
+                    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                    for doc_id, tf in docs.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                        scores[doc_id] += weight * idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit] if limit else ranked
+
+
+class ProductIndex:
+    """
+    Process-wide product index built lazily from ``Product`` rows.
+
+    Product saves and deletes in this process update it incrementally (see
+    ``products.signals``); ``max_age`` bounds how stale it can get from
+    writes made by other processes before it is rebuilt. Only the first
+    build blocks a request; later rebuilds run on a background thread
+    while searches keep using the current index. Changes made while a
+    rebuild reads the table are replayed onto the new index before it
+    replaces the current one, so none are lost in the swap.
+    """
+
+    def __init__(self, max_age=300, background=True):
+        self.max_age = max_age
+        self.background = background
+        self.index = InvertedIndex()
+        self.built_at = None
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+        # Changes applied during a rebuild, or None when none is running
+        self._changes = None
+        self._changes_lock = threading.Lock()
+
+    @property
+    def is_built(self):
+        return self.built_at is not None
+
+    def is_stale(self):
+        if not self.is_built:
+            return True
+        return bool(self.max_age) and time.monotonic() - self.built_at > self.max_age
+
+    def rebuild(self):
+        with self._changes_lock:
+            self._changes = []
+        try:
+            index = self._build()
+            with self._changes_lock:
+                for change in self._changes:
+                    change(index)
+                self.index = index
+                self.built_at = time.monotonic()
+        finally:
+            with self._changes_lock:
+                self._changes = None
+
+    def _build(self):
+        from .models import Product
+
+        index = InvertedIndex(
+            k1=self.index.k1,
+            b=self.index.b,
+            similarity_threshold=self.index.similarity_threshold,
+            max_expansions=self.index.max_expansions,
+        )
+        rows = Product.objects.filter(is_active=True).values_list(
+            'id', 'title', 'description', 'category__name'
+        )
+        for product_id, title, description, category_name in rows.iterator(chunk_size=2000):
+            index.add(product_id, {
+                'title': title,
+                'description': description,
+                'category': category_name,
+            })
+        return index
+
+    def _apply(self, change):
+        """Run ``change(index)`` on the current index and on any index being built"""
+        with self._changes_lock:
+            if self._changes is not None:
+                self._changes.append(change)
+            if self.is_built:
+                change(self.index)
+
+    def _tracking(self):
+        return self.is_built or self._changes is not None
+
+    def ensure_built(self):
+        if not self.is_built:
+            with self._build_lock:
+                if not self.is_built:
+                    self.rebuild()
+        elif self.is_stale():
+            self.refresh()
+        return self.index
+
+    def refresh(self):
+        """Rebuild a stale index without making the caller wait for it"""
+        with self._build_lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        if not self.background:
+            self._rebuild_in_background()
+            return
+        threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        from django.db import connection
+
+        try:
+            self.rebuild()
+        except Exception as e:
+            # Keep serving the old index; the next stale search tries again
+            logger.warning(f"Product search index rebuild failed: {str(e)}")
+        finally:
+            self._rebuilding = False
+            if self.background:
+                # The thread's own connection would otherwise stay open
+                connection.close()
+
+    def update_product(self, product):
+        """Apply a single product change if the index has been built"""
+        if not self._tracking():
+            return
+        if not product.is_active:
+            self.remove_product(product.pk)
+            return
+        fields = {
+            'title': product.title,
+            'description': product.description,
+            'category': product.category.name if product.category_id else '',
+        }
+        self._apply(lambda index: index.add(product.pk, fields))
+
+    def reindex(self, product_ids):
+        """Apply changes to many products with one query, if the index has been built"""
+        from .models import Product
+
+        if not self._tracking():
+            return
+        rows = Product.objects.filter(id__in=product_ids).values_list(
+            'id', 'title', 'description', 'category__name', 'is_active'
+        )
+        added, removed = {}, set(product_ids)
+        for product_id, title, description, category_name, is_active in rows:
+            if not is_active:
+                continue
+            removed.discard(product_id)
+            added[product_id] = {
+                'title': title,
+                'description': description,
+                'category': category_name or '',
+            }
+
+        def change(index):
+            for product_id in removed:
+                index.remove(product_id)
+            for product_id, fields in added.items():
+                index.add(product_id, fields)
+
+        self._apply(change)
+
+    def remove_product(self, product_id):
+        if self._tracking():
+            self._apply(lambda index: index.remove(product_id))
+
+    def search(self, query, limit=None):
+        return self.ensure_built().search(query, limit=limit)
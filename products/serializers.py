@@ -3,15 +3,18 @@ from rest_framework import serializers
 # from django.utils.text import slugify
 from .models import Product, Category, ProductVariant
 from marketplace.models import Review
+from marketplace.wishlist import get_wishlisted_ids
+from .images import InvalidImage, open_image, pick_variant, requested_variant
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 from users.models import Student
-from django.db.models import Avg
 from django.db.models import Count
+from django.db.models import FloatField, OuterRef, Prefetch, Q, Subquery, Sum
+from django.db.models.functions import Cast, NullIf
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    product_count = serializers.IntegerField(source='active_products_count', read_only=True)
+    product_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Category
@@ -21,6 +24,12 @@ class CategorySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['slug']
 
+    def get_product_count(self, obj):
+        """Use the ``products_count`` annotation when the queryset has it"""
+        if hasattr(obj, 'products_count'):
+            return obj.products_count
+        return obj.active_products_count
+
 
 class ReviewSerializer(serializers.ModelSerializer):
     reviewer_name = serializers.CharField(source='reviewer.username', read_only=True)
@@ -51,7 +60,8 @@ class ProductVariantSerializer(serializers.ModelSerializer):
 
         If the product variant is not associated with a product, return the price adjustment only.
         """
-        product = obj.products.first()
+        # Iterate rather than .first() so prefetched products are reused
+        product = next(iter(obj.products.all()), None)
         if product:
             return float(product.price) + float(obj.price_adjustment)
         return float(obj.price_adjustment)
@@ -79,35 +89,44 @@ class ProductListSerializer(serializers.ModelSerializer):
         model = Product
         fields = [
             'id', 'title', 'slug', 'price', 'category',
-            'category_name', 'image_url', 'student', 'student_name',
+            'category_name', 'image_url', 'image_width', 'image_height',
+            'student', 'student_name',
             'average_rating', 'is_wishlisted', 'available_stock',
             'condition', 'created_at', 'total_sales', 'has_variants',
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Join and prefetch everything the list representation reads"""
+        return queryset.select_related(
+            'category', 'student__user'
+        ).prefetch_related('variants')
+
     def get_is_wishlisted(self, obj):
         """
         Return True if the product is in the current user's wishlist, False otherwise.
 
-        This method requires the request object to be passed in the serializer context.
+        The user's wishlisted ids are loaded once per request, so this method
+        requires the request object to be passed in the serializer context.
         """
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            try:
-                return request.user.wishlist.products.filter(id=obj.id).exists()
-            except request.user.wishlist.RelatedObjectDoesNotExist:
-                return False
-        return False
+        return obj.id in get_wishlisted_ids(self.context.get('request'))
 
     def get_image_url(self, obj):
         """
         Return the absolute URL of the product image, if any.
 
+        Picks the smallest resized variant covering ``?image_width`` (card
+        width by default) in ``?image_format`` (WebP by default), and the
+        original until the variants have been rendered.
+
         This method requires the request object to be passed in the serializer context.
         """
         if obj.image:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.image.url)
+                name = pick_variant(obj.image_variants, *requested_variant(request))
+                url = obj.image.storage.url(name) if name else obj.image.url
+                return request.build_absolute_uri(url)
         return None
 
 
@@ -133,6 +152,37 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             'total_sales', 'total_revenue', 'last_sale_date'
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Annotate and prefetch everything the detail representation reads, so
+        serializing a product takes the same number of queries however many
+        reviews, variants or seller products it has.
+        """
+        seller_rating = Product.objects.filter(
+            student=OuterRef('student')
+        ).values('student').annotate(
+            rating=Cast(Sum('rating_sum'), FloatField()) / NullIf(Sum('rating_count'), 0)
+        ).values('rating')
+        seller_products_count = Product.objects.filter(
+            student=OuterRef('student')
+        ).values('student').annotate(count=Count('id')).values('count')
+
+        return queryset.select_related('student__user').prefetch_related(
+            Prefetch('category', queryset=Category.objects.annotate(
+                products_count=Count('products', filter=Q(products__is_active=True))
+            )),
+            Prefetch('variants', queryset=ProductVariant.objects.prefetch_related('products')),
+            Prefetch(
+                'reviews',
+                queryset=Review.objects.select_related('reviewer').order_by('-timestamp')[:3],
+                to_attr='recent_reviews'
+            )
+        ).annotate(
+            seller_rating=Subquery(seller_rating),
+            seller_products_count=Subquery(seller_products_count)
+        )
+
     def get_statistics(self, obj):
         return {
             'total_sales': obj.total_sales,
@@ -148,17 +198,25 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         Return a dictionary with the student's id, username, average rating, products count and join date.
         """
         student = obj.student
-        average_rating = student.products.aggregate(Avg('reviews__rating'))['reviews__rating__avg'] or 0
+        if hasattr(obj, 'seller_products_count'):
+            average_rating = obj.seller_rating or 0
+            products_count = obj.seller_products_count
+        else:
+            totals = student.products.aggregate(total=Sum('rating_sum'), count=Sum('rating_count'))
+            average_rating = totals['total'] / totals['count'] if totals['count'] else 0
+            products_count = student.products.count()
         return {
             'id': student.id,
             'username': student.user.username,
             'rating': average_rating,
-            'products_count': student.products.count(),
+            'products_count': products_count,
             'joined_date': student.user.date_joined
         }
 
     def get_reviews(self, obj):
-        recent_reviews = obj.reviews.select_related('reviewer').order_by('-timestamp')[:3]
+        recent_reviews = getattr(obj, 'recent_reviews', None)
+        if recent_reviews is None:
+            recent_reviews = obj.reviews.select_related('reviewer').order_by('-timestamp')[:3]
         return {
             'average': obj.average_rating,
             'count': obj.review_count,
@@ -166,13 +224,7 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         }
 
     def get_is_wishlisted(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            try:
-                return request.user.wishlist.products.filter(id=obj.id).exists()
-            except request.user.wishlist.RelatedObjectDoesNotExist:
-                return False
-        return False
+        return obj.id in get_wishlisted_ids(self.context.get('request'))
 
     def get_image_url(self, obj):
         if obj.image:
@@ -182,13 +234,8 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         return None
 
     def get_related_products(self, obj):
-        related = Product.objects.filter(
-            category=obj.category,
-            is_active=True
-        ).exclude(
-            id=obj.id
-        ).annotate(
-            similarity_score=Count('reviews')
+        related = ProductListSerializer.setup_eager_loading(
+            Product.objects.filter(category_id=obj.category_id, is_active=True).exclude(id=obj.id)
         ).order_by('-created_at')[:4]
         return ProductListSerializer(
             related,
@@ -197,6 +244,20 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         ).data
 
 
+def validate_product_image(value):
+    """
+    Decode the upload the way the image pipeline will, so an image it
+    cannot store is a field error here rather than a failed save.
+    """
+    if value:
+        try:
+            open_image(value)
+        except InvalidImage:
+            raise serializers.ValidationError("Invalid image file")
+        value.seek(0)
+    return value
+
+
 class ProductCreateSerializer(serializers.ModelSerializer):
     variants = ProductVariantSerializer(many=True, required=False)
     price = serializers.DecimalField(
@@ -235,6 +296,9 @@ class ProductCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Stock quantity is unreasonably high")
         return value
 
+    def validate_image(self, value):
+        return validate_product_image(value)
+
     def create(self, validated_data):
         variants_data = validated_data.pop('variants', [])
         product = Product.objects.create(**validated_data)
@@ -265,6 +329,9 @@ class ProductUpdateSerializer(serializers.ModelSerializer):
             'variants'
         ]
 
+    def validate_image(self, value):
+        return validate_product_image(value)
+
     def update(self, instance, validated_data):
         variants_data = validated_data.pop('variants', None)
         product = super().update(instance, validated_data)
@@ -343,34 +410,55 @@ class ProductSearchSerializer(serializers.Serializer):
         return attrs
 
 
+BULK_ACTIONS = [
+    'delete', 'activate', 'deactivate', 'feature', 'unfeature', 'price_adjust', 'set_stock'
+]
+
+
+class ProductBulkOperationSerializer(serializers.Serializer):
+    """One bulk operation; ``price_adjust`` and ``set_stock`` take a value"""
+    action = serializers.ChoiceField(choices=BULK_ACTIONS)
+    amount = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    percent = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=Decimal('-99'),
+        max_value=Decimal('1000'), required=False
+    )
+    stock = serializers.IntegerField(min_value=0, max_value=10000, required=False)
+
+    def validate(self, attrs):
+        action = attrs['action']
+        if action == 'price_adjust' and ('amount' in attrs) == ('percent' in attrs):
+            raise serializers.ValidationError("price_adjust requires either amount or percent")
+        if action == 'set_stock' and 'stock' not in attrs:
+            raise serializers.ValidationError("set_stock requires stock")
+        return attrs
+
+
 class ProductBulkActionSerializer(serializers.Serializer):
+    """
+    Either a single ``action`` (with its value fields at the top level) or
+    a list of ``operations``, applied in order to ``product_ids``.
+    """
     product_ids = serializers.ListField(
         child=serializers.IntegerField(),
         min_length=1,
-        max_length=100  # Reasonable limit
-    )
-    action = serializers.ChoiceField(
-        choices=['delete', 'activate', 'deactivate']
+        max_length=1000  # Reasonable limit
     )
+    operations = ProductBulkOperationSerializer(many=True, required=False, allow_empty=False)
 
     def validate_product_ids(self, value):
-        """Validate product IDs exist and belong to user"""
+        """Ownership is enforced by the UPDATE itself, so no lookup here"""
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             raise serializers.ValidationError("Authentication required")
+        return list(dict.fromkeys(value))
 
-        existing_ids = set(Product.objects.filter(
-            id__in=value,
-            student__user=request.user
-        ).values_list('id', flat=True))
-
-        invalid_ids = set(value) - existing_ids
-        if invalid_ids:
-            raise serializers.ValidationError(
-                f"Invalid product IDs: {', '.join(map(str, invalid_ids))}"
-            )
-
-        return value
+    def validate(self, attrs):
+        if 'operations' not in attrs:
+            operation = ProductBulkOperationSerializer(data=self.initial_data)
+            operation.is_valid(raise_exception=True)
+            attrs['operations'] = [operation.validated_data]
+        return attrs
 
 
 class ProductDraftSerializer(serializers.ModelSerializer):
@@ -395,6 +483,9 @@ class ProductDraftSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['slug', 'created_at', 'updated_at']
 
+    def validate_image(self, value):
+        return validate_product_image(value)
+
     def validate(self, attrs):
         """Validate draft data - less strict than published products"""
         # For drafts, we allow partial data
@@ -0,0 +1,134 @@
+import logging
+
+from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from marketplace.models import Review
+from .models import Product, Category
+from .cache import invalidate_categories
+from .feed import changed_fields, publish_change, take_snapshot
+from .images import InvalidImage, delete_variants, run_in_background, schedule_product_image, store_image
+from .search import get_search_backend, reset_search_backend
+
+logger = logging.getLogger(__name__)
+
+# Fields that feed into the search index
+SEARCH_FIELDS = {'title', 'description', 'category', 'category_id', 'is_active'}
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the search backend in step with the product text"""
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    get_search_backend().update_product(instance)
+
+
+@receiver(pre_save, sender=Product)
+def sanitize_product_image(sender, instance, **kwargs):
+    """
+    Store a freshly uploaded image through the image pipeline before the
+    file field commits the raw upload.
+    """
+    instance._image_uploaded = False
+    instance._replaced_image = None
+    image = instance.image
+    if not image or image._committed:
+        return
+    try:
+        name, width, height = store_image(image.file, sender._meta.get_field('image').upload_to)
+    except InvalidImage as e:
+        # Never fall back to the raw upload: it still carries its EXIF data
+        logger.warning(f"Rejected image for product {instance.pk}: {str(e)}")
+        raise ValidationError({'image': 'Invalid image file'})
+    instance.image = name
+    instance.image_width, instance.image_height = width, height
+    instance.image_variants = {}
+    instance._image_uploaded = True
+    if instance.pk:
+        instance._replaced_image = sender.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def render_product_image_variants(sender, instance, **kwargs):
+    if getattr(instance, '_image_uploaded', False):
+        schedule_product_image(instance.pk)
+    replaced = getattr(instance, '_replaced_image', None)
+    if replaced:
+        # The old image's variants are no longer referenced by anything
+        transaction.on_commit(lambda: run_in_background(delete_variants, replaced))
+
+
+@receiver(post_save, sender=Product)
+def publish_product_changes(sender, instance, created, update_fields=None, **kwargs):
+    """Send price, stock and active flag changes to the product change feed"""
+    changes = {} if created else changed_fields(instance, update_fields)
+    take_snapshot(instance, update_fields)
+    publish_change(instance.pk, instance.category_id, changes)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search_index(sender, instance, **kwargs):
+    get_search_backend().remove_product(instance.pk)
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_name(sender, instance, **kwargs):
+    """Stash the stored name so a rename can be detected after saving"""
+    instance._previous_name = None
+    if instance.pk:
+        instance._previous_name = Category.objects.filter(
+            pk=instance.pk
+        ).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_index(sender, instance, created, **kwargs):
+    """A category rename changes the indexed text of every product in it"""
+    if created or getattr(instance, '_previous_name', None) in (None, instance.name):
+        return
+    get_search_backend().refresh_category(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_caches(sender, instance, **kwargs):
+    invalidate_categories()
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    """Stash the stored product and rating so an edit can be applied as a delta"""
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Review.objects.filter(
+            pk=instance.pk
+        ).values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_review_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is None:
+        Product.adjust_rating(instance.product_id, instance.rating, 1)
+        return
+
+    product_id, rating = previous
+    if product_id != instance.product_id:
+        Product.adjust_rating(product_id, -rating, -1)
+        Product.adjust_rating(instance.product_id, instance.rating, 1)
+    elif rating != instance.rating:
+        Product.adjust_rating(product_id, instance.rating - rating, 0)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_review_delete(sender, instance, **kwargs):
+    Product.adjust_rating(instance.product_id, -instance.rating, -1)
+
+
+@receiver(setting_changed)
+def search_backend_setting_changed(sender, setting, **kwargs):
+    if setting in ('PRODUCT_SEARCH_BACKEND', 'PRODUCT_SEARCH_INDEX_MAX_AGE', 'DATABASES'):
+        reset_search_backend()
@@ -0,0 +1,90 @@
+"""
+Unique product slugs.
+
+A title's slug is its slugified form, or ``<base>-<n>`` when the base is
+taken, where ``n`` is one more than the highest suffix in use. Finding it
+costs a single aggregate query however many products share the title.
+Concurrent saves can still pick the same slug; ``Product.save`` retries
+on the unique-constraint violation.
+"""
+import re
+
+from django.db.models import Case, IntegerField, Max, Q, Value, When
+from django.db.models.functions import Cast, Substr
+from django.utils.text import slugify
+
+SLUG_MAX_LENGTH = 200
+# Room left for a "-<n>" suffix when a long title is truncated
+SUFFIX_RESERVE = 10
+DEFAULT_SLUG = 'product'
+
+
+def base_slug(title):
+    slug = slugify(title)[:SLUG_MAX_LENGTH - SUFFIX_RESERVE].strip('-')
+    return slug or DEFAULT_SLUG
+
+
+def _suffix_filter(base):
+    return Q(slug=base) | Q(slug__regex=rf'^{re.escape(base)}-[0-9]+$')
+
+
+def _suffix(base):
+    return Case(
+        When(slug=base, then=Value(0)),
+        default=Cast(Substr('slug', len(base) + 2), IntegerField()),
+    )
+
+
+def highest_suffixes(bases, queryset):
+    """
+    Map each base slug to the highest suffix in use: ``-1`` when the base is
+    free, ``0`` when only the bare base is taken. One query for all bases,
+    with the maximum computed by the database.
+    """
+    bases = list(set(bases))
+    if not bases:
+        return {}
+    prefixes = Q()
+    for base in bases:
+        prefixes |= Q(slug=base) | Q(slug__startswith=f'{base}-')
+    totals = queryset.filter(prefixes).aggregate(**{
+        f'suffix_{index}': Max(_suffix(base), filter=_suffix_filter(base))
+        for index, base in enumerate(bases)
+    })
+    return {
+        base: -1 if totals[f'suffix_{index}'] is None else totals[f'suffix_{index}']
+        for index, base in enumerate(bases)
+    }
+
+
+def format_slug(base, suffix):
+    return base if suffix == 0 else f'{base}-{suffix}'
+
+
+def unique_slug(title, queryset):
+    """First free slug for ``title`` among ``queryset``"""
+    base = base_slug(title)
+    return format_slug(base, highest_suffixes([base], queryset)[base] + 1)
+
+
+def assign_unique_slugs(products, queryset=None, batch_size=500):
+    """
+    Give every unsaved product in ``products`` without a slug a unique one,
+    for use before ``bulk_create``. Costs one query per ``batch_size``
+    distinct titles and accounts for duplicates within ``products``.
+    """
+    from .models import Product
+
+    queryset = Product.objects.all() if queryset is None else queryset
+    pending = [product for product in products if not product.slug]
+    bases = list({base_slug(product.title) for product in pending})
+
+    highest = {}
+    for start in range(0, len(bases), batch_size):
+        highest.update(highest_suffixes(bases[start:start + batch_size], queryset))
+
+    for product in pending:
+        base = base_slug(product.title)
+        highest[base] += 1
+        product.slug = format_slug(base, highest[base])
+    return products
@@ -0,0 +1,57 @@
+"""
+Background release of expired stock reservations.
+
+Run ``manage.py release_expired_reservations --loop`` next to the web
+servers, or let each Daphne process sweep on its own event loop:
+``ReservationSweeperMiddleware`` wraps the ASGI application and starts
+``sweep_forever`` on the first connection. Sweeping from several
+processes is safe; every batch locks the rows it releases.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from .reservations import release_expired
+import logging
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL = getattr(settings, 'STOCK_RESERVATION_SWEEP_INTERVAL', 60)
+
+
+def sweep_once():
+    """Release every expired reservation; returns the units released"""
+    close_old_connections()
+    try:
+        released = release_expired()
+    finally:
+        close_old_connections()
+    if released:
+        logger.info(f"Released {released} units from expired stock reservations")
+    return released
+
+
+async def sweep_forever(interval=SWEEP_INTERVAL):
+    # Off the event loop's thread: a sweep is a few blocking queries
+    sweep = sync_to_async(sweep_once, thread_sensitive=False)
+    while True:
+        try:
+            await sweep()
+        except Exception as e:
+            logger.error(f"Stock reservation sweep failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+class ReservationSweeperMiddleware:
+    """ASGI middleware that runs one ``sweep_forever`` task per process"""
+
+    def __init__(self, app, interval=SWEEP_INTERVAL):
+        self.app = app
+        self.interval = interval
+        self.task = None
+
+    async def __call__(self, scope, receive, send):
+        if self.task is None and self.interval:
+            self.task = asyncio.get_running_loop().create_task(sweep_forever(self.interval))
+        return await self.app(scope, receive, send)
@@ -0,0 +1,101 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from .models import Product, Category
+from .search import get_search_backend, reset_search_backend, search_products
+
+URL = '/api/products/products/bulk-action/'
+
+
+class ProductBulkActionTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        other = get_user_model().objects.create_user(
+            email='other@example.com', username='other', password='testpass123'
+        )
+        books = Category.objects.create(name='Books')
+        self.products = [
+            Product.objects.create(
+                title=f'Textbook {i}', description='Lightly used', price=price,
+                student=self.user.student_profile, category=books, stock=5, reserved_stock=2
+            )
+            for i, price in enumerate(['10.00', '999000.00', '0.50'])
+        ]
+        self.foreign = Product.objects.create(
+            title='Lab Coat', description='White', price=20,
+            student=other.student_profile, category=books
+        )
+        self.ids = [product.id for product in self.products]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, data):
+        return self.client.post(URL, data, format='json')
+
+    def test_operations_run_as_one_update_each(self):
+        data = {
+            'product_ids': self.ids + [self.foreign.id],
+            'operations': [
+                {'action': 'feature'},
+                {'action': 'price_adjust', 'percent': '10'},
+                {'action': 'set_stock', 'stock': 1},
+            ],
+        }
+        # Savepoint, then lock, UPDATE and read back per operation, release
+        with self.assertNumQueries(11):
+            response = self.post(data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['results'],
+            [{'action': 'feature', 'affected': 3},
+             {'action': 'price_adjust', 'affected': 3},
+             {'action': 'set_stock', 'affected': 3}]
+        )
+        self.assertEqual(response.data['not_found'], [self.foreign.id])
+
+        prices = dict(Product.objects.filter(id__in=self.ids).values_list('id', 'price'))
+        self.assertEqual(
+            [prices[product_id] for product_id in self.ids],
+            [Decimal('11.00'), Decimal('999999.99'), Decimal('0.55')]
+        )
+        # Stock never drops below what is reserved
+        self.assertEqual(set(Product.objects.filter(id__in=self.ids).values_list('stock', flat=True)), {2})
+        self.assertTrue(all(Product.objects.filter(id__in=self.ids).values_list('featured', flat=True)))
+        self.foreign.refresh_from_db()
+        self.assertFalse(self.foreign.featured)
+
+    def test_single_action_and_soft_delete(self):
+        response = self.post({'product_ids': self.ids[:2], 'action': 'price_adjust', 'amount': '-20'})
+        self.assertEqual(response.data['results'], [{'action': 'price_adjust', 'affected': 2}])
+        self.assertEqual(Product.objects.get(pk=self.ids[0]).price, Decimal('0.01'))
+
+        response = self.post({'product_ids': self.ids, 'action': 'delete'})
+        self.assertEqual(response.data['results'], [{'action': 'delete', 'affected': 3}])
+        self.assertFalse(Product.objects.filter(id__in=self.ids, is_active=True).exists())
+        self.assertEqual(Product.objects.filter(id__in=self.ids).count(), 3)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post({'product_ids': self.ids, 'action': 'price_adjust'}).status_code, 400)
+        self.assertEqual(self.post({'product_ids': self.ids, 'action': 'set_stock'}).status_code, 400)
+        self.assertEqual(self.post({'product_ids': self.ids, 'action': 'explode'}).status_code, 400)
+        response = self.post({'product_ids': [self.foreign.id], 'action': 'activate'})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='inmemory')
+    @mock.patch('products.bulk_actions.publish_change')
+    def test_reactivated_products_reach_the_search_index(self, publish_change):
+        Product.objects.filter(id=self.ids[0]).update(is_active=False)
+        reset_search_backend()
+        get_search_backend().index.ensure_built()
+        self.assertEqual(len(search_products(query='textbook')), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post({'product_ids': self.ids[:1], 'action': 'activate'})
+        self.assertEqual(len(search_products(query='textbook')), 3)
+        reset_search_backend()
@@ -0,0 +1,153 @@
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from .bulk_io import ProductImporter, iter_rows
+from .models import Product, Category, ProductVariant
+from .search import get_search_backend, reset_search_backend, search_products
+
+IMPORT_URL = '/api/products/products/import/'
+EXPORT_URL = '/api/products/products/export/'
+
+
+class ProductImportExportTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.books = Category.objects.create(name='Books')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, content, **data):
+        data['file'] = SimpleUploadedFile(name, content.encode())
+        return self.client.post(IMPORT_URL, data, format='multipart')
+
+    def test_csv_import_creates_valid_rows_and_reports_errors(self):
+        content = (
+            'title,description,price,category,condition,stock,variants\n'
+            'Calculus Textbook,Lightly used,25.00,Books,good,2,\n'
+            f'Calculus Textbook,Second copy,20.00,{self.books.id},,,'
+            '"[{""name"": ""Hardcover"", ""sku"": ""CALC-HC"", ""price_adjustment"": ""5.00""}]"\n'
+            'Broken,No price,,Books,good,1,\n'
+            'Lab Coat,White,15.00,Lab Gear,new,1,\n'
+        )
+        response = self.upload('products.csv', content)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [4, 5])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+        self.assertIn('category', response.data['errors'][1]['errors'])
+
+        products = Product.objects.order_by('id')
+        self.assertEqual(
+            [product.slug for product in products],
+            ['calculus-textbook', 'calculus-textbook-1']
+        )
+        self.assertEqual(products[1].stock, 1)
+        self.assertEqual(list(products[1].variants.values_list('sku', flat=True)), ['CALC-HC'])
+
+    def test_undecodable_rows_are_reported_not_raised(self):
+        content = (
+            b'title,description,price,category\n'
+            b'Calculus Textbook,Lightly used,25.00,Books\n'
+            b'Caf\xe9 menu,Latin-1 bytes,5.00,Books\n'
+            b'Physics,Mechanics,30.00,Books\n'
+        )
+        response = self.client.post(
+            IMPORT_URL, {'file': SimpleUploadedFile('products.csv', content)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(
+            response.data['errors'], [{'row': 3, 'errors': {'non_field_errors': ['Row is not valid UTF-8']}}]
+        )
+
+        upload = SimpleUploadedFile('products.jsonl', b'{"title": "\xff"}\n')
+        self.assertEqual(
+            [error for _, _, error in iter_rows(upload, 'jsonl')], [{'non_field_errors': ['Row is not valid UTF-8']}]
+        )
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='inmemory')
+    def test_import_indexes_each_chunk_with_one_query(self):
+        reset_search_backend()
+        get_search_backend().index.ensure_built()
+        rows = [
+            (number, {
+                'title': f'Calculus volume {number}', 'description': 'Used', 'price': '10', 'category': 'Books'
+            }, None)
+            for number in range(1, 6)
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            ProductImporter(self.user.student_profile).run(rows)
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len(search_products(query='calculus')), 5)
+        reset_search_backend()
+
+    def test_jsonl_import_rejects_duplicate_skus(self):
+        ProductVariant.objects.create(name='Hardcover', sku='TAKEN')
+        lines = [
+            {'title': 'Physics', 'description': 'Mechanics', 'price': '30', 'category': 'books',
+             'variants': [{'name': 'Hardcover', 'sku': 'TAKEN'}]},
+            {'title': 'Chemistry', 'description': 'Organic', 'price': '30', 'category': 'Books',
+             'variants': [{'name': 'Hardcover', 'sku': 'CHEM-1'}]},
+            {'title': 'Biology', 'description': 'Cells', 'price': '30', 'category': 'Books',
+             'variants': [{'name': 'Hardcover', 'sku': 'CHEM-1'}]},
+        ]
+        content = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+        response = self.upload('products.jsonl', content)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['row'] for error in response.data['errors']], [1, 3, 4])
+        self.assertEqual(list(Product.objects.values_list('title', flat=True)), ['Chemistry'])
+
+    def test_import_requires_a_file_in_a_known_format(self):
+        self.assertEqual(self.client.post(IMPORT_URL, {}, format='multipart').status_code, 400)
+        response = self.upload('products.xml', '<products/>', file_format='xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_streams_own_products(self):
+        variant = ProductVariant.objects.create(name='Hardcover', sku='CALC-HC')
+        product = Product.objects.create(
+            title='Calculus Textbook', description='Lightly used', price=25,
+            student=self.user.student_profile, category=self.books
+        )
+        product.variants.add(variant)
+        other = get_user_model().objects.create_user(
+            email='other@example.com', username='other', password='testpass123'
+        )
+        Product.objects.create(
+            title='Lab Coat', description='White', price=15,
+            student=other.student_profile, category=self.books
+        )
+
+        response = self.client.get(EXPORT_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['title'] for row in rows], ['Calculus Textbook'])
+        self.assertEqual(json.loads(rows[0]['variants'])[0]['sku'], 'CALC-HC')
+
+        response = self.client.get(EXPORT_URL, {'file_format': 'jsonl'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['category'], 'Books')
+
+    def test_export_round_trips_through_import(self):
+        Product.objects.create(
+            title='Calculus Textbook', description='Lightly used', price=25,
+            student=self.user.student_profile, category=self.books
+        )
+        exported = b''.join(self.client.get(EXPORT_URL).streaming_content).decode()
+
+        response = self.upload('products.csv', exported)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(Product.objects.filter(title='Calculus Textbook').count(), 2)
@@ -0,0 +1,147 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+from .cache import (
+    CACHE_VERSION_TTL, PRODUCTS_TAG, SEARCH_TAG, get_cache_key, get_version_key, invalidate_products,
+    invalidate_tags, product_tag, read_through
+)
+from .models import Product, Category
+
+
+class TaggedCacheKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidating_a_tag_changes_only_its_keys(self):
+        listing = get_cache_key('featured', '', tags=[PRODUCTS_TAG])
+        search = get_cache_key('search', 'books', tags=[SEARCH_TAG])
+        self.assertEqual(get_cache_key('featured', '', tags=[PRODUCTS_TAG]), listing)
+
+        invalidate_tags(PRODUCTS_TAG)
+        self.assertNotEqual(get_cache_key('featured', '', tags=[PRODUCTS_TAG]), listing)
+        self.assertEqual(get_cache_key('search', 'books', tags=[SEARCH_TAG]), search)
+
+    def test_bulk_invalidation_is_one_cache_call(self):
+        detail_keys = [
+            get_cache_key('detail', i, tags=[product_tag(i)]) for i in range(1, 51)
+        ]
+        with mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many, \
+                mock.patch.object(cache, 'delete') as delete:
+            invalidate_products(*[(i, f'book-{i}') for i in range(1, 51)])
+        self.assertEqual(set_many.call_count, 1)
+        delete.assert_not_called()
+        self.assertFalse(any(
+            get_cache_key('detail', i, tags=[product_tag(i)]) in detail_keys
+            for i in range(1, 51)
+        ))
+
+    def test_version_keys_expire(self):
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add, \
+                mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            get_cache_key('featured', '', tags=[PRODUCTS_TAG])
+            invalidate_tags(PRODUCTS_TAG)
+        add.assert_called_once_with(get_version_key(PRODUCTS_TAG), mock.ANY, CACHE_VERSION_TTL)
+        self.assertEqual(set_many.call_args.args[1], CACHE_VERSION_TTL)
+
+
+class ProductCacheInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.product = Product.objects.create(
+            title='Calculus Textbook', description='Lightly used', price=10,
+            student=self.user.student_profile, category=Category.objects.create(name='Books')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_action_invalidates_cached_detail(self):
+        url = f'/api/products/products/{self.product.slug}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        response = self.client.post('/api/products/products/bulk-action/', {
+            'product_ids': [self.product.id], 'action': 'deactivate'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_featured_is_read_through(self):
+        Product.objects.filter(pk=self.product.pk).update(featured=True)
+        url = '/api/products/products/featured/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data, response.data)
+
+    def test_category_list_caches_serialized_data(self):
+        computed = []
+
+        def recording_read_through(key, compute, **kwargs):
+            computed.append(compute())
+            return computed[-1]
+
+        with mock.patch('products.views.read_through', side_effect=recording_read_through):
+            response = self.client.get('/api/products/categories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(computed[0], dict)
+        self.assertEqual([category['product_count'] for category in computed[0]['results']], [1])
+
+        self.client.get('/api/products/categories/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/products/categories/').data, response.data)
+
+
+class ReadThroughTests(TestCase):
+    key = 'products:test:read_through'
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_fresh_entry_is_served_from_cache(self):
+        self.assertEqual(read_through(self.key, self.compute, beta=0), 1)
+        self.assertEqual(read_through(self.key, self.compute, beta=0), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_entry_is_served_stale_while_locked(self):
+        read_through(self.key, self.compute, ttl=60, stale_ttl=60)
+        envelope = cache.get(self.key)
+        envelope['expires'] = time.time() - 1
+        cache.set(self.key, envelope)
+
+        cache.add(f'{self.key}:lock', 'other-worker')
+        self.assertEqual(read_through(self.key, self.compute), 1)
+        self.assertEqual(self.calls, 1)
+
+        cache.delete(f'{self.key}:lock')
+        self.assertEqual(read_through(self.key, self.compute), 2)
+        self.assertIsNone(cache.get(f'{self.key}:lock'))
+
+    def test_early_refresh_near_expiry(self):
+        read_through(self.key, self.compute)
+        envelope = cache.get(self.key)
+        envelope.update(expires=time.time() + 1, delta=1000)
+        cache.set(self.key, envelope)
+
+        self.assertEqual(read_through(self.key, self.compute), 2)
+
+    def test_cold_key_waits_for_the_lock_holder(self):
+        cache.add(f'{self.key}:lock', 'other-worker')
+
+        def fill(seconds):
+            cache.set(self.key, {'value': 'filled', 'delta': 0, 'expires': time.time() + 60})
+
+        with mock.patch('products.cache.time.sleep', side_effect=fill):
+            self.assertEqual(read_through(self.key, self.compute), 'filled')
+        self.assertEqual(self.calls, 0)
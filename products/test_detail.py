@@ -0,0 +1,146 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from marketplace.models import Review
+from .models import Product, Category, ProductVariant
+from .view_counts import reset_view_buffer
+
+# product + annotations, category, variants, variant products, recent
+# reviews, wishlisted ids, related products, related products' variants
+DETAIL_QUERIES = 8
+
+
+class ProductDetailQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_view_buffer()
+        User = get_user_model()
+        self.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        self.category = Category.objects.create(name='Books')
+        self.product = self.create_product('Calculus Textbook')
+        self.buyer.wishlist.products.add(self.product)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        self.reviewers = 0
+
+    def create_product(self, title):
+        return Product.objects.create(
+            title=title, description='Lightly used', price=10,
+            student=self.seller.student_profile, category=self.category
+        )
+
+    def add_related_data(self, count):
+        User = get_user_model()
+        for _ in range(count):
+            self.reviewers += 1
+            reviewer = User.objects.create_user(
+                email=f'reviewer{self.reviewers}@example.com',
+                username=f'reviewer{self.reviewers}',
+                password='testpass123'
+            )
+            Review.objects.create(product=self.product, reviewer=reviewer, rating=4)
+            variant = ProductVariant.objects.create(
+                name=f'Edition {self.reviewers}', sku=f'SKU-{self.reviewers}', price_adjustment=1
+            )
+            self.product.variants.add(variant)
+            self.create_product(f'Related {self.reviewers}').variants.add(variant)
+
+    def get_detail(self):
+        cache.clear()
+        with self.assertNumQueries(DETAIL_QUERIES):
+            response = self.client.get(f'/api/products/products/{self.product.slug}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_query_count_does_not_grow_with_related_rows(self):
+        self.add_related_data(2)
+        small = self.get_detail()
+        self.add_related_data(5)
+        data = self.get_detail()
+
+        self.assertTrue(data['is_wishlisted'])
+        self.assertEqual(data['statistics']['review_count'], 7)
+        self.assertEqual(data['reviews']['count'], 7)
+        self.assertEqual(len(data['reviews']['recent']), 3)
+        self.assertEqual(data['reviews']['average'], 4)
+        self.assertEqual(data['student']['products_count'], 8)
+        self.assertEqual(data['student']['rating'], 4)
+        self.assertEqual(data['category']['product_count'], 8)
+        self.assertEqual(len(data['variants']), 7)
+        self.assertEqual(data['variants'][0]['final_price'], 11.0)
+        self.assertEqual(len(data['related_products']), 4)
+        self.assertEqual(len(small['related_products']), 2)
+
+    def test_cached_detail_carries_each_readers_own_wishlist_flag(self):
+        url = f'/api/products/products/{self.product.slug}/'
+        self.assertTrue(self.client.get(url).data['is_wishlisted'])
+
+        other = APIClient()
+        other.force_authenticate(self.seller)
+        self.assertFalse(other.get(url).data['is_wishlisted'])
+        self.assertFalse(APIClient().get(url).data['is_wishlisted'])
+
+        # Cached listings too
+        Product.objects.filter(pk=self.product.pk).update(featured=True)
+        featured_url = '/api/products/products/featured/'
+        self.assertEqual([p['is_wishlisted'] for p in other.get(featured_url).data], [False])
+        self.assertEqual([p['is_wishlisted'] for p in self.client.get(featured_url).data], [True])
+
+
+class ProductListQueryTests(TestCase):
+    url = '/api/products/products/'
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        self.category = Category.objects.create(name='Books')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def create_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                title=f'Book {Product.objects.count()}', description='Lightly used', price=10,
+                student=self.seller.student_profile, category=self.category
+            )
+            self.buyer.wishlist.products.add(product)
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(p['is_wishlisted'] for p in response.data['results']))
+        return len(queries)
+
+    def test_wishlist_flags_do_not_add_queries_per_product(self):
+        self.create_products(2)
+        small = self.list_queries()
+        self.create_products(6)
+        cache.clear()
+        self.assertEqual(self.list_queries(), small)
+
+    def test_wishlist_changes_invalidate_cached_ids(self):
+        self.create_products(1)
+        product = Product.objects.get()
+        self.assertTrue(self.client.get(self.url).data['results'][0]['is_wishlisted'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/marketplace/wishlist/{product.slug}/remove/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(self.client.get(self.url).data['results'][0]['is_wishlisted'])
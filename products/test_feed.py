@@ -0,0 +1,116 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from marketplace.consumers import MarketplaceConsumer
+from . import feed
+from .bulk_actions import run_bulk_action
+from .models import Product, Category
+
+
+class ProductFeedTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.books = Category.objects.create(name='Books')
+        self.product = Product.objects.create(
+            title='Calculus', description='Lightly used', price=10, stock=3,
+            student=user.student_profile, category=self.books
+        )
+        feed._publisher = feed.ProductChangePublisher(window=60)
+        feed._publisher.flush = lambda: None
+
+    def tearDown(self):
+        feed.reset_publisher()
+
+    def pending(self):
+        return {
+            product_id: entry['changes']
+            for product_id, entry in feed.get_publisher()._pending.items()
+        }
+
+    def test_saves_publish_changed_fields_only(self):
+        product = Product.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.description = 'Barely used'
+            product.save()
+        self.assertEqual(self.pending(), {})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = 12
+            product.save()
+            product.update_stock(5)
+        self.assertEqual(
+            self.pending(),
+            {product.id: {'price': '12.00', 'stock': 5, 'available_stock': 5}}
+        )
+
+        # Coalesced: the later value wins
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = 15
+            product.save(update_fields=['price'])
+        self.assertEqual(self.pending()[product.id]['price'], '15.00')
+
+    def test_bulk_actions_publish_returned_values(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            run_bulk_action(Product.objects.all(), {'action': 'deactivate'})
+            run_bulk_action(Product.objects.all(), {'action': 'set_stock', 'stock': 7})
+        self.assertEqual(
+            self.pending(),
+            {self.product.id: {'is_active': False, 'stock': 7, 'available_stock': 7}}
+        )
+
+    def test_flush_sends_to_product_and_category_groups(self):
+        channel_layer = get_channel_layer()
+        publisher = feed.ProductChangePublisher(window=60)
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(feed.category_group(self.books.id), channel)
+
+        publisher.publish(self.product.id, self.books.id, {'stock': 2})
+        publisher.publish(self.product.id, self.books.id, {'is_active': False})
+        self.assertEqual(publisher.flush(), 1)
+
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event['type'], 'product.changed')
+        self.assertEqual(event['changes'], {'stock': 2, 'is_active': False})
+        async_to_sync(channel_layer.flush)()
+
+
+class MarketplaceConsumerFeedTests(TestCase):
+    def test_clients_receive_only_what_they_follow(self):
+        async def run():
+            channel_layer = get_channel_layer()
+            communicator = WebsocketCommunicator(MarketplaceConsumer.as_asgi(), '/ws/marketplace/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            await communicator.send_json_to({'type': 'subscribe', 'products': [1], 'categories': [9]})
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply['subscriptions'], ['products.category.9', 'products.product.1'])
+
+            event = {
+                'type': 'product.changed', 'event_id': 'a', 'product_id': 1,
+                'category_id': 9, 'changes': {'price': '12.00'},
+            }
+            await channel_layer.group_send(feed.product_group(1), event)
+            await channel_layer.group_send(feed.category_group(9), event)
+            await channel_layer.group_send(feed.product_group(2), dict(event, event_id='b', product_id=2))
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['changes'], {'price': '12.00'})
+            # The copy sent to the category group and the unfollowed product are dropped
+            self.assertTrue(await communicator.receive_nothing())
+
+            await communicator.send_json_to({'type': 'unsubscribe', 'products': [1]})
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply['subscriptions'], ['products.category.9'])
+
+            await communicator.send_json_to({'type': 'subscribe', 'products': ['one']})
+            self.assertIn('error', await communicator.receive_json_from())
+            await communicator.disconnect()
+            await channel_layer.flush()
+
+        asyncio.run(run())
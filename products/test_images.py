@@ -0,0 +1,164 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from .images import pick_variant
+from .models import Product, Category
+from .serializers import ProductListSerializer
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_jpeg(width=1600, height=900, orientation=None):
+    image = Image.new('RGB', (width, height), (200, 40, 40))
+    exif = Image.Exif()
+    exif[0x010f] = 'Camera maker'  # Make
+    if orientation:
+        exif[0x0112] = orientation
+    output = io.BytesIO()
+    image.save(output, format='JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile('photo.jpg', output.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PRODUCT_IMAGE_ASYNC=False)
+class ProductImagePipelineTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.category = Category.objects.create(name='Books')
+
+    def create_product(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                title='Calculus Textbook', description='Lightly used', price=10,
+                student=self.user.student_profile, category=self.category, image=image
+            )
+        product.refresh_from_db()
+        return product
+
+    def test_upload_is_sanitized_and_variants_recorded(self):
+        product = self.create_product(make_jpeg(orientation=6))
+
+        # Rotated upright from the EXIF orientation, then stripped of EXIF
+        self.assertEqual((product.image_width, product.image_height), (900, 1600))
+        with default_storage.open(product.image.name) as file:
+            stored = Image.open(file)
+            self.assertEqual(stored.size, (900, 1600))
+            self.assertEqual(len(stored.getexif()), 0)
+
+        self.assertEqual(set(product.image_variants), {'webp', 'jpeg'})
+        self.assertEqual(set(product.image_variants['webp']), {'320', '640', '1280'})
+        with default_storage.open(product.image_variants['webp']['320']) as file:
+            self.assertEqual(Image.open(file).size, (320, 569))
+        # Wider than the original: capped at the original width
+        with default_storage.open(product.image_variants['jpeg']['1280']) as file:
+            self.assertEqual(Image.open(file).size, (900, 1600))
+
+    def test_pick_variant(self):
+        variants = {'webp': {'320': 'a_320w.webp', '640': 'a_640w.webp'}}
+        self.assertEqual(pick_variant(variants, 300), 'a_320w.webp')
+        self.assertEqual(pick_variant(variants, 500), 'a_640w.webp')
+        self.assertEqual(pick_variant(variants, 2000), 'a_640w.webp')
+        self.assertIsNone(pick_variant({}, 300))
+
+    def test_list_serializer_returns_right_sized_variant(self):
+        product = self.create_product(make_jpeg())
+        factory = APIRequestFactory()
+
+        def image_url(params=None):
+            request = Request(factory.get('/', params))
+            request.user = self.user
+            return ProductListSerializer(product, context={'request': request}).data['image_url']
+
+        url = image_url()
+        self.assertTrue(url.endswith('_320w.webp'))
+
+        url = image_url({'image_width': 600, 'image_format': 'jpeg'})
+        self.assertTrue(url.endswith('_640w.jpeg'))
+
+    def test_upload_endpoint_streams_sanitized_image(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.post(
+            '/api/products/products/my-products/upload-image/', {'image': make_jpeg(800, 600)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['width'], response.data['height']), (800, 600))
+
+        name = response.data['url'].split('/media/', 1)[1]
+        with default_storage.open(name) as file:
+            self.assertEqual(len(Image.open(file).getexif()), 0)
+        # Not on a product yet, so there is nowhere to record variants
+        self.assertFalse(default_storage.exists(name.replace('.jpg', '_320w.webp')))
+
+        response = client.delete(
+            '/api/products/products/my-products/delete-image/', {'image_url': response.data['url']}, format='json'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_invalid_upload_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        bogus = SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg')
+        response = client.post('/api/products/products/my-products/upload-image/', {'image': bogus}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    def test_undecodable_product_images_are_rejected(self):
+        bogus = SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg')
+        with self.assertRaises(ValidationError):
+            self.create_product(bogus)
+
+        with mock.patch('PIL.Image.MAX_IMAGE_PIXELS', 1000), self.assertRaises(ValidationError):
+            self.create_product(make_jpeg())
+        self.assertFalse(Product.objects.exists())
+
+    def test_undecodable_images_are_a_400_through_the_api(self):
+        product = self.create_product(make_jpeg())
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # Passes Pillow's header check but cannot be decoded
+        truncated = make_jpeg().read()[:2000]
+
+        response = client.patch(
+            f'/api/products/products/{product.pk}/',
+            {'image': SimpleUploadedFile('photo.jpg', truncated, content_type='image/jpeg')},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+        response = client.post('/api/products/products/draft/', {
+            'title': 'Draft', 'image': SimpleUploadedFile('photo.jpg', truncated, content_type='image/jpeg')
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    def test_replacing_an_image_deletes_the_old_variants(self):
+        product = self.create_product(make_jpeg())
+        old_variants = [name for sizes in product.image_variants.values() for name in sizes.values()]
+        self.assertTrue(all(default_storage.exists(name) for name in old_variants))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = make_jpeg(800, 600)
+            product.save()
+        product.refresh_from_db()
+
+        self.assertFalse(any(default_storage.exists(name) for name in old_variants))
+        self.assertTrue(default_storage.exists(product.image_variants['webp']['320']))
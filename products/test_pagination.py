@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import Product, Category
+
+
+class KeysetPaginationTests(TestCase):
+    url = '/api/products/products/'
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        category = Category.objects.create(name='Books')
+        now = timezone.now()
+        for i in range(5):
+            product = Product.objects.create(
+                title=f'Book {i}', description='Lightly used', price=10 + i % 3,
+                student=user.student_profile, category=category
+            )
+            # Two products share a timestamp to exercise the id tiebreak
+            Product.objects.filter(pk=product.pk).update(
+                created_at=now - timedelta(minutes=min(i, 3))
+            )
+        self.client = APIClient()
+
+    def walk(self, params):
+        titles, response = [], self.client.get(self.url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            titles += [product['title'] for product in response.data['results']]
+            if not response.data['next']:
+                return titles
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_follow_created_at_then_id(self):
+        expected = list(
+            Product.objects.order_by('-created_at', '-id').values_list('title', flat=True)
+        )
+        self.assertEqual(self.walk({'pagination': 'cursor', 'page_size': 2}), expected)
+
+    def test_cursor_pages_follow_price_then_id(self):
+        expected = list(
+            Product.objects.order_by('price', 'id').values_list('title', flat=True)
+        )
+        params = {'pagination': 'cursor', 'page_size': 2, 'ordering': 'price'}
+        self.assertEqual(self.walk(params), expected)
+
+    def test_previous_links_walk_back_through_the_same_pages(self):
+        pages, response = [], self.client.get(self.url, {'pagination': 'cursor', 'page_size': 2})
+        self.assertIsNone(response.data['previous'])
+        while True:
+            pages.append([product['title'] for product in response.data['results']])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        for page in reversed(pages[:-1]):
+            response = self.client.get(response.data['previous'])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([product['title'] for product in response.data['results']], page)
+            self.assertIsNotNone(response.data['next'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_page_number_pagination_is_the_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,117 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from marketplace.models import Review
+from .batching import id_range_batches
+from .models import Product, Category
+from .ratings import reconcile_ratings
+from .search import search_products
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.reviewers = [
+            User.objects.create_user(
+                email=f'reviewer{i}@example.com', username=f'reviewer{i}', password='testpass123'
+            )
+            for i in range(3)
+        ]
+        category = Category.objects.create(name='Books')
+        self.product, self.other = [
+            Product.objects.create(
+                title=title, description='Lightly used', price=10,
+                student=seller.student_profile, category=category
+            )
+            for title in ('Calculus Textbook', 'Physics Textbook')
+        ]
+
+    def assertRating(self, product, rating_sum, rating_count, avg_rating):
+        product.refresh_from_db()
+        self.assertEqual(
+            (product.rating_sum, product.rating_count, product.avg_rating),
+            (rating_sum, rating_count, avg_rating)
+        )
+
+    def test_reviews_update_aggregates(self):
+        first = Review.objects.create(product=self.product, reviewer=self.reviewers[0], rating=5)
+        Review.objects.create(product=self.product, reviewer=self.reviewers[1], rating=2)
+        self.assertRating(self.product, 7, 2, 3.5)
+        self.assertEqual(self.product.review_count, 2)
+
+        first.rating = 4
+        first.save()
+        self.assertRating(self.product, 6, 2, 3.0)
+
+        first.product = self.other
+        first.save()
+        self.assertRating(self.product, 2, 1, 2.0)
+        self.assertRating(self.other, 4, 1, 4.0)
+
+        first.delete()
+        self.assertRating(self.other, 0, 0, 0.0)
+
+    def test_saving_a_stale_product_keeps_aggregates(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        Review.objects.create(product=self.product, reviewer=self.reviewers[0], rating=5)
+        stale.title = 'Calculus Textbook, 2nd edition'
+        with CaptureQueriesContext(connection) as queries:
+            stale.save()
+        self.assertRating(self.product, 5, 1, 5.0)
+
+        update = next(query['sql'] for query in queries if query['sql'].startswith('UPDATE'))
+        for field in Product._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            if field.name in Product.UNSAVED_FIELDS:
+                self.assertNotIn(f'"{field.column}"', update)
+            else:
+                self.assertIn(f'"{field.column}"', update)
+
+    def test_plain_save_still_writes_other_fields(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        stale.title = 'Calculus Textbook, 2nd edition'
+        stale.price = 12
+        stale.stock = 7
+        stale.is_active = False
+        stale.save()
+
+        fresh = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(
+            (fresh.title, fresh.price, fresh.stock, fresh.is_active),
+            ('Calculus Textbook, 2nd edition', 12, 7, False)
+        )
+
+    def test_reconcile_repairs_drift(self):
+        Review.objects.bulk_create([
+            Review(product=self.product, reviewer=self.reviewers[0], rating=3),
+            Review(product=self.product, reviewer=self.reviewers[1], rating=4),
+        ])
+        self.assertRating(self.product, 0, 0, 0.0)
+        self.assertEqual(reconcile_ratings(), 2)
+        self.assertRating(self.product, 7, 2, 3.5)
+        self.assertRating(self.other, 0, 0, 0.0)
+
+    def test_reconcile_walks_id_ranges(self):
+        Review.objects.bulk_create([
+            Review(product=self.product, reviewer=self.reviewers[0], rating=3),
+            Review(product=self.other, reviewer=self.reviewers[1], rating=4),
+        ])
+        batches = list(id_range_batches(Product.objects.all(), batch_size=1))
+        self.assertEqual([list(batch.values_list('id', flat=True)) for batch in batches],
+                         [[self.product.id], [self.other.id]])
+
+        self.assertEqual(sum(reconcile_ratings(batch) for batch in batches), 2)
+        self.assertRating(self.product, 3, 1, 3.0)
+        self.assertRating(self.other, 4, 1, 4.0)
+
+    def test_rating_sort_reads_stored_column(self):
+        Review.objects.create(product=self.other, reviewer=self.reviewers[0], rating=5)
+        Review.objects.create(product=self.product, reviewer=self.reviewers[1], rating=3)
+        results = search_products(filters={'sort_by': 'rating'})
+        self.assertEqual([p.title for p in results], ['Physics Textbook', 'Calculus Textbook'])
+        self.assertNotIn('marketplace_review', str(results.query))
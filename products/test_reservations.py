@@ -0,0 +1,216 @@
+import asyncio
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from marketplace.models import Cart, CartItem
+from orders.models import Order, OrderItem
+from . import reservations
+from .models import Product, Category, StockReservation
+from .sweeper import ReservationSweeperMiddleware, sweep_once
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        books = Category.objects.create(name='Books')
+        self.calculus, self.physics = [
+            Product.objects.create(
+                title=title, description='Lightly used', price=price, stock=3,
+                student=self.user.student_profile, category=books
+            )
+            for title, price in [('Calculus', 10), ('Physics', 25)]
+        ]
+
+    def reserved(self, product):
+        product.refresh_from_db()
+        return product.reserved_stock
+
+    def test_reserves_whole_cart_or_nothing(self):
+        reserved, products = reservations.reserve({self.calculus.id: 2, self.physics.id: 1})
+        self.assertEqual(len(reserved), 2)
+        self.assertEqual(products[self.calculus.id].reserved_stock, 2)
+        self.assertEqual((self.reserved(self.calculus), self.reserved(self.physics)), (2, 1))
+
+        with self.assertRaises(reservations.InsufficientStock) as raised:
+            reservations.reserve([(self.calculus.id, 1), (self.physics.id, 1), (self.calculus.id, 1)])
+        self.assertEqual(raised.exception.shortages, {self.calculus.id: 1})
+        # The line that fit was rolled back with the one that did not
+        self.assertEqual((self.reserved(self.calculus), self.reserved(self.physics)), (2, 1))
+
+        with self.assertRaises(Product.DoesNotExist):
+            reservations.reserve({0: 1})
+
+    def test_expired_reservations_are_reclaimed(self):
+        reservations.reserve({self.calculus.id: 3}, ttl=-1)
+        # The lapsed hold is released before checking availability
+        reservations.reserve({self.calculus.id: 3})
+        self.assertEqual(self.reserved(self.calculus), 3)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        reservations.reserve({self.physics.id: 1}, ttl=-1)
+        self.assertEqual(reservations.release_expired(batch_size=1), 4)
+        self.assertEqual((self.reserved(self.calculus), self.reserved(self.physics)), (0, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_confirm_and_release(self):
+        reservations.reserve({self.calculus.id: 2, self.physics.id: 1})
+        self.assertEqual(reservations.confirm(StockReservation.objects.filter(product=self.calculus)), 2)
+        self.calculus.refresh_from_db()
+        self.assertEqual((self.calculus.stock, self.calculus.reserved_stock), (1, 0))
+
+        self.assertEqual(reservations.release(StockReservation.objects.all()), 1)
+        self.physics.refresh_from_db()
+        self.assertEqual((self.physics.stock, self.physics.reserved_stock), (3, 0))
+
+    def test_product_reserve_stock_updates_instance(self):
+        self.assertTrue(self.calculus.reserve_stock(2))
+        self.assertEqual(self.calculus.reserved_stock, 2)
+        with self.assertRaises(ValidationError):
+            self.calculus.reserve_stock(2)
+        self.assertTrue(self.calculus.release_stock(1))
+        self.assertEqual((self.calculus.reserved_stock, self.reserved(self.calculus)), (1, 1))
+
+    def test_paid_order_is_sold_after_its_hold_expired(self):
+        from payment.views import mark_paid
+
+        order = Order.objects.create(user=self.user, reference='ORD-LATE', total_amount=45, payment_method='MPESA')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.calculus, quantity=2, price=10),
+            OrderItem(order=order, product=self.physics, quantity=1, price=25),
+        ])
+        reservations.reserve({self.calculus.id: 2, self.physics.id: 1}, order=order, ttl=-1)
+        reservations.release_expired()
+        # Another buyer holds two of the three Physics copies meanwhile
+        reservations.reserve({self.physics.id: 2})
+        reservations.reserve({self.physics.id: 1}, ttl=-1)
+
+        self.assertEqual(reservations.confirm_order(order), {})
+        self.calculus.refresh_from_db()
+        self.physics.refresh_from_db()
+        self.assertEqual((self.calculus.stock, self.physics.stock), (1, 2))
+
+        # With nothing left to sell the shortfall is reported, not oversold
+        reservations.reserve({self.calculus.id: 1})
+        late = Order.objects.create(user=self.user, reference='ORD-LATER', total_amount=20, payment_method='MPESA')
+        OrderItem.objects.create(order=late, product=self.calculus, quantity=1, price=10)
+        self.assertEqual(mark_paid(late), {self.calculus.id: 1})
+        late.refresh_from_db()
+        self.assertTrue(late.payment_status)
+        self.assertIn(f'1 x product {self.calculus.id}', late.notes)
+        self.calculus.refresh_from_db()
+        self.assertEqual((self.calculus.stock, self.calculus.reserved_stock), (1, 1))
+
+    def test_confirming_a_paid_order_again_sells_nothing(self):
+        from payment.views import mark_paid
+
+        order = Order.objects.create(user=self.user, reference='ORD-TWICE', total_amount=10, payment_method='MPESA')
+        OrderItem.objects.create(order=order, product=self.calculus, quantity=1, price=10)
+        reservations.reserve({self.calculus.id: 1}, order=order)
+
+        self.assertEqual(mark_paid(order), {})
+        # The status poll and the callback both report the same payment
+        self.assertIsNone(mark_paid(Order.objects.get(pk=order.pk)))
+        self.calculus.refresh_from_db()
+        self.assertEqual((self.calculus.stock, self.calculus.reserved_stock), (2, 0))
+
+    def test_order_create_reserves_stock(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/api/orders/orders/'
+
+        response = client.post(url, {
+            'payment_method': 'CASH',
+            'items': [
+                {'product_id': self.calculus.id, 'quantity': 2},
+                {'product_id': self.physics.id, 'quantity': 1},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, 45)
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 2)
+        self.assertEqual(order.stock_reservations.count(), 2)
+
+        response = client.post(url, {
+            'payment_method': 'CASH',
+            'items': [{'product_id': self.calculus.id, 'quantity': 2}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.reserved(self.calculus), 2)
+
+
+class CartHoldTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123'
+        )
+        books = Category.objects.create(name='Books')
+        self.product = Product.objects.create(
+            title='Calculus', description='Lightly used', price=10, stock=3,
+            student=self.user.student_profile, category=books
+        )
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def reserved(self):
+        self.product.refresh_from_db()
+        return self.product.reserved_stock
+
+    def test_hold_replaces_previous_cart_hold(self):
+        response = self.client.post('/api/marketplace/cart/hold/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], {self.product.id: 2})
+
+        CartItem.objects.filter(cart=self.cart).update(quantity=3)
+        self.assertEqual(self.client.post('/api/marketplace/cart/hold/').status_code, 200)
+        self.assertEqual(self.reserved(), 3)
+        self.assertEqual(self.cart.stock_reservations.count(), 1)
+
+        CartItem.objects.filter(cart=self.cart).update(quantity=4)
+        response = self.client.post('/api/marketplace/cart/hold/')
+        self.assertEqual(response.status_code, 409)
+        # The failed attempt kept the previous hold
+        self.assertEqual(self.reserved(), 3)
+
+    def test_order_takes_over_cart_hold(self):
+        reservations.hold_cart(self.cart)
+        response = self.client.post('/api/orders/orders/', {
+            'payment_method': 'CASH',
+            'items': [{'product_id': self.product.id, 'quantity': 3}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.reserved(), 3)
+        self.assertEqual(StockReservation.objects.get().order, Order.objects.get())
+
+    def test_sweeper_releases_expired_holds(self):
+        reservations.hold_cart(self.cart, ttl=-1)
+        self.cart.delete()
+        self.assertEqual(sweep_once(), 2)
+        self.assertEqual(self.reserved(), 0)
+
+    def test_sweeper_middleware_starts_one_task(self):
+        calls = []
+
+        async def app(scope, receive, send):
+            calls.append(scope['type'])
+
+        async def run():
+            middleware = ReservationSweeperMiddleware(app, interval=3600)
+            await middleware({'type': 'http'}, None, None)
+            task = middleware.task
+            await middleware({'type': 'websocket'}, None, None)
+            self.assertIs(middleware.task, task)
+            task.cancel()
+
+        asyncio.run(run())
+        self.assertEqual(calls, ['http', 'websocket'])
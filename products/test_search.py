@@ -0,0 +1,224 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from .models import Product, Category
+from .search import (
+    PostgresSearchBackend, search_products, search_facets, get_search_backend, reset_search_backend
+)
+from .search_engine import InvertedIndex, ProductIndex, tokenize
+
+
+class InvertedIndexTests(TestCase):
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.index.add(1, {'title': 'Calculus Textbook', 'description': 'Early transcendentals', 'category': 'Books'})
+        self.index.add(2, {
+            'title': 'Desk lamp', 'description': 'Good for reading calculus notes', 'category': 'Furniture'
+        })
+        self.index.add(3, {'title': 'Physics Textbook', 'description': 'Mechanics and waves', 'category': 'Books'})
+
+    def test_tokenize_drops_stop_words(self):
+        self.assertEqual(tokenize('The Art of Calculus'), ['art', 'calculus'])
+
+    def test_title_match_outranks_description_match(self):
+        ranked = [doc_id for doc_id, _ in self.index.search('calculus')]
+        self.assertEqual(ranked, [1, 2])
+
+    def test_typo_is_matched_by_trigrams(self):
+        ranked = [doc_id for doc_id, _ in self.index.search('calculsu')]
+        self.assertIn(1, ranked)
+
+    def test_remove_and_reindex(self):
+        self.index.remove(1)
+        self.assertNotIn(1, [doc_id for doc_id, _ in self.index.search('calculus')])
+        self.index.add(3, {'title': 'Calculus workbook'})
+        ranked = [doc_id for doc_id, _ in self.index.search('calculus')]
+        self.assertEqual(ranked[0], 3)
+        self.assertEqual(self.index.search('physics'), [])
+
+
+@override_settings(PRODUCT_SEARCH_BACKEND='inmemory')
+class InMemorySearchBackendTests(TestCase):
+    def setUp(self):
+        reset_search_backend()
+        user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.student = user.student_profile
+        self.books = Category.objects.create(name='Books')
+        self.calculus = self.create_product('Calculus Textbook')
+        self.create_product('Chemistry Lab Coat')
+
+    def create_product(self, title, **kwargs):
+        return Product.objects.create(
+            title=title,
+            description='Lightly used',
+            price=10,
+            student=self.student,
+            category=self.books,
+            **kwargs
+        )
+
+    def titles(self, query):
+        return [product.title for product in search_products(query=query)]
+
+    def test_search_ranks_matches(self):
+        self.assertEqual(self.titles('calculus'), ['Calculus Textbook'])
+        self.assertEqual(self.titles('chemistri'), ['Chemistry Lab Coat'])
+        self.assertEqual(self.titles('geography'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        get_search_backend().index.ensure_built()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            algebra = self.create_product('Linear Algebra')
+        self.assertEqual(self.titles('algebra'), ['Linear Algebra'])
+
+        # Deletes reach the index through the backend hook run by post_delete
+        with self.captureOnCommitCallbacks(execute=True):
+            self.calculus.is_active = False
+            self.calculus.save()
+            get_search_backend().remove_product(algebra.id)
+        self.assertEqual(self.titles('calculus'), [])
+        self.assertEqual(self.titles('algebra'), [])
+
+    def test_filters_apply_before_the_result_cutoff(self):
+        lab = Category.objects.create(name='Lab Gear')
+        for number in range(3):
+            self.create_product(f'Calculus workbook {number}')
+        # Matches on description only, so it ranks below every title match
+        Product.objects.create(
+            title='Goggles', description='Worn once in calculus class', price=10,
+            student=self.student, category=lab
+        )
+
+        with mock.patch('products.search.MAX_INDEX_RESULTS', 2):
+            products = search_products(query='calculus', filters={'category': lab.id})
+            self.assertEqual([product.title for product in products], ['Goggles'])
+            self.assertEqual(len(search_products(query='calculus')), 2)
+
+    def test_stale_index_is_rebuilt_without_blocking_searches(self):
+        index = ProductIndex(max_age=60)
+        index.ensure_built()
+        stale = index.index
+        index.built_at -= 120
+
+        started, release = threading.Event(), threading.Event()
+
+        def slow_rebuild():
+            started.set()
+            release.wait(5)
+            index.built_at += 120
+
+        with mock.patch.object(index, 'rebuild', slow_rebuild):
+            self.assertIs(index.ensure_built(), stale)
+            self.assertTrue(started.wait(5))
+            # A second stale search does not start another rebuild
+            self.assertIs(index.ensure_built(), stale)
+            release.set()
+
+    def test_changes_during_a_rebuild_survive_the_swap(self):
+        algebra = self.create_product('Linear Algebra')
+        index = ProductIndex(max_age=60)
+        index.ensure_built()
+        add = InvertedIndex.add
+        changed = []
+
+        def add_and_change(inverted_index, doc_id, fields):
+            # Saves committed while the rebuild is reading the table
+            if inverted_index is not index.index and not changed:
+                changed.append(doc_id)
+                algebra.title = 'Abstract Algebra'
+                index.update_product(algebra)
+                index.remove_product(self.calculus.id)
+            return add(inverted_index, doc_id, fields)
+
+        with mock.patch.object(InvertedIndex, 'add', add_and_change):
+            index.rebuild()
+
+        self.assertTrue(changed)
+        self.assertEqual([doc_id for doc_id, _ in index.search('abstract')], [algebra.id])
+        self.assertNotIn(self.calculus.id, [doc_id for doc_id, _ in index.search('calculus')])
+
+    def test_category_rename_reindexes_products(self):
+        get_search_backend().index.ensure_built()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books.name = 'Stationery'
+            self.books.save()
+        self.assertEqual(len(self.titles('stationery')), 2)
+
+
+class PostgresSearchBackendTests(SimpleTestCase):
+    def test_typos_are_matched_on_title_description_and_category(self):
+        queryset = PostgresSearchBackend().apply(Product.objects.all(), 'calculsu')
+        fields = [('Product', 'title'), ('Product', 'description'), ('Category', 'name')]
+
+        def column(expression):
+            return expression.target.model.__name__, expression.target.name
+
+        similarity = queryset.query.annotations['similarity']
+        self.assertEqual(
+            [column(expression.get_source_expressions()[0]) for expression in similarity.get_source_expressions()],
+            fields
+        )
+        trigram_filters = [
+            column(lookup.lhs) for lookup in queryset.query.where.children[0].children
+            if lookup.lookup_name == 'trigram_similar'
+        ]
+        self.assertEqual(trigram_filters, fields)
+
+
+@override_settings(PRODUCT_SEARCH_BACKEND='inmemory')
+class SearchFacetsTests(TestCase):
+    def setUp(self):
+        reset_search_backend()
+        user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.user = user
+        books = Category.objects.create(name='Books')
+        lab = Category.objects.create(name='Lab Gear')
+        for title, price, category, condition in [
+            ('Calculus Textbook', 10, books, 'new'),
+            ('Physics Textbook', 30, books, 'good'),
+            ('Chemistry Textbook', 50, books, 'good'),
+            ('Lab Coat', 20, lab, 'new'),
+        ]:
+            Product.objects.create(
+                title=title, description='Lightly used', price=price,
+                student=user.student_profile, category=category, condition=condition
+            )
+
+    def test_facets_use_two_queries(self):
+        with self.assertNumQueries(2):
+            facets = search_facets(search_products())
+
+        self.assertEqual(facets['total_results'], 4)
+        self.assertEqual(
+            [(c['name'], c['product_count']) for c in facets['categories']],
+            [('Books', 3), ('Lab Gear', 1)]
+        )
+        self.assertEqual(
+            {c['value']: c['count'] for c in facets['conditions']},
+            {'new': 2, 'good': 2}
+        )
+        self.assertEqual(facets['price_range'], {'min': 10, 'max': 50})
+        self.assertEqual([b['count'] for b in facets['price_histogram']], [1, 1, 1, 0, 1])
+
+    def test_search_view_is_cached_per_normalized_query(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        cache.clear()
+
+        response = client.get('/api/marketplace/search/', {'q': 'Textbook', 'sort_by': 'price_asc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_results'], 3)
+        self.assertEqual(response.data['products'][0]['title'], 'Calculus Textbook')
+
+        with self.assertNumQueries(0):
+            cached = client.get('/api/marketplace/search/', {'q': '  textbook ', 'sort_by': 'price_asc'})
+        self.assertEqual(cached.data, response.data)
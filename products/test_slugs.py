@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from .models import Product, Category
+from .slugs import assign_unique_slugs, unique_slug
+
+
+class ProductSlugTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        self.student = user.student_profile
+        self.category = Category.objects.create(name='Books')
+
+    def build_product(self, title, **kwargs):
+        return Product(
+            title=title, description='Lightly used', price=10,
+            student=self.student, category=self.category, **kwargs
+        )
+
+    def create_product(self, title, **kwargs):
+        product = self.build_product(title, **kwargs)
+        product.save()
+        return product
+
+    def test_collisions_continue_from_highest_suffix(self):
+        self.create_product('Calculus Textbook')
+        self.create_product('Calculus Textbook', slug='calculus-textbook-7')
+        self.create_product('Calculus Textbook 2nd Edition')
+
+        with self.assertNumQueries(1):
+            slug = unique_slug('Calculus Textbook', Product.objects.all())
+        self.assertEqual(slug, 'calculus-textbook-8')
+        self.assertEqual(unique_slug('Physics', Product.objects.all()), 'physics')
+        self.assertEqual(unique_slug('!!!', Product.objects.all()), 'product')
+
+    def test_assign_unique_slugs_for_batch(self):
+        self.create_product('Calculus Textbook')
+        products = [
+            self.build_product('Calculus Textbook'),
+            self.build_product('Calculus Textbook'),
+            self.build_product('Lab Coat'),
+            self.build_product('Lab Coat', slug='custom-coat'),
+        ]
+
+        with self.assertNumQueries(1):
+            assign_unique_slugs(products)
+        self.assertEqual(
+            [product.slug for product in products],
+            ['calculus-textbook-1', 'calculus-textbook-2', 'lab-coat', 'custom-coat']
+        )
+        Product.objects.bulk_create(products)
+
+    def test_overlapping_bases_are_counted_separately(self):
+        self.create_product('Lab Coat', slug='lab-coat-2')
+        self.create_product('Lab Coat', slug='lab-coat-2-5')
+        self.create_product('Lab Coat', slug='lab-coat-large')
+
+        products = [self.build_product('Lab Coat'), self.build_product('Lab Coat 2')]
+        with self.assertNumQueries(1):
+            assign_unique_slugs(products)
+        self.assertEqual([product.slug for product in products], ['lab-coat-3', 'lab-coat-2-6'])
+
+    def test_save_retries_when_slug_is_taken_concurrently(self):
+        self.create_product('Lab Coat')
+
+        # The first lookup races with another insert and returns a taken slug
+        with mock.patch('products.models.unique_slug', side_effect=['lab-coat', 'lab-coat-1']):
+            product = self.create_product('Lab Coat')
+        self.assertEqual(product.slug, 'lab-coat-1')
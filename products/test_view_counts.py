@@ -0,0 +1,132 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import Product, Category, ProductViewTrack
+from .view_counts import (
+    LocalViewBuffer, RedisViewBuffer, decode_event, encode_event, flush_views, get_client_ip,
+    prune_view_tracks, record_view, reset_view_buffer
+)
+
+
+class ViewEventTests(TestCase):
+    def test_events_round_trip_with_ipv6(self):
+        self.assertEqual(decode_event(encode_event(3, None, '::1')), (3, None, '::1'))
+        self.assertEqual(decode_event(encode_event(3, 'a1b2', '10.0.0.1').encode()), (3, 'a1b2', '10.0.0.1'))
+
+
+class ClientIpTests(SimpleTestCase):
+    def request(self, remote_addr, forwarded=None):
+        extra = {'REMOTE_ADDR': remote_addr}
+        if forwarded is not None:
+            extra['HTTP_X_FORWARDED_FOR'] = forwarded
+        return RequestFactory().get('/', **extra)
+
+    def test_forwarded_header_is_only_read_behind_trusted_proxies(self):
+        spoofed = self.request('10.0.0.1', '1.2.3.4')
+        self.assertEqual(get_client_ip(spoofed), '10.0.0.1')
+        # The proxy appends the address it saw; anything before it is the client's say
+        self.assertEqual(get_client_ip(self.request('10.0.0.1', '1.2.3.4, 203.0.113.9'), 1), '203.0.113.9')
+        self.assertEqual(get_client_ip(self.request('10.0.0.1', ''), 1), '10.0.0.1')
+
+    def test_invalid_addresses_are_not_used(self):
+        self.assertEqual(get_client_ip(self.request('10.0.0.1', 'not-an-ip'), 1), '10.0.0.1')
+        self.assertEqual(get_client_ip(self.request('bogus')), '0.0.0.0')
+        self.assertEqual(get_client_ip(self.request('2001:DB8::1')), '2001:db8::1')
+
+
+class BufferedViewCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_view_buffer()
+        self.user = get_user_model().objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123'
+        )
+        category = Category.objects.create(name='Books')
+        self.product = Product.objects.create(
+            title='Calculus Textbook', description='Lightly used', price=10,
+            student=self.user.student_profile, category=category
+        )
+        self.other = Product.objects.create(
+            title='Physics Textbook', description='Lightly used', price=10,
+            student=self.user.student_profile, category=category
+        )
+        self.buffer = LocalViewBuffer(flush_interval=3600)
+
+    def views(self, product):
+        product.refresh_from_db(fields=['views_count'])
+        return product.views_count
+
+    def test_flush_counts_each_viewer_once_per_window(self):
+        for _ in range(3):
+            self.buffer.record(self.product.id, self.user.id, '10.0.0.1')
+        self.buffer.record(self.product.id, None, '10.0.0.2')
+        self.buffer.record(self.other.id, None, '10.0.0.2')
+
+        with self.assertNumQueries(6):
+            self.assertEqual(flush_views(self.buffer), 3)
+        self.assertEqual(self.views(self.product), 2)
+        self.assertEqual(self.views(self.other), 1)
+
+        # Same viewers inside the window are not counted again
+        self.buffer.record(self.product.id, self.user.id, '10.0.0.1')
+        self.assertEqual(flush_views(self.buffer), 0)
+
+        # After the window they are
+        ProductViewTrack.objects.update(timestamp=timezone.now() - timedelta(days=1))
+        self.buffer.record(self.product.id, self.user.id, '10.0.0.1')
+        self.assertEqual(flush_views(self.buffer), 1)
+        self.assertEqual(self.views(self.product), 3)
+
+    def test_detail_views_do_not_write_to_products(self):
+        client = APIClient()
+        url = f'/api/products/products/{self.product.slug}/'
+        self.assertEqual(client.get(url).status_code, 200)
+        self.assertEqual(client.get(url).status_code, 200)
+        self.assertEqual(self.views(self.product), 0)
+
+        flush_views()
+        self.assertEqual(self.views(self.product), 1)
+
+    def test_failed_flush_keeps_views_and_never_fails_the_request(self):
+        buffer = LocalViewBuffer(flush_interval=0)
+        buffer.record(self.product.id, None, 'junk')
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.5')
+        request.user = self.user
+
+        with mock.patch('products.view_counts.get_view_buffer', return_value=buffer), \
+                mock.patch('products.view_counts._count_views', side_effect=RuntimeError('db down')):
+            record_view(self.product.id, request)
+        # The unparseable event was dropped, the real view requeued
+        self.assertEqual(buffer.drain(), {(self.product.id, str(self.user.id), '10.0.0.5')})
+
+    def test_anonymous_viewers_get_one_track_per_address(self):
+        self.buffer.record(self.product.id, None, '10.0.0.1')
+        flush_views(self.buffer)
+        # A concurrent flush inserting the same anonymous viewer is a conflict, not a second row
+        ProductViewTrack.objects.bulk_create(
+            [ProductViewTrack(product=self.product, user=None, ip_address='10.0.0.1')], ignore_conflicts=True
+        )
+        self.assertEqual(ProductViewTrack.objects.filter(product=self.product).count(), 1)
+
+    def test_redis_buffer_is_flushed_once_per_interval(self):
+        connection = mock.Mock()
+        connection.set.side_effect = [True, None]
+        buffer = RedisViewBuffer(connection, flush_interval=60)
+
+        self.assertTrue(buffer.should_flush())
+        self.assertFalse(buffer.should_flush())
+        connection.set.assert_called_with(f'{buffer.key}:flushed', 1, nx=True, ex=60)
+
+    def test_tracks_past_the_window_are_pruned(self):
+        self.buffer.record(self.product.id, None, '10.0.0.1')
+        self.buffer.record(self.other.id, None, '10.0.0.1')
+        flush_views(self.buffer)
+        ProductViewTrack.objects.filter(product=self.other).update(timestamp=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(prune_view_tracks(), 1)
+        self.assertEqual(list(ProductViewTrack.objects.values_list('product_id', flat=True)), [self.product.id])
@@ -0,0 +1,254 @@
+"""
+Write-behind product view counters.
+
+Detail views record ``(product, user, ip)`` events in a buffer instead of
+updating ``Product.views_count`` directly. ``flush_views`` drains the
+buffer, drops viewers already counted within ``PRODUCT_VIEW_DEDUPE_WINDOW``
+(tracked in ``ProductViewTrack``) and applies the remaining counts with a
+single ``UPDATE``. With the Redis cache the buffer is a Redis set shared by
+every worker; otherwise it is in-process. Either way the first request
+after each ``PRODUCT_VIEW_FLUSH_INTERVAL`` seconds flushes it inline, and
+the ``flush_product_views`` command can drain it on demand. Tracks older
+than the dedupe window no longer affect counting and are pruned after each
+flush.
+
+Viewer addresses come from ``REMOTE_ADDR``. ``X-Forwarded-For`` is only
+read behind ``PRODUCT_VIEW_TRUSTED_PROXIES`` reverse proxies, since
+clients can set it to anything.
+"""
+import ipaddress
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_WINDOW = getattr(settings, 'PRODUCT_VIEW_DEDUPE_WINDOW', 3600)
+FLUSH_INTERVAL = getattr(settings, 'PRODUCT_VIEW_FLUSH_INTERVAL', 60)
+REDIS_BUFFER_KEY = 'products:views:pending'
+# Reverse proxies in front of the app that append to X-Forwarded-For
+TRUSTED_PROXIES = getattr(settings, 'PRODUCT_VIEW_TRUSTED_PROXIES', 0)
+UNKNOWN_IP = '0.0.0.0'
+
+
+def encode_event(product_id, user_id, ip_address):
+    return f'{product_id}:{user_id or ""}:{ip_address}'
+
+
+def decode_event(member):
+    if isinstance(member, bytes):
+        member = member.decode()
+    # Split at most twice so IPv6 addresses stay intact
+    product_id, user_id, ip_address = member.split(':', 2)
+    return int(product_id), user_id or None, ip_address
+
+
+class LocalViewBuffer:
+    """In-process buffer, flushed by the request that finds it due"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._events = set()
+        self._last_flush = time.monotonic()
+
+    def record(self, product_id, user_id, ip_address):
+        with self._lock:
+            self._events.add(encode_event(product_id, user_id, ip_address))
+
+    def should_flush(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def drain(self):
+        with self._lock:
+            events, self._events = self._events, set()
+            self._last_flush = time.monotonic()
+        return {decode_event(member) for member in events}
+
+
+class RedisViewBuffer:
+    """
+    Shared buffer in a Redis set. ``SADD`` collapses repeat views within a
+    flush period; draining renames the set first so views recorded during
+    a flush land in a fresh one.
+    """
+
+    def __init__(self, connection, key=REDIS_BUFFER_KEY, flush_interval=FLUSH_INTERVAL):
+        self.connection = connection
+        self.key = key
+        self.flush_interval = flush_interval
+
+    def record(self, product_id, user_id, ip_address):
+        self.connection.sadd(self.key, encode_event(product_id, user_id, ip_address))
+
+    def should_flush(self):
+        # The one request per interval, across all workers, that sets the marker flushes
+        return bool(self.connection.set(f'{self.key}:flushed', 1, nx=True, ex=self.flush_interval))
+
+    def drain(self):
+        from redis.exceptions import ResponseError
+
+        processing_key = f'{self.key}:{uuid.uuid4().hex}'
+        try:
+            self.connection.rename(self.key, processing_key)
+        except ResponseError:
+            # Nothing buffered
+            return set()
+        pipe = self.connection.pipeline()
+        pipe.smembers(processing_key)
+        pipe.delete(processing_key)
+        members, _ = pipe.execute()
+        return {decode_event(member) for member in members}
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_view_buffer():
+    """Redis buffer when the default cache is django-redis, else in-process"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                try:
+                    from django_redis import get_redis_connection
+                    _buffer = RedisViewBuffer(get_redis_connection('default'))
+                except (ImportError, NotImplementedError):
+                    _buffer = LocalViewBuffer()
+    return _buffer
+
+
+def reset_view_buffer():
+    global _buffer
+    _buffer = None
+
+
+def clean_ip(value):
+    """``value`` as a normalised IP address, or ``None`` if it is not one"""
+    try:
+        return str(ipaddress.ip_address((value or '').strip()))
+    except ValueError:
+        return None
+
+
+def get_client_ip(request, trusted_proxies=None):
+    """
+    The viewer's address. With ``trusted_proxies`` proxies in front of the
+    app, it is the address the outermost of them appended to
+    ``X-Forwarded-For``; entries further left are client supplied.
+    """
+    trusted_proxies = TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies
+    if trusted_proxies:
+        forwarded = [part for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= trusted_proxies:
+            ip_address = clean_ip(forwarded[-trusted_proxies])
+            if ip_address:
+                return ip_address
+    return clean_ip(request.META.get('REMOTE_ADDR')) or UNKNOWN_IP
+
+
+def record_view(product_id, request):
+    """Buffer a product view; never touches the products table"""
+    user_id = request.user.id if request.user.is_authenticated else None
+    buffer = get_view_buffer()
+    try:
+        buffer.record(product_id, user_id, get_client_ip(request))
+    except Exception as e:
+        # A lost view is better than a failed page
+        logger.warning(f"Could not record view for product {product_id}: {str(e)}")
+        return
+    try:
+        if buffer.should_flush():
+            flush_views(buffer)
+            prune_view_tracks()
+    except Exception as e:
+        logger.error(f"Could not flush product views: {str(e)}")
+
+
+def flush_views(buffer=None):
+    """
+    Apply buffered views to ``Product.views_count`` and return how many
+    were counted. Viewers whose last counted view of a product is inside
+    the dedupe window are skipped.
+    """
+    buffer = buffer or get_view_buffer()
+    # Events buffered before addresses were validated could abort the insert
+    events = {event for event in buffer.drain() if clean_ip(event[2]) == event[2]}
+    if not events:
+        return 0
+
+    try:
+        return _count_views(events)
+    except Exception:
+        # Put the views back for the next flush rather than losing them
+        for event in events:
+            buffer.record(*event)
+        raise
+
+
+def _count_views(events):
+    from .models import Product, ProductViewTrack
+
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=DEDUPE_WINDOW)
+    counts = Counter()
+
+    with transaction.atomic():
+        tracks = {
+            (track.product_id, str(track.user_id) if track.user_id else None, track.ip_address): track
+            for track in ProductViewTrack.objects.filter(
+                product_id__in={product_id for product_id, _, _ in events},
+                ip_address__in={ip_address for _, _, ip_address in events},
+            )
+        }
+        existing = set(Product.objects.filter(
+            id__in={product_id for product_id, _, _ in events}
+        ).values_list('id', flat=True))
+
+        new_tracks, expired_tracks = [], []
+        for product_id, user_id, ip_address in events:
+            if product_id not in existing:
+                continue
+            track = tracks.get((product_id, user_id, ip_address))
+            if track is None:
+                new_tracks.append(ProductViewTrack(
+                    product_id=product_id, user_id=user_id, ip_address=ip_address, timestamp=now
+                ))
+            elif track.timestamp <= cutoff:
+                track.timestamp = now
+                expired_tracks.append(track)
+            else:
+                continue
+            counts[product_id] += 1
+
+        ProductViewTrack.objects.bulk_create(new_tracks, batch_size=1000, ignore_conflicts=True)
+        ProductViewTrack.objects.bulk_update(expired_tracks, ['timestamp'], batch_size=1000)
+
+        if counts:
+            Product.objects.filter(id__in=counts).update(views_count=F('views_count') + Case(
+                *[When(id=product_id, then=Value(count)) for product_id, count in counts.items()],
+                output_field=PositiveIntegerField()
+            ))
+
+    return sum(counts.values())
+
+
+def prune_view_tracks(now=None):
+    """
+    Delete tracks older than the dedupe window. Such a viewer is counted
+    again either way, so the table only needs the recent ones.
+    """
+    from .models import ProductViewTrack
+
+    cutoff = (now or timezone.now()) - timedelta(seconds=DEDUPE_WINDOW)
+    deleted, _ = ProductViewTrack.objects.filter(timestamp__lte=cutoff).delete()
+    return deleted
@@ -2,13 +2,14 @@ from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny, IsAuthenticated
-from django.db.models import Avg, F, Count, Sum, Q
-from django.db import models
+from django.db.models import F, Count, Sum, Q
+from django.db import models, transaction
 from django.db.models import Prefetch
 from marketplace.models import Review
+from marketplace.wishlist import overlay_wishlisted
 from django.shortcuts import get_object_or_404
-from django.core.cache import cache
-from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.core.files.storage import default_storage
 from django.utils.text import slugify
 from .models import Product, Category
 from .serializers import (
@@ -23,21 +24,27 @@ from .serializers import (
     ProductValidationSerializer,
     ImageUploadSerializer
 )
+from . import bulk_io
+from .bulk_actions import run_bulk_action
 from .search import search_products
+from .view_counts import record_view
+from .images import InvalidImage, delete_variants, store_image
+from .cache import (
+    CACHE_PREFIX,
+    PRODUCTS_TAG,
+    CATEGORIES_TAG,
+    SEARCH_TAG,
+    get_cache_key,
+    invalidate_products,
+    product_tag,
+    read_through
+)
 from users.models import Student
+from students.pagination import KeysetCursorPagination
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Cache configuration
-CACHE_TTL = getattr(settings, 'PRODUCT_CACHE_TTL', 3600)  # 1 hour default
-CACHE_PREFIX = 'products:'
-
-
-def get_cache_key(prefix, identifier):
-    """Generate cache key with prefix"""
-    return f'{CACHE_PREFIX}{prefix}:{identifier}'
-
 
 class ProductViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
@@ -45,13 +52,17 @@ class ProductViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'description', 'category__name']
     ordering_fields = ['price', 'created_at', 'title', 'stock']
     ordering = ['-created_at']
+    pagination_class = KeysetCursorPagination
     lookup_field = 'slug'
 
     def get_permissions(self):
         """
         Instantiate and return the list of permissions that this view requires.
         """
-        if self.action in ['create', 'update', 'partial_update', 'destroy', 'my_products', 'save_draft', 'manage_draft', 'publish_draft', 'bulk_action', 'update_stock']:
+        if self.action in [
+            'create', 'update', 'partial_update', 'destroy', 'my_products', 'save_draft', 'manage_draft',
+            'publish_draft', 'bulk_action', 'update_stock', 'import_products', 'export_products'
+        ]:
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [AllowAny]
@@ -59,12 +70,9 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """
-        Override get_queryset to include necessary joins and annotations.
-
-        The included annotations are:
+        Override get_queryset to include necessary joins.
 
-        - avg_rating: the average rating of the product
-        - total_sales_amount: the total amount of money the product has made in sales
+        Ratings are read from the stored avg_rating and rating_count columns.
         """
         queryset = Product.objects.select_related(
             'category',
@@ -76,25 +84,13 @@ class ProductViewSet(viewsets.ModelViewSet):
                 queryset=Review.objects.select_related('reviewer').order_by('-timestamp')
             ),
             'variants'
-        ).annotate(
-            avg_rating=Avg('reviews__rating')
         )
 
         return queryset
 
-    def increment_views(self, product, request):
-        from django.core.cache import cache
-
-        """
-        Increment product view count with rate limiting
-        """
-        # Check if the view has been recently incremented (e.g., within the last minute)
-        user_id = request.user.id if request.user.is_authenticated else 'anonymous'
-        cache_key = f'product_view_{product.id}_{user_id}'
-        if not cache.get(cache_key):
-            Product.objects.filter(id=product.id).update(views_count=F('views_count') + 1)
-            # cache to prevent frequent updates
-            cache.set(cache_key, True, 3600)  # 1 hour cooldown per user
+    def get_detail_queryset(self):
+        """Queryset for single-product responses, eager-loaded for ProductDetailSerializer"""
+        return ProductDetailSerializer.setup_eager_loading(Product.objects.all())
 
     def get_object(self):
         """Get single object with slug support"""
@@ -106,15 +102,16 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Try to get by slug first, then by ID
         from django.http import Http404
 
+        queryset = self.get_detail_queryset()
         try:
             if lookup_value.isdigit():
                 # If it's a number, try ID first
                 logger.debug(f"Trying ID lookup for: {lookup_value}")
-                product = get_object_or_404(Product, id=lookup_value, is_active=True)
+                product = get_object_or_404(queryset, id=lookup_value, is_active=True)
             else:
                 # If it's not a number, treat as slug
                 logger.debug(f"Trying slug lookup for: {lookup_value}")
-                product = get_object_or_404(Product, slug=lookup_value, is_active=True)
+                product = get_object_or_404(queryset, slug=lookup_value, is_active=True)
 
             logger.debug(f"Found product: {product.title} (slug: {product.slug})")
             return product
@@ -125,7 +122,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             if not lookup_value.isdigit():
                 try:
                     logger.debug(f"Fallback: trying ID lookup for non-digit: {lookup_value}")
-                    return get_object_or_404(Product, id=int(lookup_value), is_active=True)
+                    return get_object_or_404(queryset, id=int(lookup_value), is_active=True)
                 except (ValueError, Http404):
                     logger.error(f"Fallback also failed for {lookup_value}")
                     pass
@@ -146,27 +143,19 @@ class ProductViewSet(viewsets.ModelViewSet):
                     'detail': 'Product identifier not provided'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            cache_key = get_cache_key('detail', lookup_value)
-            cached_results = cache.get(cache_key)
-
-            if cached_results is not None:
-                logger.debug(f"Returning cached product data for: {lookup_value}")
-                return Response(cached_results)
+            cache_key = get_cache_key('detail', lookup_value, tags=[product_tag(lookup_value)])
 
-            # Get product
-            product = self.get_object()
+            def load_product():
+                product = self.get_object()
+                logger.debug(f"Caching product data for: {lookup_value}")
+                return self.get_serializer(product).data
 
-            # Increment views count
-            product.increment_views()
+            data = overlay_wishlisted(read_through(cache_key, load_product), request)
 
-            # Serialize the product
-            serializer = self.get_serializer(product)
-
-            # Cache the serialized data for 1 hour
-            logger.debug(f"Caching product data for: {lookup_value}")
-            cache.set(cache_key, serializer.data, timeout=3600)
+            # Buffered, so cached hits are counted too
+            record_view(data['id'], request)
 
-            return Response(serializer.data)
+            return Response(data)
 
         except Product.DoesNotExist:
             lookup_value = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field, 'unknown')
@@ -187,27 +176,20 @@ class ProductViewSet(viewsets.ModelViewSet):
         This method is called directly from URL patterns, not as a DRF action
         """
         try:
-            cache_key = get_cache_key('detail', slug)
-            cached_results = cache.get(cache_key)
+            cache_key = get_cache_key('detail', slug, tags=[product_tag(slug)])
 
-            if cached_results is not None:
-                logger.debug(f"Returning cached product data for slug: {slug}")
-                return Response(cached_results)
+            def load_product():
+                # Get product by slug
+                product = get_object_or_404(self.get_detail_queryset(), slug=slug, is_active=True)
+                logger.debug(f"Caching product data for slug: {slug}")
+                return ProductDetailSerializer(product, context={'request': request}).data
 
-            # Get product by slug
-            product = get_object_or_404(Product, slug=slug, is_active=True)
+            data = overlay_wishlisted(read_through(cache_key, load_product), request)
 
-            # Increment views count
-            product.increment_views()
+            # Buffered, so cached hits are counted too
+            record_view(data['id'], request)
 
-            # Serialize the product
-            serializer = ProductDetailSerializer(product, context={'request': request})
-
-            # Cache the serialized data for 1 hour
-            logger.debug(f"Caching product data for slug: {slug}")
-            cache.set(cache_key, serializer.data, timeout=3600)
-
-            return Response(serializer.data)
+            return Response(data)
 
         except Product.DoesNotExist:
             logger.warning(f"Product not found for slug: {slug}")
@@ -245,33 +227,23 @@ class ProductViewSet(viewsets.ModelViewSet):
         product.total_sales = 0
         product.total_revenue = 0
         product.save()
-        cache.delete_pattern(f'{CACHE_PREFIX}list:*')
+        invalidate_products(product)
         logger.info(f'Product created: {product.id} by student {student.id}')
 
     def perform_update(self, serializer):
         """Update product with cache management"""
+        previous_slug = serializer.instance.slug
         product = serializer.save()
-        cache.delete(get_cache_key('detail', product.slug))
-        cache.delete_pattern(f'{CACHE_PREFIX}list:*')
+        invalidate_products(product, (product.pk, previous_slug))
         logger.info(f'Product updated: {product.id}')
 
     def perform_destroy(self, instance):
         """Soft delete with cache management"""
         instance.is_active = False
         instance.save()
-        cache.delete(get_cache_key('detail', instance.slug))
-        cache.delete_pattern(f'{CACHE_PREFIX}list:*')
+        invalidate_products(instance)
         logger.info(f'Product deactivated: {instance.id}')
 
-    @action(detail=False, methods=['get'])
-    def conditions(self, request):
-        """Get list of product condition choices"""
-        conditions = [
-            {'value': choice[0], 'label': choice[1]}
-            for choice in Product.CONDITION_CHOICES
-        ]
-        return Response({'conditions': conditions})
-
     @action(detail=False, methods=['get'])
     def search(self, request):
         """Advanced product search with caching"""
@@ -279,63 +251,53 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
-        cache_key = get_cache_key('search', slugify(str(request.query_params)))
-        cached_results = cache.get(cache_key)
-        
-        if cached_results:
-            return Response(cached_results)
-
-        queryset = search_products(
-            query=data.get('query'),
-            filters={
-                'category': data.get('category'),
-                'min_price': data.get('min_price'),
-                'max_price': data.get('max_price'),
-                'condition': data.get('condition'),
-                'sort_by': data.get('sort_by'),
-                'in_stock': data.get('in_stock'),
-            }
-        )
+        cache_key = get_cache_key('search', slugify(str(request.query_params)), tags=[SEARCH_TAG])
+
+        def load_results():
+            queryset = search_products(
+                query=data.get('query'),
+                filters={
+                    'category': data.get('category'),
+                    'min_price': data.get('min_price'),
+                    'max_price': data.get('max_price'),
+                    'condition': data.get('condition'),
+                    'sort_by': data.get('sort_by'),
+                    'in_stock': data.get('in_stock'),
+                }
+            )
 
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = ProductListSerializer(page, many=True, context={'request': request})
-            response_data = self.get_paginated_response(serializer.data).data
-        else:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = ProductListSerializer(page, many=True, context={'request': request})
+                return self.get_paginated_response(serializer.data).data
             serializer = ProductListSerializer(queryset, many=True, context={'request': request})
-            response_data = serializer.data
-        
-        cache.set(cache_key, response_data, CACHE_TTL)
-        return Response(response_data)
+            return serializer.data
+
+        return Response(overlay_wishlisted(read_through(cache_key, load_results), request))
     
     @action(detail=False, methods=['get'])
     def conditions(self, request):
         """Get product condition choices for frontend forms"""
         try:
             cache_key = f'{CACHE_PREFIX}conditions'
-            cached_results = cache.get(cache_key)
-
-            if cached_results is not None:
-                return Response(cached_results)
 
-            # Convert condition choices to frontend-friendly format
-            conditions = [
-                {
-                    'value': choice[0],
-                    'label': choice[1],
-                    'display_name': choice[1]
+            def load_conditions():
+                # Convert condition choices to frontend-friendly format
+                conditions = [
+                    {
+                        'value': choice[0],
+                        'label': choice[1],
+                        'display_name': choice[1]
+                    }
+                    for choice in Product.CONDITION_CHOICES
+                ]
+                return {
+                    'conditions': conditions,
+                    'default': 'new'
                 }
-                for choice in Product.CONDITION_CHOICES
-            ]
-
-            response_data = {
-                'conditions': conditions,
-                'default': 'new'
-            }
 
             # Cache for 24 hours since conditions rarely change
-            cache.set(cache_key, response_data, 86400)
-            return Response(response_data)
+            return Response(read_through(cache_key, load_conditions, ttl=86400))
 
         except Exception as e:
             logger.error(f"Error in conditions endpoint: {str(e)}")
@@ -347,25 +309,22 @@ class ProductViewSet(viewsets.ModelViewSet):
     def featured(self, request):
         """Get featured products with caching"""
         try:
-            cache_key = get_cache_key('featured', '')
-            cached_results = cache.get(cache_key)
+            cache_key = get_cache_key('featured', '', tags=[PRODUCTS_TAG])
 
-            if cached_results is not None:
-                return Response(cached_results)
+            def load_featured():
+                queryset = self.get_queryset().filter(
+                    featured=True,
+                    stock__gt=F('reserved_stock')
+                ).order_by('-created_at')[:8]
 
-            queryset = self.get_queryset().filter(
-                featured=True,
-                stock__gt=F('reserved_stock')
-            ).order_by('-created_at')[:8]
+                serializer = ProductListSerializer(
+                    queryset,
+                    many=True,
+                    context={'request': request}
+                )
+                return serializer.data
 
-            serializer = ProductListSerializer(
-                queryset,
-                many=True,
-                context={'request': request}
-            )
-            response_data = serializer.data
-            cache.set(cache_key, response_data, CACHE_TTL)
-            return Response(response_data)
+            return Response(overlay_wishlisted(read_through(cache_key, load_featured), request))
 
         except Exception as e:
             logger.error(f"Error in featured products: {str(e)}")
@@ -377,26 +336,23 @@ class ProductViewSet(viewsets.ModelViewSet):
     def trending(self, request):
         """Get trending products based on views, sales and ratings"""
         try:
-            cache_key = get_cache_key('trending', '')
-            cached_results = cache.get(cache_key)
+            cache_key = get_cache_key('trending', '', tags=[PRODUCTS_TAG])
 
-            if cached_results is not None:
-                return Response(cached_results)
+            def load_trending():
+                # Simple approach: get products with high view counts and sales
+                # Order by a combination of views and sales
+                queryset = self.get_queryset().filter(
+                    stock__gt=F('reserved_stock')
+                ).order_by('-views_count', '-total_sales')[:8]
 
-            # Simple approach: get products with high view counts and sales
-            # Order by a combination of views and sales
-            queryset = self.get_queryset().filter(
-                stock__gt=F('reserved_stock')
-            ).order_by('-views_count', '-total_sales')[:8]
+                serializer = ProductListSerializer(
+                    queryset,
+                    many=True,
+                    context={'request': request}
+                )
+                return serializer.data
 
-            serializer = ProductListSerializer(
-                queryset,
-                many=True,
-                context={'request': request}
-            )
-            response_data = serializer.data
-            cache.set(cache_key, response_data, CACHE_TTL)
-            return Response(response_data)
+            return Response(overlay_wishlisted(read_through(cache_key, load_trending), request))
 
         except Exception as e:
             logger.error(f"Error in trending products: {str(e)}")
@@ -423,8 +379,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             else:
                 product.update_stock(new_stock)
             
-            cache.delete(get_cache_key('detail', product.slug))
-            cache.delete_pattern(f'{CACHE_PREFIX}list:*')
+            invalidate_products(product)
             serializer = self.get_serializer(product)
             return Response(serializer.data)
         except (TypeError, ValueError) as e:
@@ -433,26 +388,29 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def bulk_action(self, request):
         """Bulk actions with validation and cache management"""
-        serializer = ProductBulkActionSerializer(data=request.data)
+        serializer = ProductBulkActionSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
 
-        products = Product.objects.filter(
-            id__in=serializer.validated_data['product_ids'],
-            student__user=request.user
-        )
+        product_ids = serializer.validated_data['product_ids']
+        products = Product.objects.filter(id__in=product_ids, student__user=request.user)
 
-        if not products.exists():
-            return Response({'error': 'No valid products found'}, status=status.HTTP_404_NOT_FOUND)
+        # One UPDATE per operation, all or nothing
+        results, changed = [], {}
+        with transaction.atomic():
+            for operation in serializer.validated_data['operations']:
+                rows = run_bulk_action(products, operation)
+                results.append({'action': operation['action'], 'affected': len(rows)})
+                changed.update(rows)
 
-        action = serializer.validated_data['action']
-        update_data = {'is_active': action != 'deactivate'}
-        products.update(**update_data)
+        if not changed:
+            return Response({'error': 'No valid products found'}, status=status.HTTP_404_NOT_FOUND)
 
-        cache.delete_pattern(f'{CACHE_PREFIX}list:*')
-        for product in products:
-            cache.delete(get_cache_key('detail', product.slug))
+        invalidate_products(*changed.items())
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response({
+            'results': results,
+            'not_found': [product_id for product_id in product_ids if product_id not in changed],
+        })
 
     @action(detail=False, methods=['get'])
     def my_products(self, request):
@@ -591,7 +549,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                     product.save()
 
                     # Clear caches
-                    cache.delete_pattern(f'{CACHE_PREFIX}list:*')
+                    invalidate_products(product)
 
                     return Response(
                         ProductDetailSerializer(product, context={'request': request}).data,
@@ -625,25 +583,23 @@ class ProductViewSet(viewsets.ModelViewSet):
             try:
                 student = Student.objects.get(user=request.user)
 
-                # Save the image to media directory
-                import os
-                from django.core.files.storage import default_storage
-                from django.core.files.base import ContentFile
-                import uuid
-
-                # Generate unique filename
-                file_extension = os.path.splitext(image.name)[1]
-                unique_filename = f"product_images/{uuid.uuid4()}{file_extension}"
-
-                # Save the file
-                file_path = default_storage.save(unique_filename, ContentFile(image.read()))
+                # Sanitize and stream the image to storage. Resized variants
+                # are rendered once an image is saved on a product, where
+                # they can be recorded
+                file_path, width, height = store_image(image)
                 file_url = default_storage.url(file_path)
 
-                # Return the URL
                 return Response({
-                    'url': request.build_absolute_uri(file_url)
+                    'url': request.build_absolute_uri(file_url),
+                    'width': width,
+                    'height': height,
                 }, status=status.HTTP_201_CREATED)
 
+            except InvalidImage:
+                return Response(
+                    {'error': 'Invalid image file'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             except Student.DoesNotExist:
                 return Response(
                     {'error': 'Student profile not found'},
@@ -663,7 +619,6 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            from django.core.files.storage import default_storage
             from urllib.parse import urlparse
             import os
 
@@ -677,9 +632,10 @@ class ProductViewSet(viewsets.ModelViewSet):
             if file_path.startswith('media/'):
                 file_path = file_path[6:]
 
-            # Delete the file if it exists
+            # Delete the file and its resized variants if it exists
             if default_storage.exists(file_path):
                 default_storage.delete(file_path)
+                delete_variants(file_path)
                 return Response(status=status.HTTP_204_NO_CONTENT)
             else:
                 return Response(
@@ -694,6 +650,60 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_products(self, request):
+        """
+        Bulk-create products from a CSV or JSONL upload in ``file``.
+        Valid rows are created; invalid ones are reported by row number.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {'error': 'file is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            student = Student.objects.get(user=request.user)
+        except Student.DoesNotExist:
+            return Response(
+                {'error': 'Student profile not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            summary = bulk_io.import_products(upload, student, request.data.get('file_format'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if summary['created']:
+            invalidate_products()
+        return Response(
+            summary,
+            status=status.HTTP_201_CREATED if summary['created'] else status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export_products(self, request):
+        """Stream the user's products (every product for staff) as CSV or JSONL"""
+        fmt = request.query_params.get('file_format', 'csv')
+        if fmt not in bulk_io.FORMATS:
+            return Response(
+                {'error': f"file_format must be one of {', '.join(bulk_io.FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = Product.objects.all()
+        if not request.user.is_staff:
+            queryset = queryset.filter(student__user=request.user)
+
+        response = StreamingHttpResponse(
+            bulk_io.export_products(queryset, fmt),
+            content_type=bulk_io.CONTENT_TYPES[fmt]
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [AllowAny]
@@ -701,40 +711,43 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     lookup_field = 'slug'
 
     def get_queryset(self):
-        """Get categories with caching"""
-        cache_key = f'{CACHE_PREFIX}categories'
-        queryset = cache.get(cache_key)
-        
-        if queryset is None:
-            queryset = Category.objects.annotate(
-                products_count=Count('products', filter=Q(products__is_active=True))
-            )
-            cache.set(cache_key, queryset, CACHE_TTL)
-        
-        return queryset
+        """Categories with their active product counts"""
+        return Category.objects.annotate(
+            products_count=Count('products', filter=Q(products__is_active=True))
+        )
+
+    def list(self, request, *args, **kwargs):
+        """Category list, cached as serialized pages"""
+        cache_key = get_cache_key(
+            'categories', f'all:{slugify(str(request.query_params))}', tags=[CATEGORIES_TAG]
+        )
+
+        def load_categories():
+            return super(CategoryViewSet, self).list(request, *args, **kwargs).data
+
+        return Response(read_through(cache_key, load_categories))
 
     @action(detail=True, methods=['get'])
     def products(self, request, slug=None):
         """Get category products with caching"""
         category = self.get_object()
-        cache_key = get_cache_key('category_products', category.id)
-        cached_results = cache.get(cache_key)
-        
-        if cached_results:
-            return Response(cached_results)
-
-        products = Product.objects.filter(
-            category=category,
-            is_active=True
-        ).select_related('student', 'student__user').prefetch_related('reviews')
-
-        page = self.paginate_queryset(products)
-        if page is not None:
-            serializer = ProductListSerializer(page, many=True, context={'request': request})
-            response_data = self.get_paginated_response(serializer.data).data
-        else:
+        cache_key = get_cache_key(
+            'category_products',
+            f'{category.id}:{slugify(str(request.query_params))}',
+            tags=[PRODUCTS_TAG]
+        )
+
+        def load_products():
+            products = ProductListSerializer.setup_eager_loading(Product.objects.filter(
+                category=category,
+                is_active=True
+            ))
+
+            page = self.paginate_queryset(products)
+            if page is not None:
+                serializer = ProductListSerializer(page, many=True, context={'request': request})
+                return self.get_paginated_response(serializer.data).data
             serializer = ProductListSerializer(products, many=True, context={'request': request})
-            response_data = serializer.data
-        
-        cache.set(cache_key, response_data, CACHE_TTL)
-        return Response(response_data)
+            return serializer.data
+
+        return Response(overlay_wishlisted(read_through(cache_key, load_products), request))
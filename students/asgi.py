@@ -20,14 +20,18 @@ django.setup()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from django.core.asgi import get_asgi_application
+from marketplace.chat import ChatWriteBufferMiddleware  # noqa: E402 - imports models, so only after django.setup()
 from marketplace.routing import websocket_urlpatterns
+from products.sweeper import ReservationSweeperMiddleware  # noqa: E402 - imports models, so only after django.setup()
 
-application = ProtocolTypeRouter({
+# The sweeper releases expired stock reservations on the server's event loop;
+# queued chat messages are saved on lifespan shutdown
+application = ReservationSweeperMiddleware(ChatWriteBufferMiddleware(ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
     ),
-})
+})))
 # running using daphne: daphne -p 8000 students.asgi:application
@@ -0,0 +1,147 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset (cursor) mode.
+
+    Clients that send ``?pagination=cursor`` (or a ``cursor`` returned by a
+    previous page) get pages keyed on ``(created_at, id)`` or, for price
+    sorts, ``(price, id)``. Each page is a single indexed range scan with
+    no OFFSET and no COUNT(*), so deep pages cost the same as the first;
+    ``previous`` links carry a reverse cursor that scans back from the
+    first row of the page. Any other ordering falls back to regular
+    page-number pagination.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Leading ordering field -> keyset columns, tie-broken on the primary key
+    keyset_fields = {
+        'created_at': ('created_at', 'id'),
+        'price': ('price', 'id'),
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.keyset = None
+        if self.wants_cursor(request):
+            self.keyset = self.get_keyset(queryset)
+        if self.keyset is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        fields, descending = self.keyset
+        position, reverse = self.decode_cursor(request, queryset.model, fields)
+        # A reverse cursor walks back from the first row of the page it came
+        # from: scan in the opposite order, then flip the page back
+        scan_descending = descending != reverse
+        queryset = queryset.order_by(*[f'-{field}' if scan_descending else field for field in fields])
+        if position is not None:
+            queryset = queryset.filter(self.after(fields, position, scan_descending))
+
+        results = list(queryset[:self.page_size + 1])
+        more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if self.keyset is None:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.cursor_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if self.keyset is None:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.cursor_link(self.page[0], reverse=True)
+
+    def cursor_link(self, instance, reverse):
+        fields, _ = self.keyset
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(instance, fields, reverse))
+
+    def wants_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_query_param in request.query_params
+        )
+
+    def get_keyset(self, queryset):
+        """Return ``(fields, descending)`` for the queryset ordering, if supported"""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        if not ordering:
+            return None
+        leading = ordering[0]
+        if not isinstance(leading, str):
+            return None
+        descending = leading.startswith('-')
+        fields = self.keyset_fields.get(leading.lstrip('-'))
+        if fields is None:
+            return None
+        return fields, descending
+
+    def after(self, fields, position, descending):
+        """Rows strictly after ``position`` in keyset order"""
+        lookup = 'lt' if descending else 'gt'
+        (first, tie), (first_value, tie_value) = fields, position
+        return Q(**{f'{first}__{lookup}': first_value}) | Q(
+            **{first: first_value, f'{tie}__{lookup}': tie_value}
+        )
+
+    def encode_cursor(self, instance, fields, reverse=False):
+        cursor = {'position': [str(getattr(instance, field)) for field in fields], 'reverse': reverse}
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+    def decode_cursor(self, request, model, fields):
+        """``(position, reverse)`` from the request's cursor, ``(None, False)`` without one"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            values, reverse = cursor['position'], cursor.get('reverse') is True
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(fields, values)
+            ], reverse
+        except (TypeError, ValueError, KeyError, AttributeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class WishlistSellerPagination(PageNumberPagination):
+    """Pages of sellers in the wishlist-by-seller view"""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
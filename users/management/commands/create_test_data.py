@@ -8,6 +8,8 @@ from datetime import timedelta
 # Import models
 from users.models import UserProfile, Student
 from products.models import Category, Product, ProductVariant
+from products.search import get_search_backend
+from products.slugs import assign_unique_slugs
 from marketplace.models import Cart, CartItem, WishList, Review
 from orders.models import Order, OrderItem, ShippingAddress
 from payment.models import Transaction
@@ -404,27 +406,47 @@ class Command(BaseCommand):
             }
         ]
 
+        students = {
+            student.user_id: student
+            for student in Student.objects.filter(user__in=self.students)
+        }
+        existing = {
+            (product.title, product.student_id): product
+            for product in Product.objects.filter(
+                title__in=[product_data['title'] for product_data in products_data],
+                student__in=students.values(),
+            )
+        }
+
         self.products = []
+        new_products = []
         for product_data in products_data:
             # Get the student who owns this product
-            student_user = self.students[product_data['student_index']]
-            student_profile = Student.objects.get(user=student_user)
-
-            product, created = Product.objects.get_or_create(
-                title=product_data['title'],
-                student=student_profile,
-                defaults={
-                    'description': product_data['description'],
-                    'price': product_data['price'],
-                    'category': self.categories[product_data['category']],
-                    'condition': product_data['condition'],
-                    'stock': product_data['stock'],
-                    'featured': product_data['featured'],
-                    'created_at': timezone.now() - timedelta(days=random.randint(1, 30))
-                }
-            )
+            student_profile = students[self.students[product_data['student_index']].id]
+
+            product = existing.get((product_data['title'], student_profile.id))
+            if product is None:
+                product = Product(
+                    title=product_data['title'],
+                    student=student_profile,
+                    description=product_data['description'],
+                    price=product_data['price'],
+                    category=self.categories[product_data['category']],
+                    condition=product_data['condition'],
+                    stock=product_data['stock'],
+                    featured=product_data['featured'],
+                    created_at=timezone.now() - timedelta(days=random.randint(1, 30))
+                )
+                existing[(product.title, student_profile.id)] = product
+                new_products.append(product)
             self.products.append(product)
 
+        # One slug query and one INSERT for the whole batch
+        assign_unique_slugs(new_products)
+        Product.objects.bulk_create(new_products)
+        # bulk_create skips the save signals that keep search in step
+        get_search_backend().update_products(new_products)
+
         self.stdout.write(f'Created {len(self.products)} products')
 
     def create_product_variants(self):
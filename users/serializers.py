@@ -4,6 +4,7 @@ import pyotp
 from django.contrib.auth import get_user_model
 from .models import UserProfile, Student
 from django.contrib.auth import authenticate
+from django.contrib.auth.password_validation import validate_password
 CustomUser = get_user_model()
 
 